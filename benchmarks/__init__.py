@@ -0,0 +1,4 @@
+"""Performance benchmarks for the load, validation, serialization and rendering hot paths
+
+Run with ``python -m benchmarks`` from the repository root.
+"""
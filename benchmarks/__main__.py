@@ -0,0 +1,65 @@
+from __future__ import annotations
+import argparse
+import json
+import platform
+import sys
+from typing import List, Optional
+from .suite import run_scenario, compare
+from .synthetic import Scenario
+
+SCENARIOS = {
+    "small": Scenario(n_pedestrians=100, n_steps=200, n_obstacles=20, grid_size=50),
+    "medium": Scenario(n_pedestrians=2000, n_steps=500, n_obstacles=500, grid_size=200),
+    "large": Scenario(n_pedestrians=20000, n_steps=1000, n_obstacles=5000, grid_size=500),
+}
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks",
+                                     description="Time load, validation, serialization, hit-testing and drawing.")
+    parser.add_argument("--scenario", choices=sorted(SCENARIOS), nargs="+", default=["small", "medium"],
+                        help="Predefined run sizes")
+    parser.add_argument("--pedestrians", type=int, help="Benchmark a custom run with this many pedestrians")
+    parser.add_argument("--steps", type=int, default=200, help="Number of steps of the custom run")
+    parser.add_argument("--obstacles", type=int, default=100, help="Number of obstacles of the custom run")
+    parser.add_argument("--grid-size", type=int, default=100, help="Topography width and height of the custom run")
+    parser.add_argument("--repeat", type=int, default=5, help="Measurements per benchmark, the best one counts")
+    parser.add_argument("--output", default=None, help="Write the results to this JSON file")
+    parser.add_argument("--baseline", default=None, help="Compare against results written by an earlier run")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="Fail if a benchmark is slower than the baseline by more than this fraction")
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    if args.pedestrians is not None:
+        scenarios = [Scenario(args.pedestrians, args.steps, args.obstacles, args.grid_size)]
+    else:
+        scenarios = [SCENARIOS[name] for name in args.scenario]
+
+    results = {}
+    for scenario in scenarios:
+        for name, result in run_scenario(scenario, args.repeat).items():
+            results[name] = result
+            print("{:<60} {:>12.3f} ms".format(name, result["seconds"] * 1e3))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"python": platform.python_version(), "machine": platform.machine(), "results": results},
+                      f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.threshold)
+        for name, before, after in regressions:
+            print("REGRESSION {}: {:.3f} ms -> {:.3f} ms ({:+.0%})".format(name, before * 1e3, after * 1e3,
+                                                                          after / before - 1))
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
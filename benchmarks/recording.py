@@ -0,0 +1,70 @@
+from __future__ import annotations
+from typing import Any, Callable, List, Tuple
+from src.cms_visualizer.instrumentation import payload_size
+
+
+class RecordingLayer:
+    def __init__(self, canvas: RecordingCanvas) -> None:
+        """Stand-in for an ipycanvas Canvas that records drawing commands instead of sending them
+
+        Every method call and every property assignment counts as one command.
+
+        Args:
+            canvas (RecordingCanvas): Canvas the layer belongs to
+        """
+        object.__setattr__(self, "_canvas", canvas)
+
+    def __getattr__(self, name: str) -> Callable[..., None]:
+        if name.startswith("_"):
+            raise AttributeError(name)
+
+        def command(*args, **kwargs) -> None:
+            self._canvas.record(name, args + tuple(kwargs.values()))
+        return command
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        self._canvas.record(name, (value,))
+
+
+class RecordingCanvas:
+    def __init__(self, n_layers: int, width: int, height: int) -> None:
+        """Stand-in for an ipycanvas MultiCanvas, so drawing can be benchmarked without a browser
+
+        Args:
+            n_layers (int): Number of layers
+            width (int): Width in pixels
+            height (int): Height in pixels
+        """
+        self.width = width
+        self.height = height
+        self.layers = [RecordingLayer(self) for _ in range(n_layers)]
+        self.commands: List[Tuple[str, int]] = []
+
+    def __getitem__(self, key: int) -> RecordingLayer:
+        return self.layers[key]
+
+    def record(self, name: str, args: tuple) -> None:
+        """Record a command and the size of its arguments in bytes"""
+        self.commands.append((name, payload_size(args)))
+
+    def reset(self) -> None:
+        """Forget the recorded commands"""
+        self.commands.clear()
+
+    @property
+    def n_bytes(self) -> int:
+        """Total size of the recorded command arguments"""
+        return sum(size for _, size in self.commands)
+
+    def on_mouse_down(self, callback: Callable[[float, float], None]) -> None:
+        self.mouse_down_callback = callback
+
+    def offscreen_canvas(self, width: int, height: int) -> RecordingLayer:
+        """Undisplayed canvas whose commands are recorded with those of this canvas"""
+        return RecordingLayer(self)
+
+    def clear(self) -> None:
+        self.record("clear", ())
+
+    def to_file(self, filename: str) -> None:
+        pass
@@ -0,0 +1,131 @@
+from __future__ import annotations
+import os
+import tempfile
+import timeit
+from typing import Any, Callable, Dict, List, Tuple
+import numpy as np
+from src.cms_visualizer.simulation import Simulation
+from src.cms_visualizer.topography import Topography
+from src.cms_visualizer.visualization import Visualizer
+from .recording import RecordingCanvas
+from .synthetic import Scenario, topography_dict, positions, simulation
+
+# Pixels per grid cell of the benchmarked canvas
+CELL_PIXELS = 4
+
+Results = Dict[str, Dict[str, float]]
+
+
+def measure(fn: Callable[[], Any], repeat: int = 5) -> float:
+    """Best time of a call in seconds
+
+    The number of calls per measurement is chosen so a measurement takes at least 0.2s,
+    the best of `repeat` measurements is reported.
+
+    Args:
+        fn (Callable[[], Any]): Function to time
+        repeat (int): Number of measurements
+
+    Returns:
+        float: Seconds per call
+    """
+    timer = timeit.Timer(fn)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+
+class _Cycle:
+    def __init__(self, n: int) -> None:
+        self.n = n
+        self.i = -1
+
+    def __call__(self) -> int:
+        self.i = (self.i + 1) % self.n
+        return self.i
+
+
+def run_scenario(scenario: Scenario, repeat: int = 5) -> Results:
+    """Time all hot paths on one synthetic run
+
+    Args:
+        scenario (Scenario): Size of the run
+        repeat (int): Number of measurements per benchmark
+
+    Returns:
+        Results: Seconds per call and extra metrics per benchmark, keyed by "benchmark[scenario]"
+    """
+    results: Results = {}
+
+    def record(name: str, seconds: float, **metrics: float) -> None:
+        results["{}[{}]".format(name, scenario.name)] = dict(seconds=seconds, **metrics)
+
+    d = topography_dict(scenario)
+    record("topography_from_dict", measure(lambda: Topography.from_dict(d), repeat))
+
+    sim = simulation(scenario)
+    steps = positions(scenario)
+    record("add_simulation_steps",
+           measure(lambda: Simulation(sim.topography, sim.pedestrians, scenario.n_steps, []).add_simulation_steps(steps),
+                   repeat))
+    step = dict(sim.simulation_steps[0])
+    record("is_valid_simulation_step", measure(lambda: sim._is_valid_simulation_step(step), repeat))
+
+    with tempfile.TemporaryDirectory() as directory:
+        json_path = os.path.join(directory, "simulation.json")
+        binary_path = os.path.join(directory, "simulation.bin")
+        record("to_json", measure(lambda: sim.to_json(json_path), repeat))
+        record("to_binary", measure(lambda: sim.to_binary(binary_path), repeat))
+        record("from_json", measure(lambda: Simulation.from_json(json_path), repeat),
+               bytes=os.path.getsize(json_path))
+        record("from_binary", measure(lambda: Simulation.from_binary(binary_path), repeat),
+               bytes=os.path.getsize(binary_path))
+
+    size = scenario.grid_size * CELL_PIXELS
+    canvas = RecordingCanvas(Visualizer.N_LAYERS, size, size)
+    visualizer = Visualizer(sim, CELL_PIXELS, CELL_PIXELS, size, size, canvas=canvas)
+    visualizer.show_trajectories = True
+    next_step = _Cycle(scenario.n_steps)
+    canvas.reset()
+    seconds = measure(lambda: visualizer.render(next_step()), repeat)
+    canvas.reset()
+    n_frames = min(scenario.n_steps, 10)
+    for i in range(n_frames):
+        visualizer.render(i)
+    record("render", seconds, commands_per_frame=len(canvas.commands) / n_frames,
+           bytes_per_frame=canvas.n_bytes / n_frames)
+
+    rng = np.random.default_rng(scenario.seed)
+    clicks = rng.uniform(0, size, (1024, 2))
+    next_click = _Cycle(len(clicks))
+
+    def click() -> None:
+        visualizer.handle_mouse_down(*clicks[next_click()])
+
+    visualizer.render(0)
+    record("hit_test", measure(click, repeat))
+
+    def cold_click() -> None:
+        visualizer._hit_indices.clear()
+        click()
+
+    record("hit_test_cold", measure(cold_click, repeat))
+    return results
+
+
+def compare(results: Results, baseline: Results, threshold: float) -> List[Tuple[str, float, float]]:
+    """Benchmarks that got slower than the baseline by more than the threshold
+
+    Args:
+        results (Results): Current results
+        baseline (Results): Baseline results, benchmarks missing in either are ignored
+        threshold (float): Allowed relative slowdown, e.g. 0.25 for 25%
+
+    Returns:
+        List[Tuple[str, float, float]]: Name, baseline seconds and current seconds of every regression
+    """
+    regressions = []
+    for name in sorted(results.keys() & baseline.keys()):
+        before, after = baseline[name]["seconds"], results[name]["seconds"]
+        if after > before * (1 + threshold):
+            regressions.append((name, before, after))
+    return regressions
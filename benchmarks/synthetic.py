@@ -0,0 +1,91 @@
+from __future__ import annotations
+from dataclasses import dataclass
+from typing import Any, Dict
+import numpy as np
+from src.cms_visualizer.simulation import Simulation, Pedestrian
+from src.cms_visualizer.topography import Topography
+
+
+@dataclass(frozen=True)
+class Scenario:
+    """Size of a synthetic run
+
+    Attributes:
+        n_pedestrians (int): Number of pedestrians
+        n_steps (int): Number of simulation steps
+        n_obstacles (int): Number of obstacles
+        grid_size (int): Width and height of the topography in cells
+        seed (int): Seed of the random generator
+    """
+    n_pedestrians: int
+    n_steps: int
+    n_obstacles: int
+    grid_size: int
+    seed: int = 0
+
+    @property
+    def name(self) -> str:
+        return "p={}_s={}_o={}_g={}".format(self.n_pedestrians, self.n_steps, self.n_obstacles, self.grid_size)
+
+
+def _rectangles(rng: np.random.Generator, n: int, grid_size: int, first_id: int) -> list:
+    size = rng.integers(1, max(2, grid_size // 20), (n, 2))
+    corner = rng.integers(0, grid_size - size - 1)
+    return [{"type": "RECTANGULAR", "id": first_id + i, "x": int(x), "y": int(y), "width": int(w), "height": int(h)}
+            for i, ((x, y), (w, h)) in enumerate(zip(corner.tolist(), size.tolist()))]
+
+
+def topography_dict(scenario: Scenario) -> Dict[str, Any]:
+    """Dictionary representation of a topography with one source, one target and random obstacles
+
+    Args:
+        scenario (Scenario): Size of the run
+
+    Returns:
+        Dict[str, Any]: Topography in the format read by Topography.from_dict
+    """
+    rng = np.random.default_rng(scenario.seed)
+    g = scenario.grid_size
+    return {
+        "width": g,
+        "height": g,
+        "sources": [{"type": "RECTANGULAR", "id": 0, "x": 0, "y": 0, "width": 1, "height": g - 1}],
+        "targets": [{"type": "RECTANGULAR", "id": 1, "x": g - 2, "y": 0, "width": 1, "height": g - 1}],
+        "obstacles": _rectangles(rng, scenario.n_obstacles, g, 2),
+    }
+
+
+def positions(scenario: Scenario) -> np.ndarray:
+    """Random walks of all pedestrians that stay inside the topography
+
+    Args:
+        scenario (Scenario): Size of the run
+
+    Returns:
+        np.ndarray: Positions of shape (n_steps, n_pedestrians, 2)
+    """
+    rng = np.random.default_rng(scenario.seed)
+    start = rng.integers(0, scenario.grid_size, (1, scenario.n_pedestrians, 2))
+    moves = rng.integers(-1, 2, (scenario.n_steps, scenario.n_pedestrians, 2))
+    moves[0] = 0
+    walk = start + np.cumsum(moves, axis=0)
+    # Reflect at the borders
+    period = 2 * (scenario.grid_size - 1)
+    walk = np.abs((walk + period) % period - (scenario.grid_size - 1))
+    return (scenario.grid_size - 1 - walk).astype(np.int32)
+
+
+def simulation(scenario: Scenario) -> Simulation:
+    """Complete synthetic run
+
+    Args:
+        scenario (Scenario): Size of the run
+
+    Returns:
+        Simulation: Simulation with all steps added
+    """
+    topography = Topography.from_dict(topography_dict(scenario))
+    pedestrians = [Pedestrian(i, 1, None) for i in range(scenario.n_pedestrians)]
+    sim = Simulation(topography, pedestrians, scenario.n_steps, [])
+    sim.add_simulation_steps(positions(scenario))
+    return sim
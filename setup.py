@@ -8,9 +8,12 @@ setup(
     package_dir={'': 'src'},
     packages=find_packages(where='src'),
     install_requires=[
-        'ipycanvas',
+        'ipycanvas>=0.13',
         'numpy'
     ],
+    entry_points={
+        'console_scripts': ['cms-visualizer=cms_visualizer.cli:main'],
+    },
     extras_require={
         'test': ['coverage'],
     },
@@ -1 +1,19 @@
-from . import simulation, topography, visualization
+from importlib import import_module
+from . import simulation, topography
+
+# The widget layer needs ipycanvas, ipywidgets and IPython. It is only imported on first
+# access, so headless jobs that use the model, IO and analysis modules start without it.
+_LAZY_MODULES = {'visualization'}
+_LAZY_ATTRIBUTES = {'Visualizer': 'visualization', 'ComparisonVisualizer': 'visualization'}
+
+
+def __getattr__(name: str):
+    if name in _LAZY_MODULES:
+        return import_module('.' + name, __name__)
+    if name in _LAZY_ATTRIBUTES:
+        return getattr(import_module('.' + _LAZY_ATTRIBUTES[name], __name__), name)
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+
+
+def __dir__():
+    return sorted(set(globals()) | _LAZY_MODULES | set(_LAZY_ATTRIBUTES))
@@ -0,0 +1,245 @@
+from __future__ import annotations
+import tempfile
+from typing import List, Optional, Tuple
+import numpy as np
+from .simulation import Simulation
+
+# Default size of the part of the cumulative visit table kept in memory, in bytes
+DEFAULT_MEMORY_BUDGET = 256 << 20
+
+
+class SimulationAggregates:
+    def __init__(self, simulation: Simulation, memory_budget: int = DEFAULT_MEMORY_BUDGET,
+                 block_steps: int = 1024) -> None:
+        """Cell visit counts and source/target flows of a run, for arbitrary step ranges
+
+        The run is read once, block by block, into cumulative-sum tables: the number of
+        visits per topography cell and the number of pedestrians entering and leaving every
+        source and target, up to every step. A range of steps is then the difference of two
+        table rows, so a query costs O(cells) or O(objects) instead of O(steps x pedestrians).
+        The visit table is kept in segments of ``segment_steps`` rows; segments beyond
+        ``memory_budget`` are written to temporary files and memory-mapped, so a query reads
+        two rows from them. Steps loaded into the run later are added with update.
+
+        A pedestrian visits the cell its position falls into and is inside an object while
+        it visits one of the object's cells, see Topography.label_raster. Absent pedestrians
+        of sparse runs visit nothing, so appearing in or disappearing from an object counts
+        as entering or leaving it.
+
+        Args:
+            simulation (Simulation): Simulation to aggregate, only the steps loaded so far are used
+            memory_budget (int): Maximum size of the visit table segments kept in memory, in bytes
+            block_steps (int): Maximum number of steps read at once
+        """
+        self.simulation = simulation
+        self.trajectories = simulation.trajectories
+        self.memory_budget = memory_budget
+        self.block_steps = block_steps
+        topography = simulation.topography
+        self.shape = (int(np.ceil(topography.height)), int(np.ceil(topography.width)))
+        n_steps = len(self.trajectories)
+        self.dtype = np.dtype(np.uint32 if n_steps * self.trajectories.n_pedestrians < 2 ** 32 else np.int64)
+        n_cells = self.shape[0] * self.shape[1]
+        # A segment takes at most a quarter of the budget, so a few of them stay in memory
+        self.segment_steps = int(min(max(memory_budget // (4 * max(n_cells, 1) * 8), 1), block_steps))
+        self._labels = topography.label_raster()
+        # Sources and targets, in the order of the flow arrays
+        self.object_ids = np.concatenate([topography.sources.ids, topography.targets.ids])
+        self._object_order = np.argsort(self.object_ids)
+
+        self.n_steps = 0
+        # Row r of the visit table, the visits in the steps [0, r), is row r % segment_steps of segment
+        # r // segment_steps
+        self._segments: List[np.ndarray] = []
+        self._add_segment()
+        self._inflow = np.zeros((1, len(self.object_ids)), dtype=np.int64)
+        self._outflow = np.zeros((1, len(self.object_ids)), dtype=np.int64)
+        # Object of every pedestrian at the last aggregated step
+        self._last_objects: Optional[np.ndarray] = None
+        self.update()
+
+    def update(self) -> int:
+        """Aggregate the steps added to the simulation since the last update
+
+        Only the new steps are read.
+
+        Returns:
+            int: Number of new steps
+        """
+        start = self.n_steps
+        stop = len(self.trajectories)
+        if stop <= start:
+            return 0
+        if self.dtype == np.uint32 and stop * self.trajectories.n_pedestrians >= 2 ** 32:
+            self.dtype = np.dtype(np.int64)
+            self._segments = [self._converted(segment) for segment in self._segments]
+        self._grow(stop)
+        # Blocks end at segment boundaries, so each one is written into a single segment
+        block_start = start
+        while block_start < stop:
+            block_stop = min(block_start + self.segment_steps - block_start % self.segment_steps, stop)
+            cells = self._cells(block_start, block_stop)
+            self._add_visits(block_start, cells)
+            self._add_flows(block_start, cells)
+            block_start = block_stop
+        self.n_steps = stop
+        return stop - start
+
+    def _new_segment(self, in_memory: bool) -> np.ndarray:
+        shape = (self.segment_steps, self.shape[0] * self.shape[1])
+        if in_memory:
+            return np.zeros(shape, dtype=self.dtype)
+        with tempfile.TemporaryFile() as f:
+            # The map stays valid after the file is closed, and the file is removed with the map
+            return np.memmap(f, dtype=self.dtype, mode='w+', shape=shape)
+
+    def _add_segment(self) -> None:
+        # In memory while the budget allows, memory-mapped from a temporary file after that
+        in_memory = sum(not isinstance(segment, np.memmap) for segment in self._segments) + 1
+        segment_nbytes = self.segment_steps * self.shape[0] * self.shape[1] * self.dtype.itemsize
+        self._segments.append(self._new_segment(in_memory * segment_nbytes <= self.memory_budget))
+
+    def _converted(self, segment: np.ndarray) -> np.ndarray:
+        # Copy of a segment in the current dtype, kept where the segment was
+        converted = self._new_segment(not isinstance(segment, np.memmap))
+        converted[:] = segment
+        return converted
+
+    def _row(self, step: int) -> np.ndarray:
+        # Visits in the steps [0, step)
+        return self._segments[step // self.segment_steps][step % self.segment_steps]
+
+    def _grow(self, n_steps: int) -> None:
+        # The visit table needs rows up to n_steps, the flow tables double their capacity like the trajectory stores
+        while n_steps >= len(self._segments) * self.segment_steps:
+            self._add_segment()
+        if n_steps + 1 > self._inflow.shape[0]:
+            capacity = max(n_steps + 1, 2 * self._inflow.shape[0])
+            self._inflow = _grown(self._inflow, capacity)
+            self._outflow = _grown(self._outflow, capacity)
+
+    def _cells(self, start: int, stop: int) -> np.ndarray:
+        # Flat cell index per pedestrian and step, -1 outside the topography and for absent pedestrians
+        positions = self.trajectories.get_steps(start, stop)
+        x = np.floor(positions[..., 0]).astype(np.int64)
+        y = np.floor(positions[..., 1]).astype(np.int64)
+        inside = (x >= 0) & (x < self.shape[1]) & (y >= 0) & (y < self.shape[0])
+        if self.trajectories.sparse:
+            inside &= self.trajectories.presence(start, stop)
+        return np.where(inside, y * self.shape[1] + x, -1)
+
+    def _objects(self, cells: np.ndarray) -> np.ndarray:
+        # Index into object_ids of the source or target at each cell, -1 for none
+        labels = np.where(cells >= 0, self._labels.reshape(-1)[np.maximum(cells, 0)], -1)
+        if not len(self.object_ids):
+            return np.full(cells.shape, -1, dtype=np.int64)
+        sorted_ids = self.object_ids[self._object_order]
+        position = np.minimum(np.searchsorted(sorted_ids, labels), len(sorted_ids) - 1)
+        return np.where(sorted_ids[position] == labels, self._object_order[position], -1)
+
+    def _add_visits(self, start: int, cells: np.ndarray) -> None:
+        # Visits per step of the block, accumulated into the rows after it. The block lies within one
+        # segment, but its last row may be the first one of the next segment.
+        k = cells.shape[0]
+        n_cells = self.shape[0] * self.shape[1]
+        steps = np.repeat(np.arange(k), cells.shape[1])
+        flat = cells.reshape(-1)
+        inside = flat >= 0
+        counts = np.bincount(steps[inside] * n_cells + flat[inside], minlength=k * n_cells).reshape(k, n_cells)
+        counts = np.cumsum(counts, axis=0) + self._row(start)
+        segment = self._segments[start // self.segment_steps]
+        first = start % self.segment_steps + 1
+        last = min(first + k, self.segment_steps)
+        segment[first:last] = counts[:last - first]
+        if last - first < k:
+            self._row(start + k)[:] = counts[-1]
+
+    def _add_flows(self, start: int, cells: np.ndarray) -> None:
+        # Object transitions between consecutive steps; the first step of the run has no predecessor
+        k = cells.shape[0]
+        objects = self._objects(cells)
+        previous = self._last_objects
+        before = np.concatenate([objects[:1] if previous is None else previous[np.newaxis], objects[:-1]])
+        n_objects = len(self.object_ids)
+        steps = np.broadcast_to(np.arange(k)[:, np.newaxis], objects.shape)
+        entering = (objects != before) & (objects >= 0)
+        leaving = (objects != before) & (before >= 0)
+        inflow = np.bincount(steps[entering] * n_objects + objects[entering], minlength=k * n_objects)
+        outflow = np.bincount(steps[leaving] * n_objects + before[leaving], minlength=k * n_objects)
+        self._inflow[start + 1:start + k + 1] = self._inflow[start] + np.cumsum(inflow.reshape(k, n_objects), axis=0)
+        self._outflow[start + 1:start + k + 1] = self._outflow[start] + np.cumsum(outflow.reshape(k, n_objects), axis=0)
+        self._last_objects = objects[-1]
+
+    def _range(self, start: int, stop: Optional[int]) -> Tuple[int, int]:
+        stop = self.n_steps if stop is None else min(stop, self.n_steps)
+        start = min(max(start, 0), stop)
+        return start, stop
+
+    def visits(self, start: int = 0, stop: Optional[int] = None) -> np.ndarray:
+        """Number of pedestrians per cell summed over the steps [start, stop)
+
+        Args:
+            start (int): First step
+            stop (Optional[int]): Step after the last one, defaults to all aggregated steps
+
+        Returns:
+            np.ndarray: Counts of shape (height, width) indexed by [y, x]
+        """
+        start, stop = self._range(start, stop)
+        return (self._row(stop).astype(np.int64) - self._row(start)).reshape(self.shape)
+
+    def density(self, start: int = 0, stop: Optional[int] = None) -> np.ndarray:
+        """Mean number of pedestrians per cell over the steps [start, stop)
+
+        Args:
+            start (int): First step
+            stop (Optional[int]): Step after the last one, defaults to all aggregated steps
+
+        Returns:
+            np.ndarray: Densities of shape (height, width), zero for an empty range
+        """
+        start, stop = self._range(start, stop)
+        return self.visits(start, stop) / max(stop - start, 1)
+
+    def inflow(self, start: int = 0, stop: Optional[int] = None) -> np.ndarray:
+        """Number of pedestrians entering each source and target during the steps [start, stop)
+
+        A pedestrian enters an object at the first step it is inside of it. Pedestrians
+        already inside at the first step of the run are not counted.
+
+        Args:
+            start (int): First step
+            stop (Optional[int]): Step after the last one, defaults to all aggregated steps
+
+        Returns:
+            np.ndarray: Count per object, in the order of object_ids
+        """
+        start, stop = self._range(start, stop)
+        return self._inflow[stop] - self._inflow[start]
+
+    def outflow(self, start: int = 0, stop: Optional[int] = None) -> np.ndarray:
+        """Number of pedestrians leaving each source and target during the steps [start, stop)
+
+        A pedestrian leaves an object at the first step it is no longer inside of it.
+
+        Args:
+            start (int): First step
+            stop (Optional[int]): Step after the last one, defaults to all aggregated steps
+
+        Returns:
+            np.ndarray: Count per object, in the order of object_ids
+        """
+        start, stop = self._range(start, stop)
+        return self._outflow[stop] - self._outflow[start]
+
+    @property
+    def nbytes(self) -> int:
+        """Memory taken by the cumulative tables, without the segments written to temporary files"""
+        in_memory = sum(segment.nbytes for segment in self._segments if not isinstance(segment, np.memmap))
+        return in_memory + self._inflow.nbytes + self._outflow.nbytes
+
+
+def _grown(table: np.ndarray, capacity: int) -> np.ndarray:
+    grown = np.zeros((capacity, table.shape[1]), dtype=table.dtype)
+    grown[:len(table)] = table
+    return grown
@@ -0,0 +1,230 @@
+from __future__ import annotations
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Tuple
+import numpy as np
+from .simulation import Simulation
+
+# Kinds of violations
+PEDESTRIAN_OVERLAP = 0
+OBSTACLE_PENETRATION = 1
+
+# One row per violation. ``other`` is the id of the second pedestrian for overlaps and the
+# id of the obstacle for penetrations, ``depth`` how far the shapes reach into each other.
+VIOLATION_DTYPE = np.dtype([
+    ('step', np.int64),
+    ('kind', np.int8),
+    ('pedestrian', np.int64),
+    ('other', np.int64),
+    ('depth', np.float32),
+])
+
+# The half of the 3x3 cell neighbourhood that finds every pair of neighbouring cells once
+_HALF_STENCIL = ((0, 0), (1, -1), (1, 0), (1, 1), (0, 1))
+
+
+def _neighbour_pairs(keys: np.ndarray, offsets: List[int]) -> Tuple[np.ndarray, np.ndarray]:
+    # All pairs (i, j) with keys[j] == keys[i] + offset for one of the offsets, i < j for offset 0
+    order = np.argsort(keys, kind='stable')
+    sorted_keys = keys[order]
+    pairs_i, pairs_j = [], []
+    for offset in offsets:
+        lo = np.searchsorted(sorted_keys, keys + offset, 'left')
+        hi = np.searchsorted(sorted_keys, keys + offset, 'right')
+        counts = hi - lo
+        i = np.repeat(np.arange(len(keys)), counts)
+        within = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        j = order[np.repeat(lo, counts) + within]
+        if offset == 0:
+            i, j = i[i < j], j[i < j]
+        pairs_i.append(i)
+        pairs_j.append(j)
+    return np.concatenate(pairs_i), np.concatenate(pairs_j)
+
+
+def _overlap_depth(first_min: np.ndarray, first_size: np.ndarray,
+                   second_min: np.ndarray, second_size: np.ndarray) -> np.ndarray:
+    # Depth of the overlap of the boxes [min, min + size) along both axes: the smaller of the
+    # two overlapping extents, zero or less where the boxes are apart or only touch
+    extent = (np.minimum(first_min + first_size, second_min + second_size) -
+              np.maximum(first_min, second_min))
+    return extent.min(axis=-1)
+
+
+def pedestrian_overlaps(positions: np.ndarray, radius: np.ndarray,
+                        present: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Overlapping pedestrians in a block of steps
+
+    A pedestrian covers the square [x, x + r) x [y, y + r) of its position and radius, the
+    block of cells the renderer draws for it, see SceneGeometry.pedestrians. Every position
+    is hashed into a grid of cells as large as the largest radius, so only pedestrians in
+    neighbouring cells of the same step are compared and the cost grows linearly with the
+    number of pedestrians for a bounded density.
+
+    Args:
+        positions (np.ndarray): Positions of shape (n_steps, n_pedestrians, 2)
+        radius (np.ndarray): Radius per pedestrian
+        present (Optional[np.ndarray]): Presence of shape (n_steps, n_pedestrians), absent
+            pedestrians are skipped. All pedestrians are present by default.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]: Step, both pedestrian columns (the first one
+        smaller) and overlap depth of every overlapping pair
+    """
+    n_steps, n_pedestrians = positions.shape[:2]
+    empty = np.empty(0, dtype=np.int64)
+    cell = float(radius.max(initial=0))
+    # Index of every compared point in the flattened (n_steps * n_pedestrians) positions
+    flat = np.arange(n_steps * n_pedestrians) if present is None else np.flatnonzero(present.reshape(-1))
+    if len(flat) < 2 or cell <= 0:
+        return empty, empty, empty, np.empty(0)
+    points = positions.reshape(-1, 2)[flat].astype(np.float64)
+    cells = np.floor(points / cell).astype(np.int64)
+    cells -= cells.min(axis=0)
+    # Padding on every side keeps the neighbours of a cell inside the same step
+    n_rows = int(cells[:, 1].max()) + 3
+    n_columns = int(cells[:, 0].max()) + 2
+    steps = flat // n_pedestrians
+    keys = (steps * n_columns + cells[:, 0]) * n_rows + cells[:, 1] + 1
+    i, j = _neighbour_pairs(keys, [dx * n_rows + dy for dx, dy in _HALF_STENCIL])
+    columns_i, columns_j = flat[i] % n_pedestrians, flat[j] % n_pedestrians
+    depth = _overlap_depth(points[i], radius[columns_i, None], points[j], radius[columns_j, None])
+    hit = depth > 0
+    first = np.minimum(columns_i, columns_j)[hit]
+    second = np.maximum(columns_i, columns_j)[hit]
+    return steps[i[hit]], first, second, depth[hit]
+
+
+def obstacle_penetrations(positions: np.ndarray, radius: np.ndarray, labels: np.ndarray, blocked: np.ndarray,
+                          present: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Pedestrians reaching into obstacles in a block of steps
+
+    A pedestrian covers the same square [x, x + r) x [y, y + r) as in pedestrian_overlaps.
+    Every cell the square can reach is looked up in the obstacle raster of the topography,
+    so the cost grows linearly with the number of pedestrians and does not depend on the
+    number of obstacles. The depth is that of the deepest overlapped cell of an obstacle.
+
+    Args:
+        positions (np.ndarray): Positions of shape (n_steps, n_pedestrians, 2)
+        radius (np.ndarray): Radius per pedestrian
+        labels (np.ndarray): Object id per cell, see Topography.label_raster
+        blocked (np.ndarray): True for cells covered by an obstacle
+        present (Optional[np.ndarray]): Presence of shape (n_steps, n_pedestrians), absent
+            pedestrians are skipped. All pedestrians are present by default.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]: Step, pedestrian column, obstacle id
+        and penetration depth, one row per pedestrian and obstacle
+    """
+    n_steps, n_pedestrians = positions.shape[:2]
+    points = positions.reshape(-1, 2).astype(np.float64)
+    point_radius = np.tile(radius, n_steps).astype(np.float64)
+    base = np.floor(points).astype(np.int64)
+    reach = int(np.ceil(radius.max(initial=0)))
+    checked = np.ones(len(points), dtype=bool) if present is None else present.reshape(-1)
+    found = []
+    for dx in range(reach + 1):
+        for dy in range(reach + 1):
+            x, y = base[:, 0] + dx, base[:, 1] + dy
+            inside = checked & (x >= 0) & (x < blocked.shape[1]) & (y >= 0) & (y < blocked.shape[0])
+            candidates = np.flatnonzero(inside)
+            candidates = candidates[blocked[y[candidates], x[candidates]]]
+            cx, cy = x[candidates], y[candidates]
+            # Overlap of the pedestrian's square with the cell [x, x + 1) x [y, y + 1)
+            depth = _overlap_depth(points[candidates], point_radius[candidates, None],
+                                   np.stack([cx, cy], axis=1), 1)
+            hit = depth > 0
+            found.append((candidates[hit], labels[cy[hit], cx[hit]], depth[hit]))
+    points_hit = np.concatenate([f[0] for f in found])
+    obstacles = np.concatenate([f[1] for f in found]).astype(np.int64)
+    depth = np.concatenate([f[2] for f in found])
+    # One row per pedestrian and obstacle, with the deepest penetration
+    order = np.lexsort((-depth, obstacles, points_hit))
+    points_hit, obstacles, depth = points_hit[order], obstacles[order], depth[order]
+    first = np.ones(len(points_hit), dtype=bool)
+    first[1:] = (points_hit[1:] != points_hit[:-1]) | (obstacles[1:] != obstacles[:-1])
+    points_hit, obstacles, depth = points_hit[first], obstacles[first], depth[first]
+    return points_hit // n_pedestrians, points_hit % n_pedestrians, obstacles, depth
+
+
+def _table(start: int, ids: np.ndarray, overlaps, penetrations) -> np.ndarray:
+    n = len(overlaps[0])
+    table = np.empty(n + len(penetrations[0]), dtype=VIOLATION_DTYPE)
+    steps, first, second, depth = overlaps
+    table['step'][:n] = steps + start
+    table['kind'][:n] = PEDESTRIAN_OVERLAP
+    table['pedestrian'][:n] = ids[first]
+    table['other'][:n] = ids[second]
+    table['depth'][:n] = depth
+    steps, columns, obstacles, depth = penetrations
+    table['step'][n:] = steps + start
+    table['kind'][n:] = OBSTACLE_PENETRATION
+    table['pedestrian'][n:] = ids[columns]
+    table['other'][n:] = obstacles
+    table['depth'][n:] = depth
+    return table
+
+
+_worker_state: Optional[Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]] = None
+
+
+def _init_worker(ids: np.ndarray, radius: np.ndarray, labels: np.ndarray, blocked: np.ndarray) -> None:
+    global _worker_state
+    _worker_state = (ids, radius, labels, blocked)
+
+
+def _scan(start: int, positions: np.ndarray, present: Optional[np.ndarray] = None) -> np.ndarray:
+    ids, radius, labels, blocked = _worker_state
+    return _table(start, ids, pedestrian_overlaps(positions, radius, present),
+                  obstacle_penetrations(positions, radius, labels, blocked, present))
+
+
+def find_violations(simulation: Simulation, start: int = 0, stop: Optional[int] = None,
+                    jobs: int = 1, chunk_steps: int = 256) -> np.ndarray:
+    """Scan a run for overlapping pedestrians and pedestrians inside obstacles
+
+    A pedestrian covers the square [x, x + r) x [y, y + r) of its position and radius, the
+    block of cells it is drawn as. Squares that only touch each other or an obstacle are
+    no violation. The steps are split into contiguous ranges that are scanned by a pool of worker processes, each range in
+    a few vectorized passes.
+
+    Args:
+        simulation (Simulation): Simulation to scan
+        start (int): First step
+        stop (Optional[int]): Step after the last one, defaults to all loaded steps
+        jobs (int): Number of worker processes, 1 scans in the calling process
+        chunk_steps (int): Number of consecutive steps scanned by one task
+
+    Returns:
+        np.ndarray: Structured array of VIOLATION_DTYPE sorted by step, kind and pedestrian
+    """
+    trajectories = simulation.trajectories
+    stop = len(trajectories) if stop is None else min(stop, len(trajectories))
+    radius = np.zeros(trajectories.n_pedestrians)
+    columns = trajectories.columns_of([p.id for p in simulation.pedestrians])
+    radius[columns[columns >= 0]] = [p.radius for p, c in zip(simulation.pedestrians, columns) if c >= 0]
+    topography = simulation.topography
+    state = (trajectories.ids, radius, topography.label_raster(), topography.blocked_raster())
+    starts = range(start, stop, chunk_steps)
+
+    def block(s: int) -> Tuple[int, np.ndarray, Optional[np.ndarray]]:
+        # Absent pedestrians of sparse runs are skipped
+        e = min(s + chunk_steps, stop)
+        return s, trajectories.get_steps(s, e), trajectories.presence(s, e) if trajectories.sparse else None
+
+    tables = []
+    if jobs <= 1:
+        _init_worker(*state)
+        for s in starts:
+            tables.append(_scan(*block(s)))
+    else:
+        with ProcessPoolExecutor(jobs, initializer=_init_worker, initargs=state) as executor:
+            # Only a few blocks are read ahead, so runs larger than memory can be scanned
+            pending = deque()
+            for s in starts:
+                pending.append(executor.submit(_scan, *block(s)))
+                if len(pending) >= 2 * jobs:
+                    tables.append(pending.popleft().result())
+            tables.extend(future.result() for future in pending)
+    table = np.concatenate(tables) if tables else np.empty(0, dtype=VIOLATION_DTYPE)
+    return table[np.lexsort((table['other'], table['pedestrian'], table['kind'], table['step']))]
@@ -0,0 +1,217 @@
+from __future__ import annotations
+import json
+import struct
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import numpy as np
+from .topography import Topography
+from .trajectory import TrajectorySource, TrajectoryStore
+from .codec import DeltaTrajectoryStore
+from .sparse import SparseTrajectoryStore
+from .chunked import ChunkedTrajectorySource, DEFAULT_MEMORY_BUDGET
+from .simulation import Simulation, Pedestrian, SimulationReconstructionException
+
+MAGIC = b"CMSVSIM\0"
+# Version 2 added delta-encoded positions, version 3 sparse positions, version 4 escaped deltas;
+# older files are still read
+VERSION = 4
+SUPPORTED_VERSIONS = (1, 2, 3, 4)
+# magic, version, length of the JSON header
+PREAMBLE = struct.Struct("<8sIQ")
+# The position block starts at a multiple of this many bytes
+ALIGNMENT = 64
+# Number of steps written at once
+WRITE_BLOCK_STEPS = 1024
+
+
+def _aligned(offset: int) -> int:
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+# Name, dtype, shape and a function returning the rows [start, stop) of an array that is written
+Block = Tuple[str, np.dtype, Tuple[int, ...], Callable[[int, int], np.ndarray]]
+
+
+def _array_blocks(layout: Dict[str, Any], arrays: List[Tuple[str, np.ndarray]]) -> Tuple[Dict[str, Any], List[Block]]:
+    # Arrays written one after another, each aligned, with their offsets relative to the first one
+    blocks: List[Block] = []
+    offset = 0
+    for name, array in arrays:
+        dtype = array.dtype.newbyteorder('<')
+        blocks.append((name, dtype, array.shape, lambda start, stop, array=array: array[start:stop]))
+        layout[name] = {"dtype": dtype.str, "shape": list(array.shape), "offset": offset}
+        offset = _aligned(offset + array.size * dtype.itemsize)
+    return layout, blocks
+
+
+def _sparse(trajectories: TrajectorySource) -> SparseTrajectoryStore:
+    if isinstance(trajectories, SparseTrajectoryStore):
+        return trajectories
+    store = SparseTrajectoryStore(trajectories.ids, len(trajectories), trajectories.get_steps(0, 0).dtype)
+    for start in range(0, len(trajectories), WRITE_BLOCK_STEPS):
+        stop = start + WRITE_BLOCK_STEPS
+        store.append(trajectories.get_steps(start, stop), trajectories.presence(start, stop))
+    return store
+
+
+def _layout(trajectories: TrajectorySource) -> Tuple[Dict[str, Any], List[Block]]:
+    # Header entry describing the position data and the arrays it consists of
+    if isinstance(trajectories, DeltaTrajectoryStore):
+        n_keyframes = -(-len(trajectories) // trajectories.keyframe_interval)
+        return _array_blocks(
+            {"encoding": "delta", "keyframe_interval": trajectories.keyframe_interval},
+            [("keyframes", trajectories.keyframes[:n_keyframes]), ("deltas", trajectories.deltas[:len(trajectories)]),
+             ("escapes", trajectories.escapes)])
+    if trajectories.sparse:
+        store = _sparse(trajectories)
+        return _array_blocks({"encoding": "sparse"}, [
+            ("mask", store.mask[:len(store)]), ("offsets", store.offsets[:len(store) + 1]),
+            ("positions", store.positions[:store.n_entries]), ("lifetimes", store.lifetimes)])
+    dtype = trajectories.get_steps(0, 0).dtype.newbyteorder('<')
+    shape = (len(trajectories), trajectories.n_pedestrians, 2)
+    return {"dtype": dtype.str, "shape": list(shape)}, [("positions", dtype, shape, trajectories.get_steps)]
+
+
+def write_binary(simulation: Simulation, path: str) -> None:
+    """Write a simulation in the binary container format
+
+    The file starts with a fixed preamble and a JSON header holding the topography,
+    the pedestrian table and the layout of the position data. The position data is the
+    raw (n_steps, n_pedestrians, 2) array in C order, aligned to ALIGNMENT bytes. For
+    delta-encoded simulations it is the keyframe, delta and escape arrays, each aligned,
+    and the header records their offsets relative to the first one. Sparse
+    simulations are written the same way as presence mask, step offsets, positions of
+    the present pedestrians and lifetimes, see SparseTrajectoryStore.
+
+    Args:
+        simulation (Simulation): Simulation to write
+        path (str): Path of the file
+    """
+    layout, blocks = _layout(simulation.trajectories)
+    header: Dict[str, Any] = {
+        "topography": simulation.topography.to_dict(),
+        "pedestrians": [vars(pedestrian) for pedestrian in simulation.pedestrians],
+        "n_steps": simulation.n_steps,
+        "positions": layout,
+    }
+    header_bytes = json.dumps(header).encode('utf-8')
+    data_offset = _aligned(PREAMBLE.size + len(header_bytes))
+    with open(path, "wb") as f:
+        f.write(PREAMBLE.pack(MAGIC, VERSION, len(header_bytes)))
+        f.write(header_bytes)
+        for name, dtype, shape, get in blocks:
+            f.write(b"\0" * (data_offset + layout.get(name, {}).get("offset", 0) - f.tell()))
+            for start in range(0, shape[0], WRITE_BLOCK_STEPS):
+                block = get(start, start + WRITE_BLOCK_STEPS)
+                f.write(np.ascontiguousarray(block, dtype=dtype).tobytes())
+
+
+def read_header(path: str) -> Tuple[Dict[str, Any], int]:
+    """Read the JSON header of a binary simulation file
+
+    Args:
+        path (str): Path of the file
+
+    Raises:
+        SimulationReconstructionException: Raised if the file is not a supported binary simulation
+
+    Returns:
+        Tuple[Dict[str, Any], int]: The header and the byte offset of the position block
+    """
+    with open(path, "rb") as f:
+        preamble = f.read(PREAMBLE.size)
+        if len(preamble) != PREAMBLE.size:
+            raise SimulationReconstructionException(
+                "{} is not a binary simulation file".format(path))
+        magic, version, header_length = PREAMBLE.unpack(preamble)
+        if magic != MAGIC:
+            raise SimulationReconstructionException(
+                "{} is not a binary simulation file".format(path))
+        if version not in SUPPORTED_VERSIONS:
+            raise SimulationReconstructionException(
+                "Unsupported binary simulation version {}".format(version))
+        header = json.loads(f.read(header_length).decode('utf-8'))
+    return header, _aligned(PREAMBLE.size + header_length)
+
+
+def _map(path: str, offset: int, layout: Dict[str, Any]) -> np.ndarray:
+    dtype = np.dtype(layout['dtype'])
+    shape = tuple(layout['shape'])
+    if int(np.prod(shape)) == 0:
+        return np.empty(shape, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=shape)
+
+
+def _file_reader(path: str, offset: int, layout: Dict[str, Any]) -> Callable[[int, int], np.ndarray]:
+    # Reads steps with plain file reads, so nothing but the returned steps is held in memory
+    dtype = np.dtype(layout['dtype'])
+    n_stored_steps, n_pedestrians, _ = layout['shape']
+    step_bytes = n_pedestrians * 2 * dtype.itemsize
+
+    def read(start: int, stop: int) -> np.ndarray:
+        stop = max(min(stop, n_stored_steps), start)
+        with open(path, "rb") as f:
+            f.seek(offset + start * step_bytes)
+            data = f.read((stop - start) * step_bytes)
+        return np.frombuffer(data, dtype=dtype).reshape(stop - start, n_pedestrians, 2)
+    return read
+
+
+def read_binary(path: str, chunk_steps: Optional[int] = None,
+                memory_budget: int = DEFAULT_MEMORY_BUDGET) -> Simulation:
+    """Open a simulation written by write_binary
+
+    Only the header is read. By default the position data is memory-mapped, so the run
+    is not loaded into memory and accessing a step only touches the pages holding it.
+    Delta-encoded files are opened as DeltaTrajectoryStore and sparse files as
+    SparseTrajectoryStore. With ``chunk_steps``, steps
+    are instead read in blocks into a ChunkedTrajectorySource whose cache never exceeds
+    ``memory_budget`` bytes.
+
+    Args:
+        path (str): Path of the file
+        chunk_steps (Optional[int]): Number of steps read at once, memory-map if not given
+        memory_budget (int): Maximum size of the cached chunks in bytes
+
+    Raises:
+        SimulationReconstructionException: Raised if the simulation could not be reconstructed
+
+    Returns:
+        Simulation: Simulation backed by the memory-mapped positions
+    """
+    header, data_offset = read_header(path)
+    for key in ('topography', 'pedestrians', 'n_steps', 'positions'):
+        if key not in header:
+            raise SimulationReconstructionException(
+                "Header must include '{}'".format(key))
+    topography = Topography.from_dict(header['topography'])
+    pedestrians = [Pedestrian(o["id"], o.get("radius", 1), o.get("label", None))
+                   for o in header['pedestrians']]
+    ids = [pedestrian.id for pedestrian in pedestrians]
+    layout = header['positions']
+    if layout.get('encoding', 'raw') == 'raw':
+        trajectories = TrajectoryStore.from_array(ids, _map(path, data_offset, layout))
+    elif layout['encoding'] == 'delta':
+        trajectories = DeltaTrajectoryStore.from_arrays(
+            ids, _map(path, data_offset + layout['keyframes']['offset'], layout['keyframes']),
+            _map(path, data_offset + layout['deltas']['offset'], layout['deltas']),
+            layout['keyframe_interval'],
+            # Files before version 4 have no escapes
+            _map(path, data_offset + layout['escapes']['offset'], layout['escapes']) if 'escapes' in layout else None)
+    elif layout['encoding'] == 'sparse':
+        trajectories = SparseTrajectoryStore.from_arrays(
+            ids, *(_map(path, data_offset + layout[name]['offset'], layout[name])
+                   for name in ('mask', 'offsets', 'positions', 'lifetimes')))
+    else:
+        raise SimulationReconstructionException(
+            "Unsupported position encoding '{}'".format(layout['encoding']))
+    if chunk_steps is not None:
+        presence = trajectories.presence if trajectories.sparse else None
+        if isinstance(trajectories, TrajectoryStore):
+            # Read the file directly instead of through the memory map
+            read = _file_reader(path, data_offset, layout)
+        else:
+            # Decoded steps are cached, so each chunk is decoded only once
+            read = trajectories.get_steps
+        trajectories = ChunkedTrajectorySource(ids, len(trajectories), read, chunk_steps, memory_budget,
+                                               presence=presence)
+    return Simulation(topography, pedestrians, header['n_steps'], [], trajectories)
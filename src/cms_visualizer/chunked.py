@@ -0,0 +1,131 @@
+from __future__ import annotations
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, Optional
+import numpy as np
+from .trajectory import TrajectorySource
+
+# Default memory budget of the chunk cache in bytes
+DEFAULT_MEMORY_BUDGET = 256 << 20
+
+
+class ChunkedTrajectorySource(TrajectorySource):
+    def __init__(self, ids: Iterable[int], n_steps: int, read: Callable[[int, int], np.ndarray],
+                 chunk_steps: int = 1024, memory_budget: int = DEFAULT_MEMORY_BUDGET,
+                 prefetch: bool = True, presence: Optional[Callable[[int, int], np.ndarray]] = None) -> None:
+        """Positions that are read in fixed-size blocks of steps on demand
+
+        Blocks ("chunks") are kept in a least recently used cache that holds at most
+        ``memory_budget`` bytes, but always the chunk that is being read. Whenever a chunk
+        is accessed, the one after it is read in a background thread, so playing a run
+        forward rarely waits for the disk. Memory use is therefore bounded by the cache
+        size, not by the length of the run.
+
+        Args:
+            ids (Iterable[int]): Pedestrian id per column
+            n_steps (int): Number of stored steps
+            read (Callable[[int, int], np.ndarray]): Reads the steps [start, stop) as an array of
+                shape (stop - start, n_pedestrians, 2), must be safe to call from another thread
+            chunk_steps (int): Number of steps per chunk
+            memory_budget (int): Maximum size of the cached chunks in bytes
+            prefetch (bool): Read the next chunk in the background
+            presence (Optional[Callable[[int, int], np.ndarray]]): Presence of the steps [start, stop)
+                for sources in which pedestrians enter and leave, it is not cached
+        """
+        super().__init__(ids)
+        if chunk_steps < 1:
+            raise ValueError("Chunks must hold at least one step")
+        self.n_steps = n_steps
+        self.read = read
+        self.chunk_steps = chunk_steps
+        self.memory_budget = memory_budget
+        self.prefetch = prefetch
+        self._presence = presence
+        self.sparse = presence is not None
+        self.dtype = np.asarray(read(0, 0)).dtype
+        self.n_reads = 0
+        self._chunks: OrderedDict = OrderedDict()
+        self._n_cached_bytes = 0
+        self._pending: Dict[int, Future] = {}
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    @property
+    def n_cached_bytes(self) -> int:
+        """Size of the cached chunks in bytes"""
+        return self._n_cached_bytes
+
+    def __len__(self) -> int:
+        return self.n_steps
+
+    def presence(self, start: int, stop: int) -> np.ndarray:
+        if self._presence is None:
+            return super().presence(start, stop)
+        return self._presence(start, min(stop, self.n_steps))
+
+    def get_steps(self, start: int, stop: int) -> np.ndarray:
+        stop = min(stop, self.n_steps)
+        if start >= stop:
+            return np.empty((0, self.n_pedestrians, 2), dtype=self.dtype)
+        first, last = start // self.chunk_steps, (stop - 1) // self.chunk_steps
+        blocks = []
+        for index in range(first, last + 1):
+            offset = index * self.chunk_steps
+            chunk = self._chunk(index)
+            blocks.append(chunk[max(start - offset, 0):stop - offset])
+        if self.prefetch and last + 1 < self.n_chunks:
+            self._prefetch(last + 1)
+        return blocks[0] if len(blocks) == 1 else np.concatenate(blocks)
+
+    @property
+    def n_chunks(self) -> int:
+        return -(-self.n_steps // self.chunk_steps)
+
+    def _chunk(self, index: int) -> np.ndarray:
+        with self._lock:
+            chunk = self._chunks.get(index)
+            if chunk is not None:
+                self._chunks.move_to_end(index)
+                return chunk
+            future = self._pending.get(index)
+        if future is not None:
+            return future.result()
+        return self._load(index)
+
+    def _load(self, index: int) -> np.ndarray:
+        start = index * self.chunk_steps
+        chunk = np.asarray(self.read(start, min(start + self.chunk_steps, self.n_steps)))
+        with self._lock:
+            self.n_reads += 1
+            self._pending.pop(index, None)
+            if index not in self._chunks:
+                self._chunks[index] = chunk
+                self._n_cached_bytes += chunk.nbytes
+            self._chunks.move_to_end(index)
+            # Evict the least recently used chunks, but never the one just loaded
+            while self._n_cached_bytes > self.memory_budget and len(self._chunks) > 1:
+                _, evicted = self._chunks.popitem(last=False)
+                self._n_cached_bytes -= evicted.nbytes
+        return chunk
+
+    def _prefetch(self, index: int) -> None:
+        with self._lock:
+            if index in self._chunks or index in self._pending:
+                return
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="cms-prefetch")
+            self._pending[index] = self._executor.submit(self._load, index)
+
+    def clear(self) -> None:
+        """Drop all cached chunks"""
+        with self._lock:
+            self._chunks.clear()
+            self._n_cached_bytes = 0
+
+    def close(self) -> None:
+        """Stop the prefetch thread and drop all cached chunks"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        self.clear()
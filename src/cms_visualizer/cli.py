@@ -0,0 +1,72 @@
+from __future__ import annotations
+import argparse
+import os
+import time
+from typing import List, Optional
+from .rendering import RenderOptions, render_frames, encode_video, load_simulation, read_topography
+from .pyramid import TemporalPyramid
+
+
+def _render(args: argparse.Namespace) -> None:
+    topography = read_topography(args.path)
+    options = RenderOptions(
+        cell_width=args.cell_width,
+        cell_height=args.cell_height,
+        canvas_width=args.width or int(topography.width * args.cell_width),
+        canvas_height=args.height or int(topography.height * args.cell_height),
+        show_grid=not args.no_grid,
+        show_trajectories=args.trajectories,
+        highlighted_pedestrian=args.highlight,
+    )
+    started = time.perf_counter()
+    paths = render_frames(args.path, args.out, options, args.start, args.stop, args.jobs)
+    print("Rendered {} frames to {} in {:.1f}s".format(len(paths), args.out, time.perf_counter() - started))
+    if args.video:
+        encode_video(args.out, args.video, args.fps)
+        print("Wrote {}".format(args.video))
+
+
+def _pyramid(args: argparse.Namespace) -> None:
+    started = time.perf_counter()
+    pyramid = load_simulation(args.path).temporal_pyramid(args.base, args.memory_budget << 20)
+    out = args.out or TemporalPyramid.path_for(args.path)
+    pyramid.save(out)
+    print("Wrote {} levels ({:.1f} MB) to {} in {:.1f}s".format(
+        len(pyramid.strides), pyramid.nbytes / 1e6, out, time.perf_counter() - started))
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="cms-visualizer", description="Visualize crowd modelling simulations.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    render = commands.add_parser("render", help="Render simulation steps to PNG frames without a browser")
+    render.add_argument("path", help="Simulation file written by Simulation.to_json or Simulation.to_binary")
+    render.add_argument("--out", required=True, help="Directory for the PNG frames")
+    render.add_argument("--jobs", type=int, default=os.cpu_count() or 1, help="Number of worker processes")
+    render.add_argument("--start", type=int, default=0, help="First step to render")
+    render.add_argument("--stop", type=int, default=None, help="Step after the last one to render")
+    render.add_argument("--cell-width", type=int, default=4, help="Width of a grid cell in pixels")
+    render.add_argument("--cell-height", type=int, default=4, help="Height of a grid cell in pixels")
+    render.add_argument("--width", type=int, default=None,
+                        help="Width of the frames in pixels, one cell per topography unit by default")
+    render.add_argument("--height", type=int, default=None,
+                        help="Height of the frames in pixels, one cell per topography unit by default")
+    render.add_argument("--no-grid", action="store_true", help="Do not draw the grid")
+    render.add_argument("--trajectories", action="store_true", help="Draw the trajectories")
+    render.add_argument("--highlight", type=int, default=None, help="Index of the pedestrian to highlight")
+    render.add_argument("--video", default=None, help="Also combine the frames into this .mp4 or .gif file")
+    render.add_argument("--fps", type=int, default=10, help="Frames per second of the video")
+    render.set_defaults(handler=_render)
+
+    pyramid = commands.add_parser("pyramid", help="Build the temporal pyramid used to preview a run while scrubbing")
+    pyramid.add_argument("path", help="Simulation file written by Simulation.to_json or Simulation.to_binary")
+    pyramid.add_argument("--out", default=None, help="Pyramid file, next to the simulation file by default")
+    pyramid.add_argument("--base", type=int, default=4, help="Factor between the strides of two levels")
+    pyramid.add_argument("--memory-budget", type=int, default=64, help="Maximum memory taken while building the pyramid in MB")
+    pyramid.set_defaults(handler=_pyramid)
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    args = build_parser().parse_args(argv)
+    args.handler(args)
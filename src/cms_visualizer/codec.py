@@ -0,0 +1,200 @@
+from __future__ import annotations
+from typing import Iterable, Optional, Tuple
+import numpy as np
+from .trajectory import TrajectorySource
+
+# Type of the stored deltas; moves it cannot hold are kept as escapes
+DELTA_DTYPE = np.int8
+
+
+class DeltaTrajectoryStore(TrajectorySource):
+    def __init__(self, ids: Iterable[int], capacity: int = 0, keyframe_interval: int = 64,
+                 dtype=np.int32) -> None:
+        """Delta-encoded storage of integer pedestrian positions
+
+        Every step is kept as the difference to the step before as int8, and every
+        ``keyframe_interval``-th step additionally as absolute positions. A coordinate that
+        moves by more than 127 cells in one step, e.g. when a pedestrian respawns, is stored
+        as an escape: a (step, cell, delta) row in ``escapes`` that replaces the int8 delta,
+        so rare large jumps do not widen the deltas of all other steps. A step is decoded
+        by summing the deltas since the nearest keyframe at or before it, so random access
+        costs at most ``keyframe_interval`` rows. Consecutive reads, as during playback,
+        continue from the step decoded last.
+
+        Args:
+            ids (Iterable[int]): Pedestrian id per column
+            capacity (int): Number of steps to reserve
+            keyframe_interval (int): Number of steps between two keyframes
+            dtype: Integer type of the decoded coordinates
+
+        Raises:
+            ValueError: Raised if the keyframe interval is not positive
+        """
+        super().__init__(ids)
+        if keyframe_interval < 1:
+            raise ValueError("The keyframe interval must be positive")
+        self.keyframe_interval = keyframe_interval
+        self.dtype = np.dtype(dtype)
+        self.keyframes = np.empty((-(-capacity // keyframe_interval), self.n_pedestrians, 2), dtype=self.dtype)
+        self.deltas = np.empty((capacity, self.n_pedestrians, 2), dtype=DELTA_DTYPE)
+        # Rows of step, index into the flattened (n_pedestrians * 2) step and delta, sorted by step
+        self._escapes = np.empty((0, 3), dtype=np.int64)
+        self._n_escapes = 0
+        self._length = 0
+        self._last: Optional[Tuple[int, np.ndarray]] = None
+        # Last appended step, the base of the deltas of the next one
+        self._tail: Optional[np.ndarray] = None
+
+    @classmethod
+    def from_arrays(cls, ids: Iterable[int], keyframes: np.ndarray, deltas: np.ndarray,
+                    keyframe_interval: int, escapes: Optional[np.ndarray] = None) -> DeltaTrajectoryStore:
+        """Wrap existing keyframe, delta and escape arrays without copying them
+
+        Args:
+            ids (Iterable[int]): Pedestrian id per column
+            keyframes (np.ndarray): Keyframes of shape (ceil(n_steps / keyframe_interval), n_pedestrians, 2)
+            deltas (np.ndarray): Deltas of shape (n_steps, n_pedestrians, 2), e.g. a memory map
+            keyframe_interval (int): Number of steps between two keyframes
+            escapes (Optional[np.ndarray]): Escaped deltas of shape (n_escapes, 3), none by default
+
+        Returns:
+            DeltaTrajectoryStore: Store holding all steps of ``deltas``
+        """
+        store = cls(ids, 0, keyframe_interval, keyframes.dtype)
+        shape = (store.n_pedestrians, 2)
+        if (deltas.ndim != 3 or deltas.shape[1:] != shape or
+                keyframes.shape != (-(-deltas.shape[0] // keyframe_interval),) + shape):
+            raise ValueError("Keyframes and deltas do not match {} pedestrians and a keyframe interval of {}".format(
+                store.n_pedestrians, keyframe_interval))
+        if escapes is not None:
+            if escapes.ndim != 2 or escapes.shape[1] != 3:
+                raise ValueError("Escapes must have shape (n_escapes, 3)")
+            store._escapes = escapes
+            store._n_escapes = escapes.shape[0]
+        store.keyframes = keyframes
+        store.deltas = deltas
+        store._length = deltas.shape[0]
+        return store
+
+    @classmethod
+    def encode(cls, trajectories: TrajectorySource, keyframe_interval: int = 64,
+               block_steps: int = 4096) -> DeltaTrajectoryStore:
+        """Delta-encode the positions of another source block by block
+
+        Args:
+            trajectories (TrajectorySource): Positions to encode
+            keyframe_interval (int): Number of steps between two keyframes
+            block_steps (int): Number of steps read from the source at once
+
+        Returns:
+            DeltaTrajectoryStore: Store holding the same positions
+
+        Raises:
+            ValueError: Raised if pedestrians are absent at some steps
+        """
+        if trajectories.sparse:
+            raise ValueError("Delta encoding requires every pedestrian at every step")
+        dtype = trajectories.get_steps(0, 0).dtype
+        store = cls(trajectories.ids, len(trajectories), keyframe_interval,
+                    dtype if dtype.kind in 'iu' else np.int32)
+        for start in range(0, len(trajectories), block_steps):
+            store.append(trajectories.get_steps(start, start + block_steps))
+        return store
+
+    @property
+    def nbytes(self) -> int:
+        """Memory taken by the stored steps"""
+        n_keyframes = -(-self._length // self.keyframe_interval)
+        return self.keyframes[:n_keyframes].nbytes + self.deltas[:self._length].nbytes + self.escapes.nbytes
+
+    @property
+    def escapes(self) -> np.ndarray:
+        """Escaped deltas of shape (n_escapes, 3): step, index into the flattened step and delta"""
+        return self._escapes[:self._n_escapes]
+
+    def __len__(self) -> int:
+        return self._length
+
+    def get_steps(self, start: int, stop: int) -> np.ndarray:
+        stop = min(stop, self._length)
+        if start >= stop:
+            return np.empty((0, self.n_pedestrians, 2), dtype=self.dtype)
+        keyframe = start - start % self.keyframe_interval
+        last = self._last
+        if last is not None and keyframe <= last[0] < start:
+            # Continue from the step decoded last instead of the keyframe
+            base_step, base = last
+        else:
+            base_step, base = keyframe, self.keyframes[keyframe // self.keyframe_interval]
+        # Keyframe steps keep their delta as well, so the sum may cross keyframes
+        steps = self.deltas[base_step + 1:stop].astype(np.int64)
+        escapes = self.escapes
+        first, last = np.searchsorted(escapes[:, 0], [base_step + 1, stop])
+        if first < last:
+            rows = escapes[first:last]
+            steps.reshape(len(steps), -1)[rows[:, 0] - base_step - 1, rows[:, 1]] = rows[:, 2]
+        np.cumsum(steps, axis=0, out=steps)
+        steps += base
+        steps = np.concatenate([base[np.newaxis].astype(np.int64), steps])[start - base_step:]
+        steps = steps.astype(self.dtype)
+        self._last = (stop - 1, steps[-1].copy())
+        return steps
+
+    def append(self, steps: np.ndarray) -> None:
+        """Append a block of steps
+
+        Args:
+            steps (np.ndarray): Array of shape (k, n_pedestrians, 2), already validated
+
+        Raises:
+            ValueError: Raised if a coordinate is not an integer
+        """
+        steps = np.asarray(steps)
+        if steps.dtype.kind == 'f':
+            if not np.array_equal(steps, np.round(steps)):
+                raise ValueError("Delta encoding requires integer coordinates")
+            steps = steps.astype(np.int64)
+        k = steps.shape[0]
+        if k == 0:
+            return
+        if self._length + k > self.deltas.shape[0]:
+            self._grow(self._length + k)
+        indices = np.arange(self._length, self._length + k)
+        if not self._length:
+            previous = steps[:1]
+        else:
+            previous = (self.get_step(self._length - 1) if self._tail is None else self._tail)[np.newaxis]
+        deltas = np.diff(np.concatenate([previous, steps]).astype(np.int64), axis=0)
+        is_keyframe = indices % self.keyframe_interval == 0
+        self._escape(deltas)
+        self.deltas[self._length:self._length + k] = deltas
+        self.keyframes[indices[is_keyframe] // self.keyframe_interval] = steps[is_keyframe]
+        self._length += k
+        self._tail = steps[-1].astype(self.dtype)
+        self._last = (self._length - 1, self._tail.copy())
+
+    def _escape(self, deltas: np.ndarray) -> None:
+        # Moves the delta type cannot hold become escapes, their deltas are set to 0
+        limits = np.iinfo(self.deltas.dtype)
+        flat = deltas.reshape(len(deltas), -1)
+        rows, cells = np.nonzero((flat < limits.min) | (flat > limits.max))
+        if not len(rows):
+            return
+        n = self._n_escapes + len(rows)
+        if n > len(self._escapes):
+            escapes = np.empty((max(n, 2 * len(self._escapes)), 3), dtype=np.int64)
+            escapes[:self._n_escapes] = self._escapes[:self._n_escapes]
+            self._escapes = escapes
+        self._escapes[self._n_escapes:n] = np.stack([rows + self._length, cells, flat[rows, cells]], axis=1)
+        self._n_escapes = n
+        flat[rows, cells] = 0
+
+    def _grow(self, min_capacity: int) -> None:
+        capacity = max(min_capacity, 2 * self.deltas.shape[0])
+        deltas = np.empty((capacity, self.n_pedestrians, 2), dtype=self.deltas.dtype)
+        deltas[:self._length] = self.deltas[:self._length]
+        self.deltas = deltas
+        n_keyframes = -(-self._length // self.keyframe_interval)
+        keyframes = np.empty((-(-capacity // self.keyframe_interval), self.n_pedestrians, 2), dtype=self.dtype)
+        keyframes[:n_keyframes] = self.keyframes[:n_keyframes]
+        self.keyframes = keyframes
@@ -0,0 +1,106 @@
+from __future__ import annotations
+from typing import Sequence, Tuple
+import numpy as np
+from .topography import Topography, TopographyObject, TopographyObjectTable
+
+Rects = Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]
+
+
+def snap(values, unit: float, cell: float) -> np.ndarray:
+    """Convert topography coordinates or lengths to canvas pixels, snapped to the grid cells
+
+    Args:
+        values: Coordinates or lengths in topography units
+        unit (float): Canvas pixels per topography unit
+        cell (float): Size of a grid cell in pixels
+
+    Returns:
+        np.ndarray: Snapped pixel values
+    """
+    return np.round(np.asarray(values) * unit / cell) * cell
+
+
+class SceneGeometry:
+    def __init__(self, topography: Topography, canvas_width: int, canvas_height: int,
+                 cell_width: int, cell_height: int) -> None:
+        """Placement of the grid, the topography and the pedestrians on a canvas
+
+        Shared by the widget and the headless renderer so both draw the same picture.
+
+        Args:
+            topography (Topography): Topography that is drawn
+            canvas_width (int): Width of the canvas in pixels
+            canvas_height (int): Height of the canvas in pixels
+            cell_width (int): Width of a grid cell in pixels
+            cell_height (int): Height of a grid cell in pixels
+        """
+        self.topography = topography
+        self.canvas_width = canvas_width
+        self.canvas_height = canvas_height
+        self.cell_width = cell_width
+        self.cell_height = cell_height
+        self.unit_width = canvas_width / topography.width
+        self.unit_height = canvas_height / topography.height
+
+    def grid(self) -> Tuple[np.ndarray, np.ndarray, float, float]:
+        """Outlines of the grid cells covering the canvas, all cells have the same size"""
+        indices = np.indices((int(self.canvas_height / self.cell_height), int(self.canvas_width / self.cell_width)))
+        row_indices = indices[0].flatten()
+        column_indices = indices[1].flatten()
+        return column_indices * self.cell_width, row_indices * self.cell_height, self.cell_width, self.cell_height
+
+    def objects(self, objects: Sequence[TopographyObject]) -> Rects:
+        """Rectangles of rectangular topography objects"""
+        if isinstance(objects, TopographyObjectTable):
+            columns = objects.columns()
+            rects = np.stack([columns['x'], columns['y'], columns['width'], columns['height']], axis=1)
+        else:
+            rects = np.array([[o.x, o.y, o.width, o.height] for o in objects]).reshape(-1, 4)
+        return (snap(rects[:, 0], self.unit_width, self.cell_width),
+                snap(rects[:, 1], self.unit_height, self.cell_height),
+                snap(rects[:, 2], self.unit_width, self.cell_width),
+                snap(rects[:, 3], self.unit_height, self.cell_height))
+
+    def points(self, positions: np.ndarray) -> np.ndarray:
+        """Top left corners of the grid cells of positions
+
+        Args:
+            positions (np.ndarray): Positions of shape (..., 2)
+
+        Returns:
+            np.ndarray: Snapped pixel coordinates of the same shape
+        """
+        unit = np.array([self.unit_width, self.unit_height])
+        cell = np.array([self.cell_width, self.cell_height])
+        return np.round(positions * unit / cell) * cell
+
+    def cell_centers(self, positions: np.ndarray) -> np.ndarray:
+        """Centers of the grid cells of positions, the vertices of the trajectories"""
+        return self.points(positions) + np.array([self.cell_width, self.cell_height]) / 2
+
+    def sizes(self, radius: np.ndarray) -> np.ndarray:
+        """Snapped width and height of pedestrians
+
+        Args:
+            radius (np.ndarray): Radius per pedestrian
+
+        Returns:
+            np.ndarray: Widths and heights of shape (n, 2)
+        """
+        radius = np.asarray(radius)
+        return np.stack([snap(radius, self.unit_width, self.cell_width),
+                         snap(radius, self.unit_height, self.cell_height)], axis=-1).reshape(-1, 2)
+
+    def pedestrians(self, positions: np.ndarray, radius: np.ndarray) -> Rects:
+        """Rectangles of pedestrians
+
+        Args:
+            positions (np.ndarray): Positions of shape (n, 2)
+            radius (np.ndarray): Radius per pedestrian
+
+        Returns:
+            Rects: x, y, width and height arrays
+        """
+        points = self.points(positions)
+        sizes = self.sizes(radius)
+        return points[:, 0], points[:, 1], sizes[:, 0], sizes[:, 1]
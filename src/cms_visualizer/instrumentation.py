@@ -0,0 +1,150 @@
+from __future__ import annotations
+import time
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterator, Optional
+import numpy as np
+
+
+def payload_size(value: Any) -> int:
+    """Approximate number of bytes a canvas command argument takes on the wire
+
+    Arrays are sent as binary buffers, strings as text and everything else as a number.
+
+    Args:
+        value (Any): Command argument
+
+    Returns:
+        int: Size in bytes
+    """
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (list, tuple)):
+        return sum(payload_size(v) for v in value)
+    if isinstance(value, str):
+        return len(value)
+    return 8
+
+
+@dataclass
+class FrameProfile:
+    """Measurements of a single frame
+
+    Attributes:
+        step (int): Simulation step of the frame
+        seconds (float): Wall time of the whole frame
+        phases (Dict[str, float]): Wall time per drawing phase
+        commands (int): Number of canvas commands
+        bytes (int): Approximate size of the canvas commands
+    """
+    step: int
+    seconds: float = 0.0
+    phases: Dict[str, float] = field(default_factory=dict)
+    commands: int = 0
+    bytes: int = 0
+
+
+class InstrumentedLayer:
+    def __init__(self, layer: Any, profiler: FrameProfiler) -> None:
+        """Forwards everything to a canvas layer and counts method calls and property assignments as commands
+
+        Args:
+            layer (Any): ipycanvas Canvas
+            profiler (FrameProfiler): Profiler the commands are counted for
+        """
+        object.__setattr__(self, "_layer", layer)
+        object.__setattr__(self, "_profiler", profiler)
+
+    def __getattr__(self, name: str) -> Any:
+        value = getattr(self._layer, name)
+        if not callable(value):
+            return value
+
+        def command(*args, **kwargs) -> Any:
+            self._profiler.count(payload_size(args) + payload_size(tuple(kwargs.values())))
+            return value(*args, **kwargs)
+        return command
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        self._profiler.count(payload_size(value))
+        setattr(self._layer, name, value)
+
+
+class FrameProfiler:
+    def __init__(self, window: int = 100, clock: Callable[[], float] = time.perf_counter) -> None:
+        """Rolling per-frame timings and canvas traffic
+
+        Args:
+            window (int): Number of frames the statistics are computed over
+            clock (Callable[[], float]): Monotonic clock in seconds
+        """
+        self.clock = clock
+        self.frames: deque = deque(maxlen=window)
+        self._current: Optional[FrameProfile] = None
+
+    @contextmanager
+    def frame(self, step: int) -> Iterator[None]:
+        """Measure a frame, nested frames are part of the outer one
+
+        Args:
+            step (int): Simulation step of the frame
+        """
+        if self._current is not None:
+            yield
+            return
+        self._current = FrameProfile(step)
+        start = self.clock()
+        try:
+            yield
+        finally:
+            self._current.seconds = self.clock() - start
+            self.frames.append(self._current)
+            self._current = None
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """Measure a drawing phase of the current frame, repeated phases add up
+
+        Args:
+            name (str): Name of the phase
+        """
+        start = self.clock()
+        try:
+            yield
+        finally:
+            if self._current is not None:
+                phases = self._current.phases
+                phases[name] = phases.get(name, 0.0) + self.clock() - start
+
+    def count(self, n_bytes: int) -> None:
+        """Count a canvas command of the current frame
+
+        Args:
+            n_bytes (int): Approximate size of the command
+        """
+        if self._current is not None:
+            self._current.commands += 1
+            self._current.bytes += n_bytes
+
+    def wrap(self, layer: Any) -> InstrumentedLayer:
+        """Canvas layer whose commands are counted"""
+        return InstrumentedLayer(layer, self)
+
+    def stats(self) -> Dict[str, Any]:
+        """Frame time percentiles, mean traffic per frame and mean time per phase over the window"""
+        if not self.frames:
+            return {"n_frames": 0}
+        seconds = np.array([f.seconds for f in self.frames])
+        phases: Dict[str, float] = {}
+        for f in self.frames:
+            for name, t in f.phases.items():
+                phases[name] = phases.get(name, 0.0) + t
+        return {
+            "n_frames": len(self.frames),
+            "frame_time_p50": float(np.percentile(seconds, 50)),
+            "frame_time_p95": float(np.percentile(seconds, 95)),
+            "commands_per_frame": float(np.mean([f.commands for f in self.frames])),
+            "bytes_per_frame": float(np.mean([f.bytes for f in self.frames])),
+            "phases": {name: t / len(self.frames) for name, t in phases.items()},
+        }
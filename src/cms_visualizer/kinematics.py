@@ -0,0 +1,246 @@
+from __future__ import annotations
+from dataclasses import dataclass
+from typing import Optional
+import numpy as np
+from .simulation import Simulation
+
+# Time to target of steps from which no target is reached (in the steps loaded so far)
+NOT_REACHED = -1
+
+
+@dataclass
+class PedestrianKinematics:
+    """Motion of one pedestrian at one step
+
+    Attributes:
+        velocity_x (float): Displacement along x since the step before, in topography units per step
+        velocity_y (float): Displacement along y since the step before
+        speed (float): Length of the velocity
+        heading (float): Direction of the velocity in degrees, counterclockwise from the x-axis
+        path_length (Optional[float]): Distance walked since the first step, None if not known yet
+        time_to_target (Optional[int]): Steps until the pedestrian is inside a target, NOT_REACHED if
+            never, None if not known yet
+    """
+    velocity_x: float
+    velocity_y: float
+    speed: float
+    heading: float
+    path_length: Optional[float]
+    time_to_target: Optional[int]
+
+
+class Kinematics:
+    def __init__(self, simulation: Simulation, block_steps: int = 1024) -> None:
+        """Velocity, speed, heading, path length and time to target of every pedestrian at every step
+
+        The positions are read block by block and the results kept in arrays of shape
+        (n_steps, n_pedestrians), so looking up a pedestrian at a step is O(1). The velocity
+        at a step is the displacement since the step before, zero at the first step and
+        at steps a pedestrian enters or is absent. Nothing is computed until update is
+        called, which only reads the steps loaded since the last call. The arrays take
+        16 bytes per pedestrian and step, so looking up single pedestrians of long runs
+        is cheaper with PedestrianTrack.
+
+        Args:
+            simulation (Simulation): Simulation to compute the kinematics of
+            block_steps (int): Number of steps read at once
+        """
+        self.simulation = simulation
+        self.trajectories = simulation.trajectories
+        self.block_steps = block_steps
+        n = self.trajectories.n_pedestrians
+        self._velocity = np.zeros((0, n, 2), dtype=np.float32)
+        self._path_length = np.zeros((0, n), dtype=np.float32)
+        self._time_to_target = np.zeros((0, n), dtype=np.int32)
+        self._length = 0
+        # First step per pedestrian whose time to target is not known yet
+        self._pending = np.zeros(n, dtype=np.int64)
+        self._last_position = None
+        self._last_present = None
+
+    def __len__(self) -> int:
+        return self._length
+
+    @property
+    def velocity(self) -> np.ndarray:
+        """Velocities of shape (n_steps, n_pedestrians, 2)"""
+        return self._velocity[:self._length]
+
+    @property
+    def speed(self) -> np.ndarray:
+        """Speeds of shape (n_steps, n_pedestrians)"""
+        return np.hypot(self.velocity[..., 0], self.velocity[..., 1])
+
+    @property
+    def heading(self) -> np.ndarray:
+        """Headings in degrees of shape (n_steps, n_pedestrians), 0 for pedestrians standing still"""
+        return np.degrees(np.arctan2(self.velocity[..., 1], self.velocity[..., 0]))
+
+    @property
+    def path_length(self) -> np.ndarray:
+        """Distances walked since the first step, of shape (n_steps, n_pedestrians)"""
+        return self._path_length[:self._length]
+
+    @property
+    def time_to_target(self) -> np.ndarray:
+        """Steps until a target is reached, of shape (n_steps, n_pedestrians), NOT_REACHED if never"""
+        return self._time_to_target[:self._length]
+
+    def at(self, step: int, column: int) -> PedestrianKinematics:
+        """Kinematics of one pedestrian at one step
+
+        Args:
+            step (int): Simulation step
+            column (int): Column of the pedestrian, see TrajectorySource.column_of
+
+        Raises:
+            IndexError: Raised if the step has not been computed
+
+        Returns:
+            PedestrianKinematics:
+        """
+        if not 0 <= step < self._length:
+            raise IndexError("Step {} is not available".format(step))
+        vx, vy = self._velocity[step, column].tolist()
+        return PedestrianKinematics(vx, vy, float(np.hypot(vx, vy)), float(np.degrees(np.arctan2(vy, vx))),
+                                    float(self._path_length[step, column]), int(self._time_to_target[step, column]))
+
+    def update(self) -> int:
+        """Compute the steps added to the simulation since the last update
+
+        Returns:
+            int: Number of new steps
+        """
+        start = self._length
+        stop = len(self.trajectories)
+        if stop > self._velocity.shape[0]:
+            self._grow(stop)
+        for block_start in range(start, stop, self.block_steps):
+            block_stop = min(block_start + self.block_steps, stop)
+            self._add_block(block_start, self.trajectories.get_steps(block_start, block_stop),
+                            self.trajectories.presence(block_start, block_stop))
+        return stop - start
+
+    def _add_block(self, start: int, positions: np.ndarray, present: np.ndarray) -> None:
+        k = positions.shape[0]
+        stop = start + k
+        positions = positions.astype(np.float64)
+        previous = positions[:1] if self._last_position is None else self._last_position[np.newaxis]
+        velocity = np.diff(np.concatenate([previous, positions]), axis=0)
+        # Pedestrians only move between two steps at which they are both present
+        was_present = np.concatenate([present[:1] if self._last_present is None else self._last_present[np.newaxis],
+                                      present[:-1]])
+        velocity[~(present & was_present)] = 0
+        self._velocity[start:stop] = velocity
+        walked = np.cumsum(np.hypot(velocity[..., 0], velocity[..., 1]), axis=0)
+        self._path_length[start:stop] = walked + (self._path_length[start - 1] if start else 0)
+        self._last_position = positions[-1]
+        self._last_present = present[-1]
+
+        # Steps until the next step inside a target, first within the block
+        arrived = _in_target(self.simulation, positions, present)
+        steps = np.arange(start, stop)[:, np.newaxis]
+        never = np.iinfo(np.int64).max
+        next_arrival = np.minimum.accumulate(np.where(arrived, steps, never)[::-1], axis=0)[::-1]
+        self._time_to_target[start:stop] = np.where(next_arrival != never, next_arrival - steps, NOT_REACHED)
+        # then for the steps of earlier blocks that were waiting for an arrival
+        first_arrival = next_arrival[0] if k else np.full(len(self._pending), never)
+        for column in np.flatnonzero((first_arrival != never) & (self._pending < start)):
+            waiting = np.arange(self._pending[column], start)
+            self._time_to_target[waiting, column] = first_arrival[column] - waiting
+        last_arrival = np.where(arrived, steps, -1).max(axis=0, initial=-1)
+        self._pending = np.where(last_arrival >= 0, last_arrival + 1, self._pending)
+        self._length = stop
+
+    def _grow(self, min_capacity: int) -> None:
+        capacity = max(min_capacity, 2 * self._velocity.shape[0])
+        for name in ('_velocity', '_path_length', '_time_to_target'):
+            old = getattr(self, name)
+            new = np.empty((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:self._length] = old[:self._length]
+            setattr(self, name, new)
+
+
+class PedestrianTrack:
+    def __init__(self, simulation: Simulation, column: int, window: int = 256) -> None:
+        """Kinematics of one pedestrian, computed on demand
+
+        Unlike Kinematics, nothing is computed up front and only the column of this
+        pedestrian is read, at most ``window`` steps around the step asked for. The
+        velocity is read from the step and the one before. Path lengths are summed from
+        the first step on and cached, but extended by at most ``window`` steps per lookup,
+        and the time to target is looked for in the next ``window`` steps. Values that
+        cannot be known within these bounds are None, so a lookup never reads the run up
+        to the step or to its end.
+
+        Args:
+            simulation (Simulation): Simulation the pedestrian belongs to
+            column (int): Column of the pedestrian, see TrajectorySource.column_of
+            window (int): Maximum number of steps read per lookup
+        """
+        self.simulation = simulation
+        self.trajectories = simulation.trajectories
+        self.column = column
+        self.window = window
+        self._path_length = np.zeros(0)
+        # Number of steps from the first one on whose path length is known
+        self._length = 0
+        self._last_position = None
+        self._last_present = None
+
+    def at(self, step: int) -> PedestrianKinematics:
+        """Kinematics of the pedestrian at one step
+
+        Args:
+            step (int): Simulation step
+
+        Raises:
+            IndexError: Raised if the step has not been loaded
+
+        Returns:
+            PedestrianKinematics:
+        """
+        if not 0 <= step < len(self.trajectories):
+            raise IndexError("Step {} is not available".format(step))
+        positions, present = self._read(max(step - 1, 0), step + 1)
+        vx, vy = (positions[-1] - positions[0]).tolist() if present.all() else (0.0, 0.0)
+        if self._length <= step < self._length + self.window:
+            self._extend(step + 1)
+        path_length = float(self._path_length[step]) if step < self._length else None
+        stop = min(step + self.window, len(self.trajectories))
+        positions, present = self._read(step, stop)
+        arrivals = np.flatnonzero(_in_target(self.simulation, positions, present))
+        if len(arrivals):
+            time_to_target = int(arrivals[0])
+        else:
+            time_to_target = NOT_REACHED if stop == len(self.trajectories) else None
+        return PedestrianKinematics(vx, vy, float(np.hypot(vx, vy)), float(np.degrees(np.arctan2(vy, vx))),
+                                    path_length, time_to_target)
+
+    def _read(self, start: int, stop: int):
+        positions = self.trajectories.get_column(start, stop, self.column).astype(np.float64)
+        return positions, self.trajectories.presence(start, stop)[:, self.column]
+
+    def _extend(self, stop: int) -> None:
+        # Path lengths of the steps [_length, stop)
+        start = self._length
+        if stop > len(self._path_length):
+            path_length = np.empty(max(stop, 2 * len(self._path_length)))
+            path_length[:start] = self._path_length[:start]
+            self._path_length = path_length
+        positions, present = self._read(start, stop)
+        previous = positions[:1] if self._last_position is None else self._last_position[np.newaxis]
+        distance = np.hypot(*np.diff(np.concatenate([previous, positions]), axis=0).T)
+        was_present = np.concatenate([present[:1] if self._last_present is None else [self._last_present],
+                                      present[:-1]])
+        distance[~(present & was_present)] = 0
+        self._path_length[start:stop] = np.cumsum(distance) + (self._path_length[start - 1] if start else 0)
+        self._last_position = positions[-1]
+        self._last_present = present[-1]
+        self._length = stop
+
+
+def _in_target(simulation: Simulation, positions: np.ndarray, present: np.ndarray) -> np.ndarray:
+    # Whether each position is inside a target, False for absent pedestrians
+    topography = simulation.topography
+    return np.isin(topography.lookup(positions[..., 0], positions[..., 1]), topography.targets.ids) & present
@@ -0,0 +1,96 @@
+from __future__ import annotations
+from typing import Tuple
+import numpy as np
+
+
+def density_counts(x: np.ndarray, y: np.ndarray, canvas_width: int, canvas_height: int,
+                   bin_width: int, bin_height: int) -> np.ndarray:
+    """2D histogram of points on a canvas
+
+    Args:
+        x (np.ndarray): x-coordinates in pixels
+        y (np.ndarray): y-coordinates in pixels
+        canvas_width (int): Width of the canvas in pixels
+        canvas_height (int): Height of the canvas in pixels
+        bin_width (int): Width of a bin in pixels
+        bin_height (int): Height of a bin in pixels
+
+    Returns:
+        np.ndarray: Counts of shape (n_rows, n_columns); points outside the canvas are ignored
+    """
+    n_columns = -(-canvas_width // bin_width)
+    n_rows = -(-canvas_height // bin_height)
+    inside = (x >= 0) & (x < canvas_width) & (y >= 0) & (y < canvas_height)
+    columns = (x[inside] // bin_width).astype(np.int64)
+    rows = (y[inside] // bin_height).astype(np.int64)
+    counts = np.bincount(rows * n_columns + columns, minlength=n_rows * n_columns)
+    return counts.reshape(n_rows, n_columns)
+
+
+def density_image(counts: np.ndarray, bin_width: int, bin_height: int, canvas_width: int, canvas_height: int,
+                  color: Tuple[int, int, int]) -> np.ndarray:
+    """Turn a 2D histogram into a canvas-sized RGBA image of a single color
+
+    The opacity grows logarithmically with the count, so sparse areas stay visible next
+    to dense ones.
+
+    Args:
+        counts (np.ndarray): Counts of shape (n_rows, n_columns)
+        bin_width (int): Width of a bin in pixels
+        bin_height (int): Height of a bin in pixels
+        canvas_width (int): Width of the canvas in pixels
+        canvas_height (int): Height of the canvas in pixels
+        color (Tuple[int, int, int]): Color of the densest bin
+
+    Returns:
+        np.ndarray: Image of shape (canvas_height, canvas_width, 4) with dtype uint8
+    """
+    image = _alpha_image(counts, color)
+    image = np.repeat(np.repeat(image, bin_height, axis=0), bin_width, axis=1)
+    return image[:canvas_height, :canvas_width]
+
+
+def raster_image(values: np.ndarray, canvas_width: int, canvas_height: int,
+                 color: Tuple[int, int, int]) -> np.ndarray:
+    """Stretch a raster of non-negative values over the whole canvas as an RGBA image
+
+    Every pixel takes the value of the raster cell it falls into, with the same
+    logarithmic opacity as density_image. Used for rasters in topography cells, whose
+    size in pixels need not be a whole number.
+
+    Args:
+        values (np.ndarray): Values of shape (n_rows, n_columns), row 0 at the top
+        canvas_width (int): Width of the canvas in pixels
+        canvas_height (int): Height of the canvas in pixels
+        color (Tuple[int, int, int]): Color of the largest value
+
+    Returns:
+        np.ndarray: Image of shape (canvas_height, canvas_width, 4) with dtype uint8
+    """
+    rows = np.arange(canvas_height) * values.shape[0] // max(canvas_height, 1)
+    columns = np.arange(canvas_width) * values.shape[1] // max(canvas_width, 1)
+    return _alpha_image(values, color)[rows[:, np.newaxis], columns]
+
+
+def cell_image(values: np.ndarray, color: Tuple[int, int, int]) -> np.ndarray:
+    """RGBA image of a raster with one pixel per cell, for the canvas to scale
+
+    Uses the same logarithmic opacity as density_image.
+
+    Args:
+        values (np.ndarray): Values of shape (n_rows, n_columns), row 0 at the top
+        color (Tuple[int, int, int]): Color of the largest value
+
+    Returns:
+        np.ndarray: Image of shape (n_rows, n_columns, 4) with dtype uint8
+    """
+    return _alpha_image(values, color)
+
+
+def _alpha_image(counts: np.ndarray, color: Tuple[int, int, int]) -> np.ndarray:
+    peak = counts.max(initial=0)
+    alpha = np.log1p(counts) / np.log1p(peak) if peak > 0 else np.zeros(counts.shape)
+    image = np.zeros(counts.shape + (4,), dtype=np.uint8)
+    image[:, :, :3] = color
+    image[:, :, 3] = np.round(alpha * 255)
+    return image
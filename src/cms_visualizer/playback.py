@@ -0,0 +1,111 @@
+from __future__ import annotations
+import asyncio
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, Optional
+
+
+def _call_later(delay: float, callback: Callable[[], None]) -> None:
+    """Run a callback after a delay on the running event loop (e.g. the kernel's), or in a timer thread"""
+    try:
+        asyncio.get_running_loop().call_later(delay, callback)
+    except RuntimeError:
+        timer = threading.Timer(delay, callback)
+        timer.daemon = True
+        timer.start()
+
+
+class PlaybackScheduler:
+    # Number of frames the achieved frame rate is averaged over
+    WINDOW = 30
+
+    def __init__(self, render: Callable[[int], None], fps: float = 10,
+                 clock: Callable[[], float] = time.perf_counter,
+                 call_later: Callable[[float, Callable[[], None]], None] = _call_later) -> None:
+        """Frame-rate-aware scheduling of step renders
+
+        Requested steps are coalesced to the latest one. A frame is rendered at most once
+        per frame interval, measured from the end of the previous render, so requests that
+        pile up while a slow frame is drawn are dropped instead of being rendered one after
+        the other. The latest request is always rendered eventually.
+
+        Args:
+            render (Callable[[int], None]): Renders a step
+            fps (float): Target frame rate
+            clock (Callable[[], float]): Monotonic clock in seconds
+            call_later (Callable[[float, Callable[[], None]], None]): Runs a callback after a delay in seconds
+        """
+        self.render = render
+        self.fps = fps
+        self.clock = clock
+        self.call_later = call_later
+        self.n_rendered = 0
+        self.n_dropped = 0
+        self.last_render_time = 0.0
+        self._pending: Optional[int] = None
+        self._next_frame = 0.0
+        self._flush_scheduled = False
+        self._frame_starts: deque = deque(maxlen=self.WINDOW)
+
+    @property
+    def interval(self) -> float:
+        """Target time between two frames in seconds"""
+        return 1 / self.fps
+
+    def request(self, step: int) -> None:
+        """Ask for a step to be rendered
+
+        Args:
+            step (int): Simulation step
+        """
+        if self._pending is not None:
+            self.n_dropped += 1
+        self._pending = step
+        delay = self._next_frame - self.clock()
+        if delay <= 0:
+            self.flush()
+        elif not self._flush_scheduled:
+            self._flush_scheduled = True
+            self.call_later(delay, self._scheduled_flush)
+
+    def _scheduled_flush(self) -> None:
+        self._flush_scheduled = False
+        delay = self._next_frame - self.clock()
+        if delay > 0:
+            self._flush_scheduled = True
+            self.call_later(delay, self._scheduled_flush)
+        else:
+            self.flush()
+
+    def flush(self) -> None:
+        """Render the pending step right away, if there is one"""
+        if self._pending is None:
+            return
+        step, self._pending = self._pending, None
+        start = self.clock()
+        self._frame_starts.append(start)
+        self.render(step)
+        end = self.clock()
+        self.n_rendered += 1
+        self.last_render_time = end - start
+        # After a slow frame, leave the kernel time to work off the requests that queued up
+        self._next_frame = max(start + self.interval, end + self.interval / 2)
+
+    @property
+    def achieved_fps(self) -> float:
+        """Frame rate over the last frames"""
+        if len(self._frame_starts) < 2:
+            return 0.0
+        elapsed = self._frame_starts[-1] - self._frame_starts[0]
+        return (len(self._frame_starts) - 1) / elapsed if elapsed > 0 else 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        """Target and achieved frame rate and frame counts"""
+        return {
+            "target_fps": self.fps,
+            "achieved_fps": self.achieved_fps,
+            "last_render_time": self.last_render_time,
+            "n_rendered": self.n_rendered,
+            "n_dropped": self.n_dropped,
+        }
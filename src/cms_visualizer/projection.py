@@ -0,0 +1,186 @@
+from __future__ import annotations
+from typing import Optional, Tuple
+import numpy as np
+from .geometry import Rects, SceneGeometry
+from .trajectory import TrajectorySource
+
+
+class ScreenProjection:
+    # Runs whose screen coordinates would take more memory are projected per request instead
+    MAX_CACHED_BYTES = 256 << 20
+
+    def __init__(self, trajectories: TrajectorySource, geometry: SceneGeometry, radius: np.ndarray,
+                 max_cached_bytes: Optional[int] = None) -> None:
+        """Snapped screen coordinates of all pedestrians at all steps
+
+        The positions of all available steps are converted to the top left corners of their
+        grid cells on the canvas in one vectorized pass, so drawing, hit-testing and the
+        trajectories of a step only slice precomputed arrays. Steps that become available
+        later, e.g. while a simulation is still loading, are converted when first requested.
+        A projection is only valid for the canvas and cell size of its geometry.
+
+        If the coordinates of the whole run would exceed the cache limit, e.g. for a run
+        read in chunks, nothing is cached and every request projects just the requested
+        steps, still in a single vectorized call.
+
+        Args:
+            trajectories (TrajectorySource): Positions of the pedestrians
+            geometry (SceneGeometry): Placement on the canvas
+            radius (np.ndarray): Radius per pedestrian
+            max_cached_bytes (Optional[int]): Cache limit, MAX_CACHED_BYTES by default. Lower it
+                to share the limit between several projections.
+        """
+        self.trajectories = trajectories
+        self.geometry = geometry
+        self.max_cached_bytes = self.MAX_CACHED_BYTES if max_cached_bytes is None else max_cached_bytes
+        self.sizes = geometry.sizes(radius).astype(np.float32)
+        self._half_cell = np.array([geometry.cell_width, geometry.cell_height], dtype=np.float32) / 2
+        self._step_bytes = trajectories.n_pedestrians * 2 * np.dtype(np.float32).itemsize
+        self._points = np.empty((0, trajectories.n_pedestrians, 2), dtype=np.float32)
+        self._n_converted = 0
+        self._extend(len(trajectories))
+
+    @property
+    def cached(self) -> bool:
+        """True if the screen coordinates of the run are kept"""
+        return self._points is not None
+
+    @property
+    def points(self) -> np.ndarray:
+        """Top left corners of shape (n_steps, n_pedestrians, 2) for the converted steps"""
+        if not self.cached:
+            return self.geometry.points(self.trajectories.get_steps(0, len(self.trajectories))).astype(np.float32)
+        return self._points[:self._n_converted]
+
+    def _extend(self, n_steps: int) -> None:
+        n_steps = min(n_steps, len(self.trajectories))
+        if not self.cached or n_steps <= self._n_converted:
+            return
+        if n_steps * self._step_bytes > self.max_cached_bytes:
+            self._points = None
+            return
+        if n_steps > self._points.shape[0]:
+            capacity = min(2 * self._points.shape[0], self.max_cached_bytes // max(self._step_bytes, 1))
+            points = np.empty((max(n_steps, capacity),) + self._points.shape[1:], dtype=np.float32)
+            points[:self._n_converted] = self.points
+            self._points = points
+        positions = self.trajectories.get_steps(self._n_converted, n_steps)
+        self._points[self._n_converted:n_steps] = self.geometry.points(positions)
+        self._n_converted = n_steps
+
+    def step(self, step: int) -> np.ndarray:
+        """Top left corners of shape (n_pedestrians, 2) at a step
+
+        Raises:
+            IndexError: Raised if the step is not available
+        """
+        self._extend(step + 1)
+        if not self.cached:
+            return self.geometry.points(self.trajectories.get_step(step)).astype(np.float32)
+        if not 0 <= step < self._n_converted:
+            raise IndexError("Step {} is out of range".format(step))
+        return self._points[step]
+
+    def present(self, step: int) -> Optional[np.ndarray]:
+        """Which pedestrians are present at a step
+
+        Returns:
+            Optional[np.ndarray]: Boolean array of shape (n_pedestrians,), None if the trajectories
+            hold every pedestrian at every step
+        """
+        if not self.trajectories.sparse:
+            return None
+        return self.trajectories.presence(step, step + 1)[0]
+
+    def rects(self, step: int, pedestrians=slice(None)) -> Rects:
+        """Rectangles of pedestrians at a step
+
+        Args:
+            step (int): Simulation step
+            pedestrians: Indices of the pedestrians, all by default
+
+        Returns:
+            Rects: x, y, width and height arrays, in the order of the pedestrians
+        """
+        points = self.step(step)[pedestrians]
+        sizes = self.sizes[pedestrians]
+        return points[:, 0], points[:, 1], sizes[:, 0], sizes[:, 1]
+
+    def changes(self, previous: int, step: int) -> Tuple[Rects, np.ndarray]:
+        """What to clear and repaint to turn the pedestrians drawn at one step into those of another
+
+        Pedestrians cover whole grid cells. The rectangles of pedestrians that moved, left or
+        entered are cleared at their old place; the pedestrians to repaint are those present
+        at ``step`` that moved or entered, or that cover a cleared cell. The cleared cells are
+        rasterized with a difference array, and every rectangle is tested against them with a
+        summed-area table, so the cost is O(n_pedestrians + n_cells).
+
+        Args:
+            previous (int): Step that is drawn
+            step (int): Step to draw
+
+        Returns:
+            Tuple[Rects, np.ndarray]: Rectangles to clear, and the indices of the pedestrians to
+            repaint in ascending order
+        """
+        old, new = self.step(previous), self.step(step)
+        old_present, new_present = self.present(previous), self.present(step)
+        if old_present is None:
+            old_present = new_present = np.ones(len(new), dtype=bool)
+        moved = np.any(old != new, axis=1) | (old_present != new_present)
+        vacated = moved & old_present & np.all(self.sizes > 0, axis=1)
+
+        cell = np.array([self.geometry.cell_width, self.geometry.cell_height], dtype=np.float64)
+        n_columns, n_rows = (-(-np.array([self.geometry.canvas_width, self.geometry.canvas_height]) // cell)).astype(np.int64)
+
+        def cell_ranges(points, sizes):
+            # First and after-last cell column and row of rectangles, clipped to the canvas
+            first = np.round(points / cell).astype(np.int64)
+            last = first + np.round(sizes / cell).astype(np.int64)
+            return np.clip(first, 0, [n_columns, n_rows]), np.clip(last, 0, [n_columns, n_rows])
+
+        first, last = cell_ranges(old[vacated], self.sizes[vacated])
+        difference = np.zeros((n_rows + 1, n_columns + 1), dtype=np.int64)
+        for rows, columns, sign in ((first[:, 1], first[:, 0], 1), (first[:, 1], last[:, 0], -1),
+                                    (last[:, 1], first[:, 0], -1), (last[:, 1], last[:, 0], 1)):
+            np.add.at(difference, (rows, columns), sign)
+        cleared = np.cumsum(np.cumsum(difference, axis=0), axis=1) > 0
+        table = np.zeros((n_rows + 1, n_columns + 1), dtype=np.int64)
+        table[1:, 1:] = np.cumsum(np.cumsum(cleared[:-1, :-1], axis=0), axis=1)
+        first, last = cell_ranges(new, self.sizes)
+        covered = (table[last[:, 1], last[:, 0]] - table[first[:, 1], last[:, 0]] -
+                   table[last[:, 1], first[:, 0]] + table[first[:, 1], first[:, 0]])
+        repaint = np.flatnonzero(new_present & (moved | (covered > 0)))
+        rects = old[vacated], self.sizes[vacated]
+        return (rects[0][:, 0], rects[0][:, 1], rects[1][:, 0], rects[1][:, 1]), repaint
+
+    def centers(self, start: int, stop: int) -> np.ndarray:
+        """Centers of the grid cells of shape (stop - start, n_pedestrians, 2)"""
+        self._extend(stop)
+        if not self.cached:
+            centers = self.geometry.points(self.trajectories.get_steps(start, stop)).astype(np.float32) + self._half_cell
+        else:
+            centers = self._points[start:min(stop, self._n_converted)] + self._half_cell
+        return centers
+
+    def segments(self, start: int, stop: int) -> np.ndarray:
+        """Polylines through the cell centers from step ``start`` to step ``stop`` (inclusive) of every pedestrian
+
+        Args:
+            start (int): First step
+            stop (int): Last step
+
+        For runs in which pedestrians enter and leave, the polylines are broken where a
+        pedestrian is absent: only the segments between two steps at which it is present are
+        returned, each as a polyline of two points.
+
+        Returns:
+            np.ndarray: Array of shape (n_pedestrians, stop - start + 1, 2), or (n_segments, 2, 2)
+            for sparse runs, that can be passed to Canvas.stroke_line_segments as is
+        """
+        centers = self.centers(start, stop + 1)
+        if not self.trajectories.sparse:
+            return np.ascontiguousarray(centers.transpose(1, 0, 2))
+        present = self.trajectories.presence(start, start + len(centers))
+        both = present[:-1] & present[1:]
+        return np.stack([centers[:-1][both], centers[1:][both]], axis=1)
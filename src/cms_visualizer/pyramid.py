@@ -0,0 +1,229 @@
+from __future__ import annotations
+from typing import List, Optional, Sequence, Tuple
+import numpy as np
+from .simulation import Simulation
+
+# Default memory taken while building a pyramid in bytes
+DEFAULT_MEMORY_BUDGET = 64 << 20
+# Temporaries per pedestrian and step while reading a block, i.e. the positions, their cells and bin indices
+_READ_BYTES_PER_POSITION = 64
+
+
+class TemporalPyramid:
+    def __init__(self, strides: Sequence[int], positions: Sequence[np.ndarray], densities: Sequence[np.ndarray],
+                 presence: Optional[Sequence[np.ndarray]], n_steps: int) -> None:
+        """Coarse versions of a run for previews, e.g. while scrubbing through it
+
+        Level ``i`` decimates the run to every ``strides[i]``-th step: it holds the positions
+        at those steps and, per block of ``strides[i]`` steps starting at them, the mean
+        number of pedestrians in every topography cell. Levels are ordered from the finest
+        to the coarsest. Build a pyramid with ``build`` and keep it next to the run with
+        ``save`` and ``load``.
+
+        Args:
+            strides (Sequence[int]): Number of steps per block of every level, ascending
+            positions (Sequence[np.ndarray]): Positions of shape (n_blocks, n_pedestrians, 2) per level
+            densities (Sequence[np.ndarray]): Mean counts of shape (n_blocks, height, width) per level
+            presence (Optional[Sequence[np.ndarray]]): Presence of shape (n_blocks, n_pedestrians) per
+                level for runs in which pedestrians enter and leave, otherwise None
+            n_steps (int): Number of steps of the run
+
+        Raises:
+            ValueError: Raised if the levels do not fit together
+        """
+        if not len(strides) == len(positions) == len(densities) or (presence is not None and
+                                                                  len(presence) != len(strides)):
+            raise ValueError("Every level needs a stride, positions and densities")
+        for i, stride in enumerate(strides):
+            n_blocks = -(-n_steps // stride)
+            if len(positions[i]) != n_blocks or len(densities[i]) != n_blocks:
+                raise ValueError("Level {} must have {} blocks".format(i, n_blocks))
+        self.strides = [int(stride) for stride in strides]
+        self.positions = list(positions)
+        self.densities = list(densities)
+        self.presence = None if presence is None else list(presence)
+        self.n_steps = n_steps
+
+    @classmethod
+    def build(cls, simulation: Simulation, base: int = 4, memory_budget: int = DEFAULT_MEMORY_BUDGET,
+              block_steps: int = 1024) -> TemporalPyramid:
+        """Read a run once and build its pyramid
+
+        The strides are the powers of ``base`` below the number of steps. Levels are kept
+        from the coarsest one on as long as all of them, together with the temporaries of
+        reading a block of steps, fit into ``memory_budget``, so the finest levels of long
+        runs are left out.
+
+        Args:
+            simulation (Simulation): Simulation to decimate, only the steps loaded so far are used
+            base (int): Factor between the strides of two levels
+            memory_budget (int): Maximum memory taken while building in bytes
+            block_steps (int): Maximum number of steps read at once
+
+        Returns:
+            TemporalPyramid:
+        """
+        trajectories = simulation.trajectories
+        topography = simulation.topography
+        n_steps = len(trajectories)
+        n_pedestrians = trajectories.n_pedestrians
+        shape = (int(np.ceil(topography.height)), int(np.ceil(topography.width)))
+        dtype = trajectories.get_steps(0, 0).dtype
+        n_cells = shape[0] * shape[1]
+        # Fewer steps are read at once if their temporaries would take more than a quarter of the budget
+        block_steps = max(1, min(block_steps, memory_budget // 4 // max(n_pedestrians * _READ_BYTES_PER_POSITION, 1)))
+        strides: List[int] = []
+        used = 0
+        stride = base
+        candidates = []
+        while stride < n_steps:
+            candidates.append(stride)
+            stride *= base
+        for stride in reversed(candidates):
+            n_blocks = -(-n_steps // stride)
+            # Counts take 4 bytes per cell and become the densities in place
+            level_bytes = n_blocks * (n_cells * 4 + n_pedestrians * (2 * dtype.itemsize + trajectories.sparse))
+            # Reading a block needs temporaries for its positions and for the counts of the finest level
+            read_steps = min(block_steps, n_steps)
+            read_rows = min(-(-read_steps // stride) + 1, n_blocks)
+            read_bytes = read_steps * n_pedestrians * _READ_BYTES_PER_POSITION + read_rows * n_cells * 8
+            if used + level_bytes + read_bytes > memory_budget:
+                break
+            used += level_bytes
+            strides.insert(0, stride)
+
+        n_blocks = [-(-n_steps // stride) for stride in strides]
+        positions = [np.zeros((n, n_pedestrians, 2), dtype=dtype) for n in n_blocks]
+        counts = [np.zeros((n, n_cells), dtype=np.int32) for n in n_blocks]
+        presence = [np.zeros((n, n_pedestrians), dtype=bool) for n in n_blocks] if trajectories.sparse else None
+        if strides:
+            for start in range(0, n_steps, block_steps):
+                stop = min(start + block_steps, n_steps)
+                steps = trajectories.get_steps(start, stop)
+                present = trajectories.presence(start, stop)
+                cells = _cells(steps, present, shape)
+                # Cell counts per block of the finest level, summed into the coarser ones. Blocks
+                # cut by the ends of the read block are completed by the neighbouring reads
+                first_block = start // strides[0]
+                n_rows = (stop - 1) // strides[0] - first_block + 1
+                rows = np.repeat(np.arange(start, stop) // strides[0] - first_block, n_pedestrians)
+                inside = cells.reshape(-1) >= 0
+                finest = np.bincount(rows[inside] * n_cells + cells.reshape(-1)[inside],
+                                     minlength=n_rows * n_cells).reshape(n_rows, n_cells)
+                first_steps = (first_block + np.arange(n_rows)) * strides[0]
+                for level, stride in enumerate(strides):
+                    np.add.at(counts[level], first_steps // stride, finest)
+                    decimated = np.arange(-(-start // stride) * stride, stop, stride)
+                    positions[level][decimated // stride] = steps[decimated - start]
+                    if presence is not None:
+                        presence[level][decimated // stride] = present[decimated - start]
+        densities = []
+        for stride, level_counts in zip(strides, counts):
+            block_lengths = np.minimum(stride, n_steps - np.arange(len(level_counts)) * stride)
+            # Divided block by block into the memory of the counts, so no second copy of the level is made
+            level_densities = level_counts.view(np.float32)
+            for block, length in enumerate(block_lengths):
+                level_densities[block] = level_counts[block] / length
+            densities.append(level_densities.reshape(-1, *shape))
+        return cls(strides, positions, densities, presence, n_steps)
+
+    @property
+    def nbytes(self) -> int:
+        """Memory taken by all levels"""
+        arrays = self.positions + self.densities + (self.presence or [])
+        return sum(array.nbytes for array in arrays)
+
+    def level_for(self, steps_per_frame: int) -> Optional[int]:
+        """Coarsest level that still shows every ``steps_per_frame``-th step
+
+        Args:
+            steps_per_frame (int): Number of steps between two shown frames, e.g. the distance the slider moved
+
+        Returns:
+            Optional[int]: Level index, the finest level if even its stride is larger, None if
+            ``steps_per_frame`` is smaller than the finest stride or there are no levels
+        """
+        if not self.strides or steps_per_frame < self.strides[0]:
+            return None
+        return int(np.searchsorted(self.strides, steps_per_frame, side='right')) - 1
+
+    def block(self, level: int, step: int) -> Tuple[int, int]:
+        """Block of a level that contains a step
+
+        Args:
+            level (int): Level index
+            step (int): Simulation step
+
+        Returns:
+            Tuple[int, int]: Block index and the step its positions were taken at
+        """
+        index = min(max(step, 0), self.n_steps - 1) // self.strides[level]
+        return index, index * self.strides[level]
+
+    def save(self, path: str) -> None:
+        """Write the pyramid to an .npz file, e.g. next to the run with path_for
+
+        Args:
+            path (str): Path of the file
+        """
+        arrays = {'strides': np.array(self.strides, dtype=np.int64), 'n_steps': np.array(self.n_steps)}
+        for level in range(len(self.strides)):
+            arrays['positions_{}'.format(level)] = self.positions[level]
+            arrays['densities_{}'.format(level)] = self.densities[level]
+            if self.presence is not None:
+                arrays['presence_{}'.format(level)] = self.presence[level]
+        with open(path, 'wb') as file:
+            np.savez(file, **arrays)
+
+    @classmethod
+    def load(cls, path: str, simulation: Optional[Simulation] = None) -> TemporalPyramid:
+        """Read a pyramid written by save
+
+        Args:
+            path (str): Path of the file
+            simulation (Optional[Simulation]): Run the pyramid is used for, checked if given
+
+        Raises:
+            ValueError: Raised if the pyramid was built from a different run
+
+        Returns:
+            TemporalPyramid:
+        """
+        with np.load(path) as arrays:
+            strides = arrays['strides'].tolist()
+            n_steps = int(arrays['n_steps'])
+            levels = range(len(strides))
+            positions = [arrays['positions_{}'.format(level)] for level in levels]
+            densities = [arrays['densities_{}'.format(level)] for level in levels]
+            presence = None
+            if strides and 'presence_0' in arrays:
+                presence = [arrays['presence_{}'.format(level)] for level in levels]
+        pyramid = cls(strides, positions, densities, presence, n_steps)
+        if simulation is not None:
+            topography = simulation.topography
+            shape = (int(np.ceil(topography.height)), int(np.ceil(topography.width)))
+            if (n_steps != len(simulation.trajectories) or
+                    any(p.shape[1] != simulation.trajectories.n_pedestrians for p in positions) or
+                    any(d.shape[1:] != shape for d in densities)):
+                raise ValueError("The pyramid in {} was built from a different run".format(path))
+        return pyramid
+
+    @staticmethod
+    def path_for(run_path: str) -> str:
+        """Path of the pyramid kept next to a run file
+
+        Args:
+            run_path (str): Path of the JSON or binary simulation file
+
+        Returns:
+            str: Path of the pyramid file
+        """
+        return run_path + '.pyramid.npz'
+
+
+def _cells(positions: np.ndarray, present: np.ndarray, shape: Tuple[int, int]) -> np.ndarray:
+    # Flat cell index per pedestrian and step, -1 outside the topography and for absent pedestrians
+    x = np.floor(positions[..., 0]).astype(np.int64)
+    y = np.floor(positions[..., 1]).astype(np.int64)
+    inside = present & (x >= 0) & (x < shape[1]) & (y >= 0) & (y < shape[0])
+    return np.where(inside, y * shape[1] + x, -1)
@@ -0,0 +1,360 @@
+from __future__ import annotations
+import os
+import shutil
+import struct
+import subprocess
+import tempfile
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+import numpy as np
+from .geometry import SceneGeometry
+from .simulation import Simulation, SimulationReconstructionException
+from .topography import Topography
+
+NAMED_COLORS = {
+    'black': (0, 0, 0),
+    'white': (255, 255, 255),
+    'red': (255, 0, 0),
+    'green': (0, 128, 0),
+    'blue': (0, 0, 255),
+    'yellow': (255, 255, 0),
+}
+
+
+def parse_color(color: str) -> Tuple[int, int, int]:
+    """Convert a CSS hex color ('#rgb' or '#rrggbb') or a basic color name to RGB
+
+    Args:
+        color (str): The color
+
+    Raises:
+        ValueError: Raised if the color is not supported
+
+    Returns:
+        Tuple[int, int, int]: Red, green and blue component
+    """
+    if color.lower() in NAMED_COLORS:
+        return NAMED_COLORS[color.lower()]
+    digits = color.lstrip('#')
+    if len(digits) == 3:
+        digits = ''.join(digit * 2 for digit in digits)
+    if not color.startswith('#') or len(digits) != 6:
+        raise ValueError("Unsupported color {}".format(color))
+    return tuple(int(digits[i:i + 2], 16) for i in (0, 2, 4))
+
+
+@dataclass
+class RenderOptions:
+    """Appearance of rendered frames, mirroring the settings of the Visualizer widget"""
+    cell_width: int
+    cell_height: int
+    canvas_width: int
+    canvas_height: int
+    show_grid: bool = True
+    show_trajectories: bool = False
+    highlighted_pedestrian: Optional[int] = None
+    color_background: str = '#ffffff'
+    color_pedestrian: str = '#ff0006'
+    color_obstacle: str = '#000000'
+    color_source: str = '#0006ff'
+    color_target: str = '#32d12e'
+    color_grid: str = '#000000'
+    color_trajectorie: str = '#ff0006'
+
+
+def fill_rects(image: np.ndarray, x, y, width, height, color: Tuple[int, int, int]) -> None:
+    """Fill rectangles of an RGB image, clipped to the image
+
+    Rectangles of the same size are filled together with one scattered assignment.
+
+    Args:
+        image (np.ndarray): Image of shape (height, width, 3)
+        x, y, width, height: Rectangles in pixels
+        color (Tuple[int, int, int]): Fill color
+    """
+    x, y, width, height = (np.broadcast_to(np.round(np.asarray(a)).astype(np.int64), np.shape(x))
+                           for a in (x, y, width, height))
+    if x.size == 0:
+        return
+    sizes = np.stack([width, height], axis=1)
+    for w, h in np.unique(sizes, axis=0):
+        if w <= 0 or h <= 0:
+            continue
+        same_size = (width == w) & (height == h)
+        dy, dx = np.mgrid[0:h, 0:w]
+        xs = (x[same_size, None] + dx.ravel()).ravel()
+        ys = (y[same_size, None] + dy.ravel()).ravel()
+        inside = (xs >= 0) & (xs < image.shape[1]) & (ys >= 0) & (ys < image.shape[0])
+        image[ys[inside], xs[inside]] = color
+
+
+def draw_segments(image: np.ndarray, start: np.ndarray, end: np.ndarray, color) -> None:
+    """Draw one pixel wide line segments into an image
+
+    Every segment is sampled once per pixel along its longer axis, all segments at once.
+
+    Args:
+        image (np.ndarray): Image of shape (height, width, 3), or a mask of shape (height, width)
+        start (np.ndarray): Start points of shape (n, 2)
+        end (np.ndarray): End points of shape (n, 2)
+        color: Line color, or True for masks
+    """
+    if len(start) == 0:
+        return
+    lengths = np.ceil(np.abs(end - start).max(axis=1)).astype(np.int64) + 1
+    segment = np.repeat(np.arange(len(start)), lengths)
+    offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    t = (offsets / np.maximum(lengths - 1, 1)[segment])[:, None]
+    points = np.floor(start[segment] + t * (end[segment] - start[segment])).astype(np.int64)
+    xs, ys = points[:, 0], points[:, 1]
+    inside = (xs >= 0) & (xs < image.shape[1]) & (ys >= 0) & (ys < image.shape[0])
+    image[ys[inside], xs[inside]] = color
+
+
+class FrameRenderer:
+    def __init__(self, simulation: Simulation, options: RenderOptions) -> None:
+        """Rasterize simulation steps into NumPy images without a Jupyter front end
+
+        Uses the same geometry as the Visualizer widget. The static background and the
+        trajectories drawn so far are kept, so rendering consecutive steps only
+        rasterizes the pedestrians and the newest trajectory segments.
+
+        Args:
+            simulation (Simulation): Simulation to render
+            options (RenderOptions): Appearance of the frames
+        """
+        self.simulation = simulation
+        self.options = options
+        self.geometry = SceneGeometry(simulation.topography, options.canvas_width, options.canvas_height,
+                                      options.cell_width, options.cell_height)
+        self._radius = np.array([pedestrian.radius for pedestrian in simulation.pedestrians])
+        self._background = self._render_background()
+        self._trajectories = np.zeros(self._background.shape[:2], dtype=bool)
+        self._trajectory_step: Optional[int] = None
+
+    def _render_background(self) -> np.ndarray:
+        options = self.options
+        image = np.empty((options.canvas_height, options.canvas_width, 3), dtype=np.uint8)
+        image[:] = parse_color(options.color_background)
+        if options.show_grid:
+            color = parse_color(options.color_grid)
+            n_rows = int(options.canvas_height / options.cell_height)
+            n_columns = int(options.canvas_width / options.cell_width)
+            rows = image[:n_rows * options.cell_height + 1, :n_columns * options.cell_width + 1]
+            rows[::options.cell_height, :] = color
+            rows[:, ::options.cell_width] = color
+        topography = self.simulation.topography
+        for objects, color in ((topography.obstacles, options.color_obstacle),
+                               (topography.targets, options.color_target),
+                               (topography.sources, options.color_source)):
+            if len(objects):
+                fill_rects(image, *self.geometry.objects(objects), parse_color(color))
+        return image
+
+    def _update_trajectories(self, step: int) -> None:
+        if self._trajectory_step is None or step < self._trajectory_step:
+            self._trajectories[:] = False
+            start = 0
+        else:
+            start = self._trajectory_step
+        if step > start:
+            trajectories = self.simulation.trajectories
+            points = self.geometry.cell_centers(trajectories.get_steps(start, step + 1))
+            begin, end = points[:-1], points[1:]
+            if trajectories.sparse:
+                # Trajectories are broken where a pedestrian is absent
+                present = trajectories.presence(start, step + 1)
+                both = present[:-1] & present[1:]
+                begin, end = begin[both], end[both]
+            draw_segments(self._trajectories, begin.reshape(-1, 2), end.reshape(-1, 2), True)
+        self._trajectory_step = step
+
+    def render(self, step: int) -> np.ndarray:
+        """Render one simulation step
+
+        Args:
+            step (int): Simulation step
+
+        Returns:
+            np.ndarray: RGB image of shape (canvas_height, canvas_width, 3)
+        """
+        options = self.options
+        image = self._background.copy()
+        trajectories = self.simulation.trajectories
+        positions = trajectories.get_step(step)
+        present = trajectories.presence(step, step + 1)[0]
+        x, y, width, height = self.geometry.pedestrians(positions, self._radius)
+        fill_rects(image, x[present], y[present], width[present], height[present], parse_color(options.color_pedestrian))
+        highlighted = options.highlighted_pedestrian
+        if highlighted is not None and present[highlighted]:
+            fill_rects(image, x[[highlighted]], y[[highlighted]], width[[highlighted]], height[[highlighted]],
+                       parse_color('yellow'))
+        if options.show_trajectories:
+            self._update_trajectories(step)
+            image[self._trajectories] = parse_color(options.color_trajectorie)
+        return image
+
+
+def write_png(path: str, image: np.ndarray) -> None:
+    """Write an RGB image as PNG
+
+    Args:
+        path (str): Path of the file
+        image (np.ndarray): Image of shape (height, width, 3) with dtype uint8
+    """
+    height, width, _ = image.shape
+    # Every scanline starts with filter type 0
+    scanlines = np.zeros((height, width * 3 + 1), dtype=np.uint8)
+    scanlines[:, 1:] = image.reshape(height, width * 3)
+
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xffffffff)
+
+    with open(path, "wb") as f:
+        f.write(b"\x89PNG\r\n\x1a\n")
+        f.write(chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)))
+        f.write(chunk(b"IDAT", zlib.compress(scanlines.tobytes(), 6)))
+        f.write(chunk(b"IEND", b""))
+
+
+def load_simulation(path: str) -> Simulation:
+    """Load a simulation from a binary or JSON file
+
+    Args:
+        path (str): Path to the file
+
+    Returns:
+        Simulation:
+    """
+    return Simulation.from_binary(path) if _is_binary(path) else Simulation.from_json(path)
+
+
+def read_topography(path: str) -> Topography:
+    """Read the topography of a binary or JSON simulation file without its positions
+
+    Only the header of binary files is read, JSON files are parsed up to the simulation
+    steps.
+
+    Args:
+        path (str): Path to the file
+
+    Raises:
+        SimulationReconstructionException: Raised if the file has no topography
+
+    Returns:
+        Topography:
+    """
+    if _is_binary(path):
+        from .binary import read_header
+        header, _ = read_header(path)
+    else:
+        from .streaming import SimulationJsonLoader
+        header = SimulationJsonLoader(path).read_header()
+    if 'topography' not in header:
+        raise SimulationReconstructionException(
+            "Object must include 'topography'")
+    return Topography.from_dict(header['topography'])
+
+
+def _is_binary(path: str) -> bool:
+    from .binary import MAGIC
+    with open(path, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def frame_path(out_dir: str, step: int) -> str:
+    return os.path.join(out_dir, "{:06d}.png".format(step))
+
+
+_worker_renderer: Optional[FrameRenderer] = None
+
+
+def _init_worker(path: str, options: RenderOptions) -> None:
+    global _worker_renderer
+    _worker_renderer = FrameRenderer(Simulation.from_binary(path), options)
+
+
+def _render_range(step_range: Tuple[int, int], out_dir: str, renderer: Optional[FrameRenderer] = None) -> List[str]:
+    renderer = renderer or _worker_renderer
+    paths = []
+    for step in range(*step_range):
+        paths.append(frame_path(out_dir, step))
+        write_png(paths[-1], renderer.render(step))
+    return paths
+
+
+def render_frames(path: str, out_dir: str, options: RenderOptions, start: int = 0, stop: Optional[int] = None,
+                  jobs: int = 1, chunk_steps: int = 256) -> List[str]:
+    """Render a range of steps of a simulation file to a PNG sequence
+
+    The steps are split into contiguous ranges that are rendered by a pool of worker
+    processes. Every worker opens the simulation once as a binary file, whose positions
+    are memory-mapped. JSON files are parsed once and converted to a temporary binary
+    file for the workers.
+
+    Args:
+        path (str): Path to a binary or JSON simulation file
+        out_dir (str): Directory the frames are written to, as 000000.png, 000001.png, ...
+        options (RenderOptions): Appearance of the frames
+        start (int): First step
+        stop (Optional[int]): Step after the last one, defaults to all steps
+        jobs (int): Number of worker processes, 1 renders in the calling process
+        chunk_steps (int): Number of consecutive steps rendered by one task
+
+    Returns:
+        List[str]: Paths of the frames in step order
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    simulation = load_simulation(path)
+    if stop is None:
+        stop = len(simulation.trajectories)
+    ranges = [(s, min(s + chunk_steps, stop)) for s in range(start, stop, chunk_steps)]
+    if jobs <= 1:
+        renderer = FrameRenderer(simulation, options)
+        return [p for step_range in ranges for p in _render_range(step_range, out_dir, renderer)]
+    with tempfile.TemporaryDirectory() as directory:
+        if not _is_binary(path):
+            path = os.path.join(directory, "simulation.bin")
+            simulation.to_binary(path)
+        del simulation
+        with ProcessPoolExecutor(jobs, initializer=_init_worker, initargs=(path, options)) as executor:
+            results = executor.map(_render_range, ranges, [out_dir] * len(ranges))
+            return [p for paths in results for p in paths]
+
+
+def encode_video(frames_dir: str, out: str, fps: int = 10) -> None:
+    """Combine a PNG sequence written by render_frames into an MP4 or GIF
+
+    Uses ffmpeg when it is on the PATH. GIFs can also be written with Pillow.
+
+    Args:
+        frames_dir (str): Directory holding the frames
+        out (str): Path of the video, ending in .mp4 or .gif
+        fps (int): Frames per second
+
+    Raises:
+        RuntimeError: Raised if no encoder is available for the requested format
+    """
+    frames = sorted(name for name in os.listdir(frames_dir) if name.endswith(".png"))
+    if not frames:
+        raise RuntimeError("{} does not contain any frames".format(frames_dir))
+    ffmpeg = shutil.which("ffmpeg")
+    if ffmpeg is not None:
+        command = [ffmpeg, "-y", "-loglevel", "error", "-framerate", str(fps),
+                   "-start_number", frames[0][:-len(".png")], "-i", os.path.join(frames_dir, "%06d.png")]
+        if out.endswith(".mp4"):
+            # yuv420p needs even dimensions
+            command += ["-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2", "-pix_fmt", "yuv420p"]
+        subprocess.run(command + [out], check=True)
+        return
+    if out.endswith(".gif"):
+        try:
+            from PIL import Image
+        except ImportError:
+            raise RuntimeError("Writing GIFs requires ffmpeg or Pillow")
+        images = [Image.open(os.path.join(frames_dir, name)) for name in frames]
+        images[0].save(out, save_all=True, append_images=images[1:], duration=int(1000 / fps), loop=0)
+        return
+    raise RuntimeError("Writing {} requires ffmpeg".format(out))
@@ -1,8 +1,16 @@
 from __future__ import annotations
 import json
-from typing import Optional, List, Text, Dict
+from typing import Optional, List, Text, Dict, Iterator, Mapping, Sequence, Tuple, TYPE_CHECKING
 from dataclasses import dataclass
+import numpy as np
 from .topography import Topography
+from .trajectory import TrajectorySource, TrajectoryStore
+from .sparse import SparseTrajectoryStore
+
+if TYPE_CHECKING:
+    from .aggregation import SimulationAggregates
+    from .kinematics import Kinematics
+    from .pyramid import TemporalPyramid
 
 
 @dataclass
@@ -21,8 +29,67 @@ class Position:
 SimulationStep = Dict[int, Position]
 
 
+class SimulationStepView(Mapping[int, Position]):
+    def __init__(self, trajectories: TrajectorySource, step: int) -> None:
+        """Read-only mapping from pedestrian id to position for one step of a trajectory source
+
+        Args:
+            trajectories (TrajectorySource): Source holding the positions
+            step (int): Step this view belongs to
+        """
+        self._trajectories = trajectories
+        self._row = trajectories.get_step(step)
+        # Only pedestrians present at the step are part of the mapping
+        self._present = trajectories.presence(step, step + 1)[0] if trajectories.sparse else None
+
+    def __getitem__(self, pedestrian_id: int) -> Position:
+        column = self._trajectories.column_of(pedestrian_id)
+        if self._present is not None and not self._present[column]:
+            raise KeyError(pedestrian_id)
+        x, y = self._row[column].tolist()
+        return Position(x, y)
+
+    def __iter__(self) -> Iterator[int]:
+        ids = self._trajectories.ids if self._present is None else self._trajectories.ids[self._present]
+        return (int(pedestrian_id) for pedestrian_id in ids)
+
+    def __len__(self) -> int:
+        return self._trajectories.n_pedestrians if self._present is None else int(self._present.sum())
+
+    def __contains__(self, pedestrian_id: object) -> bool:
+        try:
+            column = self._trajectories.column_of(pedestrian_id)
+        except (KeyError, TypeError):
+            return False
+        return self._present is None or bool(self._present[column])
+
+    def __repr__(self) -> str:
+        return repr(dict(self.items()))
+
+
+class SimulationStepsView(Sequence[SimulationStep]):
+    def __init__(self, trajectories: TrajectorySource) -> None:
+        """Read-only sequence of the simulation steps of a trajectory source
+
+        Args:
+            trajectories (TrajectorySource): Source holding the positions
+        """
+        self._trajectories = trajectories
+
+    def __getitem__(self, step):
+        if isinstance(step, slice):
+            return [self[i] for i in range(*step.indices(len(self)))]
+        if step < 0:
+            step += len(self)
+        return SimulationStepView(self._trajectories, step)
+
+    def __len__(self) -> int:
+        return len(self._trajectories)
+
+
 class Simulation:
-    def __init__(self, topography: Topography, pedestrians: List[Pedestrian], n_steps: int, simulation_steps: List[SimulationStep]) -> None:
+    def __init__(self, topography: Topography, pedestrians: List[Pedestrian], n_steps: int, simulation_steps: List[SimulationStep],
+                 trajectories: Optional[TrajectorySource] = None, sparse: bool = False) -> None:
         """Crowd simulation with topography and simulation steps 
 
         Args:
@@ -30,17 +97,32 @@ class Simulation:
             pedestrians (List[Pedestrian]): List of pedestrians participating in the simulation
             n_steps (int): Number of simulation steps
             simulation_steps (List[SimulationStep]): List of simulation steps
+            trajectories (Optional[TrajectorySource]): Already validated positions to use as storage,
+                e.g. a memory-mapped store. Defaults to an empty in-memory store.
+            sparse (bool): Allow steps without a position for every pedestrian, for runs in which
+                pedestrians enter and leave. Only the positions of present pedestrians are stored,
+                see SparseTrajectoryStore. Ignored if ``trajectories`` is given.
         """
         self.topography = topography
         self.pedestrians = pedestrians
         self.n_steps = n_steps
-        self.simulation_steps = []
+        if trajectories is None:
+            store = SparseTrajectoryStore if sparse else TrajectoryStore
+            trajectories = store(
+                [pedestrian.id for pedestrian in pedestrians], n_steps,
+                TrajectoryStore.dtype_for(topography.width, topography.height))
+        self.trajectories = trajectories
         for simulation_step in simulation_steps:
             self.add_simulation_step(simulation_step)
 
+    @property
+    def simulation_steps(self) -> SimulationStepsView:
+        """Read-only view of the simulation steps, backed by the trajectory store"""
+        return SimulationStepsView(self.trajectories)
+
     def _is_valid_simulation_step(self, simulation_step: SimulationStep) -> bool:
         """A simulation step is valid if there are positions for every defined pedestrian
-        and these positions are valid
+        (every present one for sparse simulations) and these positions are valid
 
         Args:
             simulation_step (SimulationStep): Simulation step to check
@@ -48,22 +130,99 @@ class Simulation:
         Returns:
             bool: True if the simulation step is valid
         """
-        return (
-            all([pedestrian.id in simulation_step for pedestrian in self.pedestrians]) and
-            all([self._is_valid_position(simulation_step[pedestrian.id])
-                for pedestrian in self.pedestrians])
-        )
+        _, _, violations = self._validate_steps(*self._step_to_array(simulation_step))
+        return len(violations) == 0
+
+    @staticmethod
+    def _step_to_array(simulation_step: SimulationStep) -> Tuple[np.ndarray, np.ndarray]:
+        """Convert a simulation step to a block of one step and the pedestrian id per column"""
+        ids = np.fromiter(simulation_step.keys(), dtype=np.int64, count=len(simulation_step))
+        positions = np.array([[position.x, position.y] for position in simulation_step.values()])
+        return positions.reshape(1, len(ids), 2), ids
+
+    def _validate_steps(self, steps: np.ndarray, ids: np.ndarray,
+                        present: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Check id coverage and topography bounds of a block of steps
 
-    def _is_valid_position(self, position: Position) -> bool:
-        """A position is valid if it is inside the given topography
+        Positions of ids that are not pedestrians of the simulation are ignored. A pedestrian
+        given in more than one column is offending at every step of the block.
 
         Args:
-            position (Position): Position to check
+            steps (np.ndarray): Array of shape (k, len(ids), 2)
+            ids (np.ndarray): Pedestrian id per column of ``steps``
+            present (Optional[np.ndarray]): Which columns of ``steps`` hold a position, all by default
 
         Returns:
-            [bool]: True if position is valid
+            Tuple[np.ndarray, np.ndarray, np.ndarray]: The steps and the presence in the column order of
+            the trajectory store, and the offending (step within the block, pedestrian id) pairs as
+            array of shape (m, 2). Absent pedestrians are only offending if the store is not sparse.
         """
-        return 0 <= position.x < self.topography.width and 0 <= position.y < self.topography.height
+        k = steps.shape[0]
+        n = self.trajectories.n_pedestrians
+        columns = self.trajectories.columns_of(ids)
+        known = columns >= 0
+        steps, columns = steps[:, known], columns[known]
+        if present is not None:
+            present = present[:, known]
+        unique, counts = np.unique(columns, return_counts=True)
+
+        ordered = np.zeros((k, n, 2), dtype=steps.dtype)
+        ordered[:, columns] = steps
+        ordered_present = np.zeros((k, n), dtype=bool)
+        ordered_present[:, columns] = True if present is None else present
+        x = ordered[:, :, 0]
+        y = ordered[:, :, 1]
+        # Written as a negation so that NaN coordinates are invalid as well
+        invalid = ~((0 <= x) & (x < self.topography.width) & (0 <= y) & (y < self.topography.height))
+        if self.trajectories.sparse:
+            invalid &= ordered_present
+        else:
+            invalid |= ~ordered_present
+        invalid[:, unique[counts > 1]] = True
+
+        step_indices, invalid_columns = np.nonzero(invalid)
+        violations = np.stack([step_indices, self.trajectories.ids[invalid_columns]], axis=1)
+        return ordered, ordered_present, violations
+
+    def _append(self, ordered: np.ndarray, present: np.ndarray) -> None:
+        if present.all():
+            self.trajectories.append(ordered)
+        else:
+            self.trajectories.append(ordered, present)
+
+    def add_simulation_steps(self, steps: np.ndarray, ids: Optional[Sequence[int]] = None,
+                             present: Optional[np.ndarray] = None) -> None:
+        """Add a block of simulation steps
+
+        The whole block is validated with array operations before anything is added.
+
+        Args:
+            steps (np.ndarray): Positions of shape (k, n_columns, 2)
+            ids (Optional[Sequence[int]]): Pedestrian id per column of ``steps``. Defaults to
+                the order of the pedestrians of the simulation.
+            present (Optional[np.ndarray]): Which entries of ``steps`` hold a position, of shape
+                (k, n_columns). All of them by default; only sparse simulations accept absent pedestrians.
+
+        Raises:
+            CannotAddSimulationStepException: Raised if the block does not fit into the simulation
+            InvalidSimulationStepException: Raised if any step of the block is invalid, listing every
+                offending (step, pedestrian id) pair
+        """
+        steps = np.asarray(steps)
+        ids = self.trajectories.ids if ids is None else np.asarray(ids, dtype=np.int64)
+        if steps.ndim != 3 or steps.shape[1:] != (len(ids), 2):
+            raise ValueError("Steps must have shape (k, {}, 2)".format(len(ids)))
+        if len(self.trajectories) + steps.shape[0] > self.n_steps:
+            raise CannotAddSimulationStepException(steps)
+        if present is not None:
+            present = np.asarray(present, dtype=bool)
+            if present.shape != steps.shape[:2]:
+                raise ValueError("Presence must have shape {}".format(steps.shape[:2]))
+        ordered, ordered_present, violations = self._validate_steps(steps, ids, present)
+        if len(violations):
+            violations[:, 0] += len(self.trajectories)
+            raise InvalidSimulationStepException(steps, violations)
+        self._append(ordered, ordered_present)
 
     def is_simulation_complete(self) -> bool:
         """ A simulation is complete if it has n_steps simulation steps
@@ -71,7 +230,7 @@ class Simulation:
         Returns:
             [bool]: True if simulation is complete
         """
-        return len(self.simulation_steps) == self.n_steps
+        return len(self.trajectories) == self.n_steps
 
     def add_simulation_step(self, simulation_step: SimulationStep) -> None:
         """Add a simulation step
@@ -85,17 +244,25 @@ class Simulation:
         """
         if self.is_simulation_complete():
             raise CannotAddSimulationStepException(simulation_step)
-        if not self._is_valid_simulation_step(simulation_step):
-            raise InvalidSimulationStepException(simulation_step)
+        steps, ids = self._step_to_array(simulation_step)
+        ordered, present, violations = self._validate_steps(steps, ids)
+        if len(violations):
+            violations[:, 0] += len(self.trajectories)
+            raise InvalidSimulationStepException(simulation_step, violations)
 
-        self.simulation_steps.append(simulation_step)
+        self._append(ordered, present)
 
     @classmethod
-    def from_json(cls, path: str) -> Simulation:
+    def from_json(cls, path: str, keyframe_interval: Optional[int] = None) -> Simulation:
         """Instantiate a simulation from a JSON file
 
+        The simulation steps are parsed and validated one at a time. Use
+        SimulationJsonLoader directly to load large files in the background.
+
         Args:
             path (str): Path to the JSON file
+            keyframe_interval (Optional[int]): If given, the positions are stored delta-encoded
+                with a keyframe every this many steps, see delta_encoded
 
         Raises:
             SimulationReconstructionException: Raised if the simulation could not be reconstructed 
@@ -103,27 +270,72 @@ class Simulation:
         Returns:
             Simulation: 
         """
-        with open(path) as f:
-            data = json.load(f)
-        topography = Topography.from_dict(data['topography'])
-
-        if 'pedestrians' not in data:
-            raise SimulationReconstructionException(
-                "Object must include 'pedestrians'")
-        pedestrians = [Pedestrian(o["id"], o.get("radius", 1), o.get("label", None))
-                       for o in data['pedestrians']]
-        if 'n_steps' not in data:
-            raise SimulationReconstructionException(
-                "Object must include 'n_steps'")
-        if 'simulation_steps' not in data:
-            raise SimulationReconstructionException(
-                "Object must include 'simulation_steps'")
-        simulation_steps: List[SimulationStep] = []
-        for step in data['simulation_steps']:
-            simulation_steps.append({
-                pp["id"]: Position(*pp["position"]) for pp in step["pedestrian_positions"]
-            })
-        return Simulation(topography, pedestrians, data['n_steps'], simulation_steps)
+        from .streaming import SimulationJsonLoader
+        return SimulationJsonLoader(path, keyframe_interval=keyframe_interval).load()
+
+    def delta_encoded(self, keyframe_interval: int = 64) -> Simulation:
+        """Copy of the simulation with delta-encoded positions
+
+        Every ``keyframe_interval``-th step is stored as is, the others as int8 differences
+        to the step before (rare larger moves as escapes), which takes about half the
+        memory of the plain int16 store. to_binary keeps the encoding.
+
+        Args:
+            keyframe_interval (int): Number of steps between two keyframes, the upper bound
+                of deltas summed to access a step
+
+        Raises:
+            ValueError: Raised if a coordinate is not an integer or the simulation is sparse
+
+        Returns:
+            Simulation: Simulation sharing topography and pedestrians with this one
+        """
+        from .codec import DeltaTrajectoryStore
+        trajectories = DeltaTrajectoryStore.encode(self.trajectories, keyframe_interval)
+        return Simulation(self.topography, self.pedestrians, self.n_steps, [], trajectories)
+
+    def aggregate(self, memory_budget: int = 256 << 20) -> SimulationAggregates:
+        """Cumulative cell visits and source/target flows of the steps loaded so far
+
+        Reads the run once. Densities, visit counts and inflow/outflow counts of any range
+        of steps are then answered from the cumulative tables, see SimulationAggregates.
+
+        Args:
+            memory_budget (int): Maximum size of the visit table kept in memory, in bytes; the
+                rest is written to temporary files
+
+        Returns:
+            SimulationAggregates:
+        """
+        from .aggregation import SimulationAggregates
+        return SimulationAggregates(self, memory_budget)
+
+    def kinematics(self) -> Kinematics:
+        """Velocity, speed, heading, path length and time to target of every pedestrian and step
+
+        Computed for the steps loaded so far in one pass, call update on the result to add
+        steps loaded later. See PedestrianTrack for looking up single pedestrians.
+
+        Returns:
+            Kinematics:
+        """
+        from .kinematics import Kinematics
+        kinematics = Kinematics(self)
+        kinematics.update()
+        return kinematics
+
+    def temporal_pyramid(self, base: int = 4, memory_budget: int = 64 << 20) -> TemporalPyramid:
+        """Decimated steps and block densities of the steps loaded so far, for coarse previews
+
+        Args:
+            base (int): Factor between the strides of two levels
+            memory_budget (int): Maximum memory taken while building in bytes
+
+        Returns:
+            TemporalPyramid: Pyramid that can be kept next to the run with TemporalPyramid.save
+        """
+        from .pyramid import TemporalPyramid
+        return TemporalPyramid.build(self, base, memory_budget)
 
     def to_json(self, path: str) -> None:
         """Serialize the simulation to a JSON file
@@ -131,30 +343,86 @@ class Simulation:
         Args:
             path (str): Path to the JSON file
         """
+        ids = self.trajectories.ids
+        simulation_steps = []
+        for i in range(len(self.trajectories)):
+            # Sparse simulations only list the pedestrians present at a step
+            present = self.trajectories.presence(i, i + 1)[0]
+            simulation_steps.append({
+                "step": i,
+                "pedestrian_positions": [
+                    {
+                        "id": key,
+                        "position": position
+                    } for key, position in zip(ids[present].tolist(), self.trajectories.get_step(i)[present].tolist())
+                ]
+            })
         d = {
             "topography": self.topography.to_dict(),
             "pedestrians": [vars(pedestrian) for pedestrian in self.pedestrians],
             "n_steps": self.n_steps,
-            "simulation_steps": [
-                {
-                    "step": i,
-                    "pedestrian_positions": [
-                        {
-                            "id": key,
-                            "position": [simulation_step[key].x, simulation_step[key].y]
-                        } for key in simulation_step.keys()
-                    ]
-                }
-                for i, simulation_step in enumerate(self.simulation_steps)
-            ]
         }
+        if self.trajectories.sparse:
+            d["sparse"] = True
+        d["simulation_steps"] = simulation_steps
         with open(path, "w+") as f:
             json.dump(d, f, indent=4)
 
+    @classmethod
+    def from_binary(cls, path: str, chunk_steps: Optional[int] = None,
+                    memory_budget: int = 256 << 20) -> Simulation:
+        """Open a simulation from a binary file written by to_binary
+
+        Opening is independent of the length of the run: the positions are memory-mapped
+        and only read when a step is accessed. For runs larger than memory, pass
+        ``chunk_steps`` to read blocks of steps on demand into a cache of at most
+        ``memory_budget`` bytes, with the next block read ahead in the background.
+
+        Args:
+            path (str): Path to the binary file
+            chunk_steps (Optional[int]): Number of steps read at once, memory-map if not given
+            memory_budget (int): Maximum size of the cached steps in bytes
+
+        Raises:
+            SimulationReconstructionException: Raised if the simulation could not be reconstructed 
+
+        Returns:
+            Simulation: 
+        """
+        from .binary import read_binary
+        return read_binary(path, chunk_steps, memory_budget)
+
+    def to_binary(self, path: str) -> None:
+        """Serialize the simulation to the compact binary format
+
+        Delta-encoded simulations are written delta-encoded.
+
+        Args:
+            path (str): Path to the binary file
+        """
+        from .binary import write_binary
+        write_binary(self, path)
+
 
 class InvalidSimulationStepException(Exception):
-    def __init__(self, simulation_step: SimulationStep):
-        super().__init__("{} is invalid for this Topography.".format(str(simulation_step)))
+    # Number of offending pairs listed in the message
+    MAX_REPORTED_VIOLATIONS = 10
+
+    def __init__(self, simulation_step: SimulationStep, violations: Optional[np.ndarray] = None):
+        """
+        Args:
+            simulation_step (SimulationStep): The invalid step or block of steps
+            violations (Optional[np.ndarray]): Offending (step, pedestrian id) pairs of shape (m, 2)
+        """
+        self.violations = np.empty((0, 2), dtype=np.int64) if violations is None else violations
+        message = "{} is invalid for this Topography.".format(str(simulation_step))
+        if len(self.violations):
+            pairs = ", ".join("({}, {})".format(step, pedestrian_id)
+                              for step, pedestrian_id in self.violations[:self.MAX_REPORTED_VIOLATIONS].tolist())
+            if len(self.violations) > self.MAX_REPORTED_VIOLATIONS:
+                pairs += ", ..."
+            message += " {} invalid (step, pedestrian) pairs: {}".format(len(self.violations), pairs)
+        super().__init__(message)
 
 
 class CannotAddSimulationStepException(Exception):
@@ -0,0 +1,150 @@
+from __future__ import annotations
+from typing import Iterable, Optional
+import numpy as np
+from .trajectory import TrajectorySource
+
+
+class SparseTrajectoryStore(TrajectorySource):
+    sparse = True
+
+    def __init__(self, ids: Iterable[int], capacity: int = 0, dtype=np.int32) -> None:
+        """Storage for runs in which pedestrians enter and leave
+
+        Only the positions of the pedestrians present at a step are stored, step after step,
+        in one array of shape (n_entries, 2). A bitmask per step, one bit per pedestrian
+        packed with np.packbits, records who is present, and ``offsets[step]`` is the
+        index of the first position of a step. The lifetime of every pedestrian, the first
+        step it is present and the step after the last one, is kept as well.
+
+        get_steps returns dense blocks as every TrajectorySource does, with absent
+        pedestrians at (0, 0); presence tells them apart.
+
+        Args:
+            ids (Iterable[int]): Pedestrian id per column
+            capacity (int): Number of steps to reserve
+            dtype: Integer type of the stored coordinates
+        """
+        super().__init__(ids)
+        n_bytes = -(-self.n_pedestrians // 8)
+        self.mask = np.zeros((capacity, n_bytes), dtype=np.uint8)
+        self.offsets = np.zeros(capacity + 1, dtype=np.int64)
+        self.positions = np.empty((0, 2), dtype=dtype)
+        self.lifetimes = np.full((self.n_pedestrians, 2), -1, dtype=np.int64)
+        self._length = 0
+
+    @classmethod
+    def from_arrays(cls, ids: Iterable[int], mask: np.ndarray, offsets: np.ndarray, positions: np.ndarray,
+                    lifetimes: Optional[np.ndarray] = None) -> SparseTrajectoryStore:
+        """Wrap existing arrays without copying them
+
+        Args:
+            ids (Iterable[int]): Pedestrian id per column
+            mask (np.ndarray): Packed presence bits of shape (n_steps, ceil(n_pedestrians / 8))
+            offsets (np.ndarray): Index of the first position of every step, and the number of positions
+            positions (np.ndarray): Positions of the present pedestrians of shape (n_entries, 2)
+            lifetimes (Optional[np.ndarray]): First and after-last step per pedestrian, computed if not given
+
+        Raises:
+            ValueError: Raised if the arrays do not fit together
+
+        Returns:
+            SparseTrajectoryStore: Store holding all steps of ``mask``
+        """
+        store = cls(ids, 0, positions.dtype)
+        n_steps = mask.shape[0]
+        if (mask.ndim != 2 or mask.shape[1] != store.mask.shape[1] or offsets.shape != (n_steps + 1,) or
+                positions.ndim != 2 or positions.shape[0] != (offsets[-1] if len(offsets) else 0)):
+            raise ValueError("Mask, offsets and positions do not match {} pedestrians".format(store.n_pedestrians))
+        store.mask = mask
+        store.offsets = offsets
+        store.positions = positions
+        store._length = n_steps
+        if lifetimes is None:
+            store.lifetimes = _lifetimes(store.presence(0, n_steps), 0, store.lifetimes)
+        else:
+            store.lifetimes = lifetimes
+        return store
+
+    @property
+    def n_entries(self) -> int:
+        """Number of stored positions"""
+        return int(self.offsets[self._length])
+
+    @property
+    def nbytes(self) -> int:
+        """Memory taken by the stored steps"""
+        return (self.mask[:self._length].nbytes + self.offsets[:self._length + 1].nbytes +
+                self.positions[:self.n_entries].nbytes + self.lifetimes.nbytes)
+
+    def __len__(self) -> int:
+        return self._length
+
+    def presence(self, start: int, stop: int) -> np.ndarray:
+        stop = min(stop, self._length)
+        start = min(start, stop)
+        return np.unpackbits(self.mask[start:stop], axis=1, count=self.n_pedestrians).astype(bool)
+
+    def get_steps(self, start: int, stop: int) -> np.ndarray:
+        stop = min(stop, self._length)
+        start = min(start, stop)
+        present = self.presence(start, stop)
+        steps = np.zeros(present.shape + (2,), dtype=self.positions.dtype)
+        # Positions are stored in the order of a row-major walk over the mask
+        steps[present] = self.positions[self.offsets[start]:self.offsets[stop]]
+        return steps
+
+    def append(self, steps: np.ndarray, present: Optional[np.ndarray] = None) -> None:
+        """Append a block of steps
+
+        Args:
+            steps (np.ndarray): Array of shape (k, n_pedestrians, 2), already validated
+            present (Optional[np.ndarray]): Which pedestrians are present, of shape (k, n_pedestrians),
+                all of them by default. Positions of absent pedestrians are ignored.
+        """
+        steps = np.asarray(steps)
+        k = steps.shape[0]
+        present = np.ones(steps.shape[:2], dtype=bool) if present is None else np.asarray(present, dtype=bool)
+        if k == 0:
+            return
+        entries = steps[present]
+        if (self.positions.dtype.kind in 'iu' and entries.dtype.kind == 'f' and
+                not np.array_equal(entries, np.round(entries))):
+            # Fractional coordinates cannot be stored as integers
+            self.positions = self.positions.astype(np.float64)
+        if self._length + k > self.mask.shape[0]:
+            self._grow_steps(self._length + k)
+        n_entries = self.n_entries
+        if n_entries + len(entries) > self.positions.shape[0]:
+            self._grow_entries(n_entries + len(entries))
+        self.positions[n_entries:n_entries + len(entries)] = entries
+        self.mask[self._length:self._length + k] = np.packbits(present, axis=1)
+        self.offsets[self._length + 1:self._length + k + 1] = n_entries + np.cumsum(present.sum(axis=1))
+        self.lifetimes = _lifetimes(present, self._length, self.lifetimes)
+        self._length += k
+
+    def _grow_steps(self, min_capacity: int) -> None:
+        capacity = max(min_capacity, 2 * self.mask.shape[0])
+        mask = np.zeros((capacity, self.mask.shape[1]), dtype=np.uint8)
+        mask[:self._length] = self.mask[:self._length]
+        self.mask = mask
+        offsets = np.zeros(capacity + 1, dtype=np.int64)
+        offsets[:self._length + 1] = self.offsets[:self._length + 1]
+        self.offsets = offsets
+
+    def _grow_entries(self, min_capacity: int) -> None:
+        positions = np.empty((max(min_capacity, 2 * self.positions.shape[0]), 2), dtype=self.positions.dtype)
+        positions[:self.n_entries] = self.positions[:self.n_entries]
+        self.positions = positions
+
+
+def _lifetimes(present: np.ndarray, start: int, lifetimes: np.ndarray) -> np.ndarray:
+    # Widen the lifetimes by a block of presence rows starting at step ``start``
+    lifetimes = lifetimes.copy()
+    seen = present.any(axis=0)
+    first = start + np.argmax(present, axis=0)
+    last = start + present.shape[0] - np.argmax(present[::-1], axis=0)
+    new = seen & (lifetimes[:, 0] < 0)
+    lifetimes[new, 0] = first[new]
+    lifetimes[seen, 1] = last[seen]
+    return lifetimes
+
@@ -0,0 +1,61 @@
+from __future__ import annotations
+import numpy as np
+
+
+class RectangleGridIndex:
+    def __init__(self, x: np.ndarray, y: np.ndarray, width: np.ndarray, height: np.ndarray) -> None:
+        """Uniform grid of buckets over axis-aligned rectangles for point queries
+
+        The bucket size is the size of the largest rectangle, so every rectangle only
+        reaches into the bucket of its top left corner and the neighbours to the right
+        and below. A point query therefore only inspects four buckets.
+
+        Args:
+            x (np.ndarray): Left edges
+            y (np.ndarray): Top edges
+            width (np.ndarray): Widths
+            height (np.ndarray): Heights
+        """
+        n = len(x)
+        self.x = np.asarray(x, dtype=np.float64)
+        self.y = np.asarray(y, dtype=np.float64)
+        self.width = np.broadcast_to(np.asarray(width, dtype=np.float64), (n,))
+        self.height = np.broadcast_to(np.asarray(height, dtype=np.float64), (n,))
+        self.bucket_size = max(float(self.width.max(initial=0)), float(self.height.max(initial=0)), 1.0)
+        bucket_x = np.floor(self.x / self.bucket_size).astype(np.int64)
+        bucket_y = np.floor(self.y / self.bucket_size).astype(np.int64)
+        self._origin = (int(bucket_x.min(initial=0)), int(bucket_y.min(initial=0)))
+        self._n_rows = int(bucket_y.max(initial=0)) - self._origin[1] + 2
+        keys = self._key(bucket_x, bucket_y)
+        self._order = np.argsort(keys, kind='stable')
+        self._keys = keys[self._order]
+
+    def _key(self, bucket_x, bucket_y):
+        return (bucket_x - self._origin[0]) * self._n_rows + (bucket_y - self._origin[1])
+
+    def query(self, x: float, y: float) -> np.ndarray:
+        """Rectangles that contain a point strictly inside
+
+        Args:
+            x (float): x-coordinate of the point
+            y (float): y-coordinate of the point
+
+        Returns:
+            np.ndarray: Indices of the containing rectangles in ascending order
+        """
+        bucket_x = int(np.floor(x / self.bucket_size))
+        bucket_y = int(np.floor(y / self.bucket_size))
+        candidates = []
+        for bx in (bucket_x - 1, bucket_x):
+            for by in (bucket_y - 1, bucket_y):
+                if bx < self._origin[0] or not 0 <= by - self._origin[1] < self._n_rows:
+                    continue
+                key = self._key(bx, by)
+                start, stop = np.searchsorted(self._keys, [key, key + 1])
+                candidates.append(self._order[start:stop])
+        if not candidates:
+            return np.empty(0, dtype=np.int64)
+        candidates = np.concatenate(candidates)
+        hit = ((self.x[candidates] < x) & (x < self.x[candidates] + self.width[candidates]) &
+               (self.y[candidates] < y) & (y < self.y[candidates] + self.height[candidates]))
+        return np.sort(candidates[hit])
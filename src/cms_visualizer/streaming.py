@@ -0,0 +1,345 @@
+from __future__ import annotations
+import json
+import threading
+from typing import Any, Callable, Dict, IO, Iterable, Iterator, List, Optional, Tuple
+import numpy as np
+from .topography import Topography
+from .simulation import Simulation, Pedestrian, SimulationReconstructionException
+from .trajectory import TrajectoryStore
+from .codec import DeltaTrajectoryStore
+
+
+class JsonObjectStream:
+    def __init__(self, f: IO[str], streamed_keys: Tuple[str, ...] = (), chunk_size: int = 1 << 20) -> None:
+        """Incremental reader for a top level JSON object
+
+        Members are decoded one at a time. The values of ``streamed_keys`` must be
+        arrays and are returned as iterators that decode one element at a time, so
+        they never have to be held in memory as a whole.
+
+        Args:
+            f (IO[str]): File opened in text mode
+            streamed_keys (Tuple[str, ...]): Keys whose array values are streamed
+            chunk_size (int): Number of characters read from the file at once
+        """
+        self._f = f
+        self._streamed_keys = streamed_keys
+        self._chunk_size = chunk_size
+        self._decoder = json.JSONDecoder()
+        self._buffer = ""
+        self._pos = 0
+        self._eof = False
+
+    def _fill(self, size: int) -> bool:
+        if self._eof:
+            return False
+        if self._pos > self._chunk_size:
+            self._buffer = self._buffer[self._pos:]
+            self._pos = 0
+        chunk = self._f.read(size)
+        if not chunk:
+            self._eof = True
+            return False
+        self._buffer += chunk
+        return True
+
+    def _peek(self) -> str:
+        while True:
+            while self._pos < len(self._buffer) and self._buffer[self._pos] in ' \t\n\r':
+                self._pos += 1
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if not self._fill(self._chunk_size):
+                raise json.JSONDecodeError("Unexpected end of file", self._buffer, self._pos)
+
+    def _expect(self, characters: str) -> str:
+        character = self._peek()
+        if character not in characters:
+            raise json.JSONDecodeError(
+                "Expecting one of '{}'".format(characters), self._buffer, self._pos)
+        self._pos += 1
+        return character
+
+    def _decode(self) -> Any:
+        self._peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buffer, self._pos)
+            except json.JSONDecodeError:
+                # The value may continue in the part of the file that was not read yet
+                if not self._fill(max(self._chunk_size, len(self._buffer) - self._pos)):
+                    raise
+                continue
+            # A number at the end of the buffer may still be truncated
+            if end == len(self._buffer) and self._fill(self._chunk_size):
+                continue
+            self._pos = end
+            return value
+
+    def _iter_array(self) -> Iterator[Any]:
+        self._expect('[')
+        if self._peek() == ']':
+            self._pos += 1
+            return
+        while True:
+            yield self._decode()
+            if self._expect(',]') == ']':
+                return
+
+    def members(self) -> Iterator[Tuple[str, Any]]:
+        """Iterate over the members of the object
+
+        Streamed arrays that are not consumed by the caller are skipped.
+
+        Returns:
+            Iterator[Tuple[str, Any]]: Key and decoded value (or element iterator) per member
+        """
+        self._expect('{')
+        if self._peek() == '}':
+            self._pos += 1
+            return
+        while True:
+            key = self._decode()
+            self._expect(':')
+            if key in self._streamed_keys:
+                elements = self._iter_array()
+                yield key, elements
+                for _ in elements:
+                    pass
+            else:
+                yield key, self._decode()
+            if self._expect(',}') == '}':
+                return
+
+
+def _pedestrian_from_dict(d: Dict) -> Pedestrian:
+    return Pedestrian(d["id"], d.get("radius", 1), d.get("label", None))
+
+
+def _simulation_step_from_dict(d: Dict) -> Tuple[List[int], List[List[int]]]:
+    """Pedestrian ids and positions of a step dictionary, in the order of the file"""
+    pedestrian_positions = d["pedestrian_positions"]
+    return [pp["id"] for pp in pedestrian_positions], [pp["position"] for pp in pedestrian_positions]
+
+
+class SimulationJsonLoader:
+    def __init__(self, path: str, chunk_size: int = 1 << 20, progress_interval: int = 100,
+                 keyframe_interval: Optional[int] = None) -> None:
+        """Streaming loader for simulations stored with Simulation.to_json
+
+        Simulation steps are parsed one at a time and appended to the trajectory store of
+        the simulation in small blocks, so the whole file never has to be held in memory.
+        Files with ``"sparse": true`` in the header are loaded into a sparse simulation,
+        whose steps only list the pedestrians present. The flag must come before the
+        steps, unless the topography, pedestrians or number of steps come after them too.
+        The loading can run in a background thread, handing out the partially loaded
+        simulation as soon as its first steps are available.
+
+        Args:
+            path (str): Path to the JSON file
+            chunk_size (int): Number of characters read from the file at once
+            progress_interval (int): Number of steps between two progress notifications
+            keyframe_interval (Optional[int]): If given, the positions are stored delta-encoded
+                with a keyframe every this many steps, see DeltaTrajectoryStore
+        """
+        self.path = path
+        self.chunk_size = chunk_size
+        self.progress_interval = progress_interval
+        self.keyframe_interval = keyframe_interval
+        self.simulation: Optional[Simulation] = None
+        self.error: Optional[Exception] = None
+        self._progress_callbacks: List[Callable[[int], None]] = []
+        self._condition = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._preview_steps = 0
+        self._done = False
+
+    @property
+    def done(self) -> bool:
+        """True if the loading has finished, successfully or not"""
+        return self._done
+
+    @property
+    def n_loaded_steps(self) -> int:
+        """Number of simulation steps loaded so far"""
+        return 0 if self.simulation is None else len(self.simulation.simulation_steps)
+
+    def add_progress_callback(self, callback: Callable[[int], None]) -> None:
+        """Register a function that is called with the number of loaded steps while loading
+
+        Args:
+            callback (Callable[[int], None]): Progress callback
+        """
+        self._progress_callbacks.append(callback)
+
+    def read_header(self) -> Dict[str, Any]:
+        """Read the members of the file besides the simulation steps
+
+        Reading stops at the simulation steps if the topography, pedestrians and number
+        of steps come before them, otherwise the steps are skipped without being kept.
+
+        Returns:
+            Dict[str, Any]: Decoded members by key
+        """
+        header: Dict[str, Any] = {}
+        with open(self.path) as f:
+            for key, value in JsonObjectStream(f, ('simulation_steps',), self.chunk_size).members():
+                if key != 'simulation_steps':
+                    header[key] = value
+                elif self._is_complete(header):
+                    break
+        return header
+
+    def load(self) -> Simulation:
+        """Load the whole simulation in the calling thread
+
+        Raises:
+            SimulationReconstructionException: Raised if the simulation could not be reconstructed
+
+        Returns:
+            Simulation: The loaded simulation
+        """
+        self._run()
+        if self.error is not None:
+            raise self.error
+        return self.simulation
+
+    def start(self, preview_steps: int = 1) -> Simulation:
+        """Load the simulation in a background thread
+
+        Blocks until the first ``preview_steps`` steps are loaded (or the file has been
+        read completely) and returns the partially loaded simulation. The remaining
+        steps keep being appended while the simulation is in use.
+
+        Args:
+            preview_steps (int): Number of steps to wait for
+
+        Raises:
+            SimulationReconstructionException: Raised if the simulation could not be reconstructed
+
+        Returns:
+            Simulation: The partially loaded simulation
+        """
+        self._preview_steps = preview_steps
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        with self._condition:
+            self._condition.wait_for(
+                lambda: self._done or self.n_loaded_steps >= preview_steps)
+        if self.error is not None:
+            raise self.error
+        return self.simulation
+
+    def join(self) -> Simulation:
+        """Wait for a background load to finish
+
+        Raises:
+            SimulationReconstructionException: Raised if the simulation could not be reconstructed
+
+        Returns:
+            Simulation: The completely loaded simulation
+        """
+        if self._thread is not None:
+            self._thread.join()
+        if self.error is not None:
+            raise self.error
+        return self.simulation
+
+    def _notify(self) -> None:
+        with self._condition:
+            self._condition.notify_all()
+        for callback in self._progress_callbacks:
+            callback(self.n_loaded_steps)
+
+    def _run(self) -> None:
+        try:
+            with open(self.path) as f:
+                self._read(JsonObjectStream(f, ('simulation_steps',), self.chunk_size))
+        except Exception as e:
+            self.error = e
+        finally:
+            self._done = True
+            self._notify()
+
+    def _read(self, stream: JsonObjectStream) -> None:
+        header: Dict[str, Any] = {}
+        buffered_steps: Optional[List[Dict]] = None
+        for key, value in stream.members():
+            if key != 'simulation_steps':
+                if key == 'sparse' and self.simulation is not None and bool(value) != self.simulation.trajectories.sparse:
+                    # The steps were already streamed into a dense simulation
+                    raise SimulationReconstructionException(
+                        "'sparse' must come before 'simulation_steps'")
+                header[key] = value
+            elif self._is_complete(header):
+                self._create_simulation(header)
+                self._add_steps(value)
+            else:
+                # Header members after the steps, the steps cannot be validated yet
+                buffered_steps = list(value)
+        if self.simulation is None:
+            self._create_simulation(header)
+            if buffered_steps is None:
+                raise SimulationReconstructionException(
+                    "Object must include 'simulation_steps'")
+            self._add_steps(buffered_steps)
+
+    def _add_steps(self, steps: Iterable[Dict]) -> None:
+        # Consecutive steps listing the pedestrians in the same order are validated and
+        # appended as one block
+        block_ids: Optional[List[int]] = None
+        block: List[List[List[int]]] = []
+        for step in steps:
+            ids, positions = _simulation_step_from_dict(step)
+            if block and ids != block_ids:
+                self._flush(block, block_ids)
+            block_ids = ids
+            block.append(positions)
+            n_loaded_steps = self.n_loaded_steps + len(block)
+            if n_loaded_steps % self.progress_interval == 0 or n_loaded_steps == self._preview_steps:
+                self._flush(block, block_ids)
+                self._notify()
+        if block:
+            self._flush(block, block_ids)
+
+    def _flush(self, block: List[List[List[int]]], ids: List[int]) -> None:
+        if not ids:
+            steps = np.zeros((len(block), 0, 2))
+        else:
+            try:
+                steps = np.array(block)
+            except ValueError:
+                # Positions of different lengths
+                steps = None
+            if steps is None or steps.shape != (len(block), len(ids), 2):
+                raise SimulationReconstructionException(
+                    "Pedestrian positions must consist of two coordinates")
+        self.simulation.add_simulation_steps(steps, ids)
+        block.clear()
+
+    @staticmethod
+    def _is_complete(header: Dict[str, Any]) -> bool:
+        return all(key in header for key in ('topography', 'pedestrians', 'n_steps'))
+
+    def _create_simulation(self, header: Dict[str, Any]) -> None:
+        if 'topography' not in header:
+            raise SimulationReconstructionException(
+                "Object must include 'topography'")
+        topography = Topography.from_dict(header['topography'])
+        if 'pedestrians' not in header:
+            raise SimulationReconstructionException(
+                "Object must include 'pedestrians'")
+        pedestrians = [_pedestrian_from_dict(o) for o in header['pedestrians']]
+        if 'n_steps' not in header:
+            raise SimulationReconstructionException(
+                "Object must include 'n_steps'")
+        sparse = bool(header.get('sparse', False))
+        trajectories = None
+        if self.keyframe_interval is not None:
+            if sparse:
+                raise SimulationReconstructionException(
+                    "Sparse simulations cannot be delta-encoded")
+            trajectories = DeltaTrajectoryStore(
+                [pedestrian.id for pedestrian in pedestrians], header['n_steps'], self.keyframe_interval,
+                TrajectoryStore.dtype_for(topography.width, topography.height))
+        self.simulation = Simulation(topography, pedestrians, header['n_steps'], [], trajectories, sparse)
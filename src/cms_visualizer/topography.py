@@ -1,8 +1,9 @@
 from __future__ import annotations
-from typing import List, Tuple, Iterable, Set, Dict, Any
+from typing import List, Tuple, Iterable, Iterator, Set, Dict, Any, Optional, Mapping, Sequence, Type
 from abc import ABC, abstractclassmethod
 from dataclasses import dataclass, field
 from enum import Enum
+import numpy as np
 
 
 class TopographyObjectType(Enum):
@@ -26,9 +27,20 @@ class TopographyObject(ABC):
         raise NotImplementedError(
             "TopographyObject must implment get_max_coordinates()")
 
+    def __setattr__(self, name: str, value: Any) -> None:
+        super().__setattr__(name, value)
+        # Tables holding the object are told about the change, see TopographyObjectTable
+        for table, index in self.__dict__.get('_tables', ()):
+            table._changed(index)
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # Copies do not belong to the tables of the original
+        return {key: value for key, value in self.__dict__.items() if key != '_tables'}
+
     def to_dict(self) -> Dict[str, Any]:
         return {
-            key: getattr(self, key) if key != 'type' else self.type.name for key in self.__dict__
+            key: getattr(self, key) if key != 'type' else self.type.name
+            for key in self.__dict__ if not key.startswith('_')
         }
 
 
@@ -84,11 +96,145 @@ obstacles_class_mapping = {
 }
 
 
+# Columns of a rectangular object table, in the order of the dictionary representation
+COLUMNS = ('id', 'x', 'y', 'width', 'height')
+
+
+class TopographyObjectTable(Sequence):
+    def __init__(self, object_class: Type[RectangularTopographyObject], ids=(), x=(), y=(),
+                 width=(), height=()) -> None:
+        """Rectangular topography objects of one category stored as columns
+
+        Objects are kept as one array per attribute, with spare capacity that doubles when
+        it runs out, so objects added one at a time cost amortized O(1). The object instances
+        are only created when an element is accessed and are kept from then on. Objects tell
+        the tables holding them when an attribute is set, so ``columns`` only copies the
+        objects changed since the last call and ``version`` grows with every change. Objects
+        passed to ``extend`` are kept as they are.
+
+        Args:
+            object_class (Type[RectangularTopographyObject]): Class of the materialized objects
+            ids: Object ids
+            x: x-coordinates of the lower corners
+            y: y-coordinates of the lower corners
+            width: Widths
+            height: Heights
+        """
+        self.object_class = object_class
+        # Buffers whose first _length entries hold the objects
+        self._columns: Dict[str, np.ndarray] = {
+            'id': np.array(ids, dtype=np.int64).reshape(-1),
+            **{name: np.array(values).reshape(-1) for name, values in zip(COLUMNS[1:], (x, y, width, height))}
+        }
+        self._length = len(self._columns['id'])
+        self._objects: Dict[int, TopographyObject] = {}
+        # Indices of the objects changed since their attributes were last copied into the columns
+        self._dirty: Set[int] = set()
+        self.version = 0
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("Topography object index out of range")
+        obj = self._objects.get(index)
+        if obj is None:
+            obj = self.object_class(*(self._columns[name][index].item() for name in COLUMNS))
+            self._hold(index, obj)
+        return obj
+
+    def _hold(self, index: int, obj: TopographyObject) -> None:
+        self._objects[index] = obj
+        obj.__dict__.setdefault('_tables', []).append((self, index))
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        # Copied objects do not know their tables, see TopographyObject.__getstate__
+        self.__dict__.update(state)
+        for index, obj in self._objects.items():
+            obj.__dict__.setdefault('_tables', []).append((self, index))
+
+    def _changed(self, index: int) -> None:
+        self._dirty.add(index)
+        self.version += 1
+
+    def __iter__(self) -> Iterator[TopographyObject]:
+        return (self[i] for i in range(len(self)))
+
+    @property
+    def ids(self) -> np.ndarray:
+        return self._columns['id'][:self._length]
+
+    def columns(self) -> Dict[str, np.ndarray]:
+        """Attribute arrays of all objects, including changes to materialized objects
+
+        Returns:
+            Dict[str, np.ndarray]: One array per name in COLUMNS
+        """
+        for index in self._dirty:
+            obj = self._objects[index]
+            min_x, min_y = obj.get_min_coordinates()
+            max_x, max_y = obj.get_max_coordinates()
+            for name, value in zip(COLUMNS, (obj.id, min_x, min_y, max_x - min_x, max_y - min_y)):
+                if self._columns[name][index] != value:
+                    self._set(name, index, value)
+        self._dirty.clear()
+        return {name: column[:self._length] for name, column in self._columns.items()}
+
+    def _set(self, name: str, index: int, value) -> None:
+        column = self._columns[name]
+        dtype = np.result_type(column, np.asarray(value))
+        if dtype != column.dtype:
+            column = self._columns[name] = column.astype(dtype)
+        column[index] = value
+
+    def extend(self, columns: Mapping[str, np.ndarray], objects: Optional[Sequence[TopographyObject]] = None) -> None:
+        """Append objects given as columns
+
+        Args:
+            columns (Mapping[str, np.ndarray]): One array per name in COLUMNS
+            objects (Optional[Sequence[TopographyObject]]): Instances the columns were taken from
+        """
+        offset = len(self)
+        columns = {name: np.asarray(columns[name]).reshape(-1) for name in COLUMNS}
+        length = offset + len(columns['id'])
+        if length == offset:
+            return
+        capacity = len(self._columns['id'])
+        if length > capacity:
+            capacity = max(length, 2 * capacity)
+        for name in COLUMNS:
+            old = self._columns[name]
+            # An empty table takes the types of the first objects, ids are always int64
+            dtype = np.result_type(old, columns[name]) if offset else columns[name].dtype
+            if name == 'id':
+                dtype = np.dtype(np.int64)
+            if capacity != len(old) or dtype != old.dtype:
+                new = np.empty(capacity, dtype=dtype)
+                new[:offset] = old[:offset]
+                self._columns[name] = new
+            self._columns[name][offset:length] = columns[name]
+        self._length = length
+        self.version += 1
+        for i, obj in enumerate(objects or ()):
+            self._hold(offset + i, obj)
+
+    def to_dicts(self) -> List[Dict[str, Any]]:
+        """Dictionary representations of all objects, see TopographyObject.to_dict"""
+        columns = self.columns()
+        columns = [columns[name].tolist() for name in COLUMNS]
+        type_name = TopographyObjectType.RECTANGULAR.name
+        return [dict(zip(COLUMNS, values), type=type_name) for values in zip(*columns)]
+
+
 class Topography:
-    sources: List[Source]
-    targets: List[Target]
-    obstacles: List[Obstacle]
-    object_ids: Set[int]
+    sources: TopographyObjectTable
+    targets: TopographyObjectTable
+    obstacles: TopographyObjectTable
 
     def __init__(self, width: int, height: int) -> None:
         """A topography for a crowd simulation
@@ -99,31 +245,19 @@ class Topography:
         """
         self.width = width
         self.height = height
-        self.sources = []
-        self.targets = []
-        self.obstacles = []
-        self.object_ids = set([])
-
-    def _is_valid_topography_object(self, obj: TopographyObject) -> bool:
-        """A topography object is valid if it fits into the area entirely
-
-        Args:
-            obj (TopographyObject): A topography object to check
-
-        Returns:
-            bool: True if the topography object is valid
-        """
-        min_x, min_y = obj.get_min_coordinates()
-        max_x, max_y = obj.get_max_coordinates()
-
-        return (
-            0 <= min_x < self.width and
-            0 <= min_y < self.height and
-            0 <= max_x < self.width and
-            0 <= max_y < self.height and
-            max_x - min_x > 0 and
-            max_y - min_y > 0
-        )
+        self.sources = TopographyObjectTable(RectangularSource)
+        self.targets = TopographyObjectTable(RectangularTarget)
+        self.obstacles = TopographyObjectTable(RectangularObstacle)
+        self._labels: Optional[np.ndarray] = None
+        self._blocked: Optional[np.ndarray] = None
+        # Versions of the object tables the rasters were built from
+        self._raster_versions: Optional[Tuple[int, int, int]] = None
+        self._object_ids: Set[int] = set()
+
+    @property
+    def object_ids(self) -> Set[int]:
+        """Ids of all sources, targets and obstacles"""
+        return set(self._object_ids)
 
     def with_sources(self, new_sources: Iterable[Source]) -> Topography:
         """Add sources 
@@ -138,15 +272,7 @@ class Topography:
         Returns:
             Topography: Topography with updated sources
         """
-        for source in new_sources:
-            if not self._is_valid_topography_object(source):
-                raise InvalidTopographyObjectException(source)
-            if not source.id in self.object_ids:
-                self.sources.append(source)
-                self.object_ids.add(source.id)
-            else:
-                raise DuplicateTopographyObjectIdException(source.id)
-        return self
+        return self._add(self.sources, list(new_sources))
 
     def with_targets(self, new_targets: Iterable[Target]) -> Topography:
         """Add targets
@@ -161,15 +287,7 @@ class Topography:
         Returns:
             Topography: Topography with updated targets
         """
-        for target in new_targets:
-            if not self._is_valid_topography_object(target):
-                raise InvalidTopographyObjectException(target)
-            if not target.id in self.object_ids:
-                self.targets.append(target)
-                self.object_ids.add(target.id)
-            else:
-                raise DuplicateTopographyObjectIdException(target.id)
-        return self
+        return self._add(self.targets, list(new_targets))
 
     def with_obstacles(self, new_obstacles: Iterable[Obstacle]) -> Topography:
         """Add obstacles
@@ -184,16 +302,175 @@ class Topography:
         Returns:
             Topography: Topography with updated obstacles 
         """
-        for obstacle in new_obstacles:
-            if not self._is_valid_topography_object(obstacle):
-                raise InvalidTopographyObjectException(obstacle)
-            if not obstacle.id in self.object_ids:
-                self.obstacles.append(obstacle)
-                self.object_ids.add(obstacle.id)
-            else:
-                raise DuplicateTopographyObjectIdException(obstacle.id)
+        return self._add(self.obstacles, list(new_obstacles))
+
+    def _add(self, table: TopographyObjectTable, objects: List[TopographyObject]) -> Topography:
+        columns = {name: [] for name in COLUMNS}
+        for obj in objects:
+            min_x, min_y = obj.get_min_coordinates()
+            max_x, max_y = obj.get_max_coordinates()
+            for name, value in zip(COLUMNS, (obj.id, min_x, min_y, max_x - min_x, max_y - min_y)):
+                columns[name].append(value)
+        return self._add_columns(table, columns, objects)
+
+    def _add_columns(self, table: TopographyObjectTable, columns: Mapping[str, Any],
+                     objects: Optional[List[TopographyObject]] = None) -> Topography:
+        # Validates all new objects at once and adds none of them if one is invalid
+        columns = {name: np.asarray(columns[name]).reshape(-1) for name in COLUMNS}
+        ids, x, y, width, height = (columns[name] for name in COLUMNS)
+        if not all(len(column) == len(ids) for column in columns.values()):
+            raise ValueError("All columns must have the same length")
+        # An object is valid if it fits into the area entirely
+        valid = ((0 <= x) & (x < self.width) & (0 <= y) & (y < self.height) &
+                 (x + width < self.width) & (y + height < self.height) & (width > 0) & (height > 0))
+        # Duplicates of existing ids and of ids earlier in the batch
+        duplicate = np.fromiter(map(self._object_ids.__contains__, ids.tolist()), dtype=bool, count=len(ids))
+        _, first = np.unique(ids, return_index=True)
+        repeated = np.ones(len(ids), dtype=bool)
+        repeated[first] = False
+        duplicate |= repeated
+        invalid_index = np.argmin(valid) if not valid.all() else len(ids)
+        duplicate_index = np.argmax(duplicate) if duplicate.any() else len(ids)
+        if invalid_index < len(ids) and invalid_index <= duplicate_index:
+            obj = objects[invalid_index] if objects else \
+                table.object_class(*(columns[name][invalid_index].item() for name in COLUMNS))
+            raise InvalidTopographyObjectException(obj)
+        if duplicate_index < len(ids):
+            raise DuplicateTopographyObjectIdException(ids[duplicate_index].item())
+        table.extend(columns, objects)
+        self._object_ids.update(ids.tolist())
         return self
 
+    @classmethod
+    def from_arrays(cls, width: int, height: int, sources: Optional[Mapping[str, Any]] = None,
+                    targets: Optional[Mapping[str, Any]] = None,
+                    obstacles: Optional[Mapping[str, Any]] = None) -> Topography:
+        """Build a topography from columns of rectangular objects
+
+        Every category is given as a mapping from the names in COLUMNS ('id', 'x', 'y',
+        'width', 'height') to arrays with one entry per object. The objects are checked
+        with a few array operations and stored without creating an instance per object,
+        so floor plans with many thousands of obstacles are built in milliseconds.
+
+        Args:
+            width (int): width of the area
+            height (int): height of the area
+            sources (Optional[Mapping[str, Any]]): Columns of the sources
+            targets (Optional[Mapping[str, Any]]): Columns of the targets
+            obstacles (Optional[Mapping[str, Any]]): Columns of the obstacles
+
+        Raises:
+            InvalidTopographyObjectException: Raised if an object does not fit into the area
+            DuplicateTopographyObjectIdException: Raised if an object id is used more than once
+            ValueError: Raised if the columns of a category differ in length
+
+        Returns:
+            Topography: Topography holding all objects
+        """
+        topography = cls(width, height)
+        for table, columns in ((topography.sources, sources), (topography.targets, targets),
+                               (topography.obstacles, obstacles)):
+            if columns is not None:
+                topography._add_columns(table, columns)
+        return topography
+
+    def _versions(self) -> Tuple[int, int, int]:
+        return self.sources.version, self.targets.version, self.obstacles.version
+
+    def _build_rasters(self) -> None:
+        # Objects in painting order: obstacles last, so they win where objects overlap
+        tables = (self.sources, self.targets, self.obstacles)
+        columns = [table.columns() for table in tables]
+        ids, x, y, width, height = (np.concatenate([c[name] for c in columns]) for name in COLUMNS)
+        dtype = np.int32 if ids.max(initial=0) <= np.iinfo(np.int32).max else np.int64
+        shape = (int(np.ceil(self.height)), int(np.ceil(self.width)))
+        first_x = np.clip(np.floor(x), 0, shape[1]).astype(np.int64)
+        first_y = np.clip(np.floor(y), 0, shape[0]).astype(np.int64)
+        last_x = np.clip(np.ceil(x + width), 0, shape[1]).astype(np.int64)
+        last_y = np.clip(np.ceil(y + height), 0, shape[0]).astype(np.int64)
+        rects = first_x, first_y, last_x, last_y
+
+        # Rank in painting order of the object that covers each cell, -1 where there is none
+        count = _coverage(rects, np.ones(len(ids)), shape)
+        rank_sum = _coverage(rects, np.arange(1, len(ids) + 1, dtype=np.float64), shape)
+        rank = np.where(count == 1, rank_sum - 1, -1).astype(np.int64)
+        overlap = count > 1
+        if overlap.any():
+            # Objects sharing a cell with another one are expanded to their cells, found with a summed-area table
+            table = np.zeros((shape[0] + 1, shape[1] + 1), dtype=np.int64)
+            table[1:, 1:] = np.cumsum(np.cumsum(overlap, axis=0), axis=1)
+            covered = (table[last_y, last_x] - table[first_y, last_x] -
+                       table[last_y, first_x] + table[first_y, first_x])
+            objects = np.flatnonzero(covered > 0)
+            widths = last_x[objects] - first_x[objects]
+            areas = widths * (last_y[objects] - first_y[objects])
+            owner = np.repeat(np.arange(len(objects)), areas)
+            offsets = np.arange(len(owner)) - np.repeat(np.cumsum(areas) - areas, areas)
+            cells = ((first_y[objects][owner] + offsets // widths[owner]) * shape[1] +
+                     first_x[objects][owner] + offsets % widths[owner])
+            # The cells are listed in painting order, so the last object listed for a cell wins
+            cells, last = np.unique(cells[::-1], return_index=True)
+            rank.reshape(-1)[cells] = objects[owner[len(owner) - 1 - last]]
+        self._labels = np.append(ids, -1).astype(dtype)[rank]
+        self._blocked = rank >= len(ids) - len(self.obstacles)
+        self._raster_versions = self._versions()
+
+    def label_raster(self) -> np.ndarray:
+        """Id of the object covering each cell
+
+        An object covers the cells [x, x + width) x [y, y + height). Where objects overlap,
+        obstacles take precedence over targets and targets over sources. The raster is
+        built on first use and kept until objects are added or changed.
+
+        Returns:
+            np.ndarray: Array of shape (height, width) indexed by [y, x], -1 for empty cells
+        """
+        if self._raster_versions != self._versions():
+            self._build_rasters()
+        return self._labels
+
+    def blocked_raster(self) -> np.ndarray:
+        """Whether each cell is covered by an obstacle
+
+        Returns:
+            np.ndarray: Boolean array of shape (height, width) indexed by [y, x]
+        """
+        if self._raster_versions != self._versions():
+            self._build_rasters()
+        return self._blocked
+
+    def _cells(self, xs, ys) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        xs = np.floor(np.asarray(xs)).astype(np.int64)
+        ys = np.floor(np.asarray(ys)).astype(np.int64)
+        inside = (xs >= 0) & (xs < self.width) & (ys >= 0) & (ys < self.height)
+        return np.where(inside, xs, 0), np.where(inside, ys, 0), inside
+
+    def lookup(self, xs, ys) -> np.ndarray:
+        """Ids of the objects at many points at once
+
+        Args:
+            xs: x-coordinates, fractional coordinates belong to the cell they fall into
+            ys: y-coordinates of the same shape
+
+        Returns:
+            np.ndarray: Object id per point, -1 for empty cells and points outside the topography
+        """
+        xs, ys, inside = self._cells(xs, ys)
+        return np.where(inside, self.label_raster()[ys, xs], -1)
+
+    def is_blocked(self, xs, ys) -> np.ndarray:
+        """Whether points lie on an obstacle
+
+        Args:
+            xs: x-coordinates
+            ys: y-coordinates of the same shape
+
+        Returns:
+            np.ndarray: True per point inside an obstacle, False outside the topography
+        """
+        xs, ys, inside = self._cells(xs, ys)
+        return inside & self.blocked_raster()[ys, xs]
+
     @classmethod
     def from_dict(cls, d: Dict) -> Topography:
         """Instanciate a topography object from a dictionary
@@ -208,41 +485,25 @@ class Topography:
         Returns:
             Topography: 
         """
-        if 'sources' not in d:
-            raise TopographyReconstructionException(
-                "Object must include 'sources'")
-        sources = []
-        for source_dict in d['sources']:
-            if source_dict['type'] in TopographyObjectType.__members__:
-                sources.append(source_class_mapping[source_dict['type']](
-                    **{key: source_dict[key] for key in source_dict if key != 'type'}))
-            else:
-                raise UndefinedTopographyObjectType(source_dict['type'])
-        if 'targets' not in d:
-            raise TopographyReconstructionException(
-                "Object must include 'targets'")
-        targets = []
-        for target_dict in d['targets']:
-            if target_dict['type'] in TopographyObjectType.__members__:
-                targets.append(target_class_mapping[target_dict['type']](
-                    **{key: target_dict[key] for key in target_dict if key != 'type'}))
-            else:
-                raise UndefinedTopographyObjectType(target_dict['type'])
-        if 'obstacles' not in d:
-            raise TopographyReconstructionException(
-                "Object must include 'obstacles'")
-        obstacles = []
-        for obstacle_dict in d['obstacles']:
-            if obstacle_dict['type'] in TopographyObjectType.__members__:
-                obstacles.append(source_class_mapping[obstacle_dict['type']](
-                    **{key: obstacle_dict[key] for key in obstacle_dict if key != 'type'}))
-            else:
-                raise UndefinedTopographyObjectType(obstacle_dict['type'])
+        for key in ('sources', 'targets', 'obstacles'):
+            if key not in d:
+                raise TopographyReconstructionException(
+                    "Object must include '{}'".format(key))
+        columns = {}
+        for key in ('sources', 'targets', 'obstacles'):
+            for obj in d[key]:
+                if obj['type'] not in TopographyObjectType.__members__:
+                    raise UndefinedTopographyObjectType(obj['type'])
+            try:
+                columns[key] = {name: [obj[name] for obj in d[key]] for name in COLUMNS}
+            except KeyError as e:
+                raise TopographyReconstructionException(
+                    "Topography objects must include {}".format(e))
         if 'width' not in d or 'height' not in d:
             raise TopographyReconstructionException(
                 "Object must include 'width' and 'height'")
 
-        return Topography(d['width'], d['height']).with_sources(sources).with_targets(targets).with_obstacles(obstacles)
+        return Topography.from_arrays(d['width'], d['height'], **columns)
 
     def to_dict(self) -> Dict[str, Any]:
         """Convert the topography to a dictionary
@@ -253,12 +514,27 @@ class Topography:
         return {
             "width": self.width,
             "height": self.height,
-            "sources": [source.to_dict() for source in self.sources],
-            "targets": [target.to_dict() for target in self.targets],
-            "obstacles": [obstacle.to_dict() for obstacle in self.obstacles]
+            "sources": self.sources.to_dicts(),
+            "targets": self.targets.to_dicts(),
+            "obstacles": self.obstacles.to_dicts()
         }
 
 
+def _coverage(rects: Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray], weights: np.ndarray,
+              shape: Tuple[int, int]) -> np.ndarray:
+    # Sum of the weights of the rectangles [first_x, last_x) x [first_y, last_y) covering each cell,
+    # from a difference array with one entry per rectangle corner and two cumulative sums
+    first_x, first_y, last_x, last_y = rects
+    n_columns = shape[1] + 1
+    corners = np.concatenate([first_y * n_columns + first_x, first_y * n_columns + last_x,
+                              last_y * n_columns + first_x, last_y * n_columns + last_x])
+    signed = np.concatenate([weights, -weights, -weights, weights])
+    coverage = np.bincount(corners, signed, minlength=(shape[0] + 1) * n_columns).reshape(shape[0] + 1, n_columns)
+    np.cumsum(coverage, axis=0, out=coverage)
+    np.cumsum(coverage, axis=1, out=coverage)
+    return coverage[:-1, :-1]
+
+
 class InvalidTopographyObjectException(Exception):
     def __init__(self, obj: TopographyObject):
         super().__init__("{} is invalid for this Topography.".format(str(obj)))
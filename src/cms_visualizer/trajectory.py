@@ -0,0 +1,193 @@
+from __future__ import annotations
+from abc import ABC, abstractmethod
+from typing import Dict, Iterable
+import numpy as np
+
+
+class TrajectorySource(ABC):
+    """Read access to the pedestrian positions of a simulation
+
+    Positions are exposed as arrays of shape (n_steps, n_pedestrians, 2) holding the
+    x and y coordinate of every pedestrian. Column ``i`` belongs to the pedestrian
+    with id ``ids[i]``.
+    """
+    ids: np.ndarray
+    # True for sources in which pedestrians may be absent at some steps, see presence
+    sparse = False
+
+    def __init__(self, ids: Iterable[int]) -> None:
+        self.ids = np.asarray(list(ids), dtype=np.int64)
+        self._columns: Dict[int, int] = {
+            int(pedestrian_id): column for column, pedestrian_id in enumerate(self.ids)}
+        if len(self._columns) != len(self.ids):
+            raise ValueError("Pedestrian ids must be unique")
+        self._sorter = np.argsort(self.ids, kind='stable')
+
+    @property
+    def n_pedestrians(self) -> int:
+        return len(self.ids)
+
+    @abstractmethod
+    def __len__(self) -> int:
+        """Number of steps that are currently available"""
+        raise NotImplementedError(
+            "TrajectorySource must implement __len__()")
+
+    @abstractmethod
+    def get_steps(self, start: int, stop: int) -> np.ndarray:
+        """Positions of the steps in [start, stop)
+
+        Args:
+            start (int): First step
+            stop (int): Step after the last one
+
+        Returns:
+            np.ndarray: Array of shape (stop - start, n_pedestrians, 2)
+        """
+        raise NotImplementedError(
+            "TrajectorySource must implement get_steps()")
+
+    def presence(self, start: int, stop: int) -> np.ndarray:
+        """Which pedestrians are present at the steps in [start, stop)
+
+        Every pedestrian is present at every step unless the source is sparse.
+
+        Args:
+            start (int): First step
+            stop (int): Step after the last one
+
+        Returns:
+            np.ndarray: Boolean array of shape (stop - start, n_pedestrians)
+        """
+        return np.ones((max(min(stop, len(self)) - start, 0), self.n_pedestrians), dtype=bool)
+
+    def get_step(self, step: int) -> np.ndarray:
+        """Positions of a single step
+
+        Args:
+            step (int): Step index
+
+        Returns:
+            np.ndarray: Array of shape (n_pedestrians, 2)
+        """
+        if not 0 <= step < len(self):
+            raise IndexError("Step {} is out of range".format(step))
+        return self.get_steps(step, step + 1)[0]
+
+    def get_column(self, start: int, stop: int, column: int) -> np.ndarray:
+        """Positions of one pedestrian at the steps in [start, stop)
+
+        Args:
+            start (int): First step
+            stop (int): Step after the last one
+            column (int): Column of the pedestrian
+
+        Returns:
+            np.ndarray: Array of shape (stop - start, 2)
+        """
+        return self.get_steps(start, stop)[:, column]
+
+    def column_of(self, pedestrian_id: int) -> int:
+        """Column of a pedestrian in the position arrays
+
+        Raises:
+            KeyError: Raised if the pedestrian is unknown
+        """
+        return self._columns[pedestrian_id]
+
+    def columns_of(self, pedestrian_ids: np.ndarray) -> np.ndarray:
+        """Columns of many pedestrians at once
+
+        Args:
+            pedestrian_ids (np.ndarray): Pedestrian ids to look up
+
+        Returns:
+            np.ndarray: Column per id, -1 for unknown ids
+        """
+        pedestrian_ids = np.asarray(pedestrian_ids, dtype=np.int64)
+        if self.n_pedestrians == 0:
+            return np.full(pedestrian_ids.shape, -1, dtype=np.int64)
+        sorted_ids = self.ids[self._sorter]
+        index = np.searchsorted(sorted_ids, pedestrian_ids)
+        index = np.minimum(index, len(sorted_ids) - 1)
+        columns = self._sorter[index]
+        return np.where(sorted_ids[index] == pedestrian_ids, columns, -1)
+
+
+class TrajectoryStore(TrajectorySource):
+    def __init__(self, ids: Iterable[int], capacity: int = 0, dtype=np.int32) -> None:
+        """Columnar in-memory storage of pedestrian positions
+
+        Positions live in one contiguous array of shape (capacity, n_pedestrians, 2)
+        that grows when more steps are appended than were reserved.
+
+        Args:
+            ids (Iterable[int]): Pedestrian id per column
+            capacity (int): Number of steps to reserve
+            dtype: Integer type of the stored coordinates
+        """
+        super().__init__(ids)
+        self.positions = np.empty((capacity, self.n_pedestrians, 2), dtype=dtype)
+        self._length = 0
+
+    @classmethod
+    def from_array(cls, ids: Iterable[int], positions: np.ndarray) -> TrajectoryStore:
+        """Wrap an existing (n_steps, n_pedestrians, 2) array without copying it
+
+        Args:
+            ids (Iterable[int]): Pedestrian id per column
+            positions (np.ndarray): Position array, e.g. a memory map
+
+        Returns:
+            TrajectoryStore: Store holding all steps of ``positions``
+        """
+        store = cls(ids, 0, positions.dtype)
+        if positions.ndim != 3 or positions.shape[1:] != (store.n_pedestrians, 2):
+            raise ValueError("Positions must have shape (n_steps, {}, 2)".format(store.n_pedestrians))
+        store.positions = positions
+        store._length = positions.shape[0]
+        return store
+
+    @staticmethod
+    def dtype_for(width: int, height: int):
+        """Smallest integer type that can hold every coordinate of a topography
+
+        Args:
+            width (int): Width of the topography
+            height (int): Height of the topography
+        """
+        if max(width, height) <= np.iinfo(np.int16).max:
+            return np.int16
+        return np.int32
+
+    def __len__(self) -> int:
+        return self._length
+
+    def get_steps(self, start: int, stop: int) -> np.ndarray:
+        return self.positions[start:min(stop, self._length)]
+
+    def get_column(self, start: int, stop: int, column: int) -> np.ndarray:
+        return self.positions[start:min(stop, self._length), column]
+
+    def append(self, steps: np.ndarray) -> None:
+        """Append a block of steps
+
+        Args:
+            steps (np.ndarray): Array of shape (k, n_pedestrians, 2), already validated
+        """
+        steps = np.asarray(steps)
+        if (self.positions.dtype.kind in 'iu' and steps.dtype.kind == 'f' and
+                not np.array_equal(steps, np.round(steps))):
+            # Fractional coordinates cannot be stored as integers
+            self.positions = self.positions.astype(np.float64)
+        k = steps.shape[0]
+        if self._length + k > self.positions.shape[0]:
+            self._grow(self._length + k)
+        self.positions[self._length:self._length + k] = steps
+        self._length += k
+
+    def _grow(self, min_capacity: int) -> None:
+        capacity = max(min_capacity, 2 * self.positions.shape[0])
+        positions = np.empty((capacity, self.n_pedestrians, 2), dtype=self.positions.dtype)
+        positions[:self._length] = self.positions[:self._length]
+        self.positions = positions
@@ -1,20 +1,64 @@
+from collections import OrderedDict
+from contextlib import nullcontext
 from .simulation import Simulation
-from ipycanvas import Canvas, hold_canvas
+from .spatial import RectangleGridIndex
+from .projection import ScreenProjection
+from .geometry import SceneGeometry
+from .playback import PlaybackScheduler
+from .lod import density_counts, density_image, raster_image, cell_image
+from .rendering import parse_color
+from .instrumentation import FrameProfiler
+from .analysis import PEDESTRIAN_OVERLAP
+from .kinematics import NOT_REACHED
+from ipycanvas import Canvas, MultiCanvas, hold_canvas
 import numpy as np
 
 import ipywidgets as widgets
-from ipywidgets import interact, Play, interactive
 from IPython.display import display
 
 
 class Visualizer:
-    def __init__(self, simulation: Simulation, cell_width: int, cell_height: int,canvas_width: int,canvas_height:int):
+    # Canvas layers, from bottom to top. The background layer holds the grid and the
+    # topography and is only redrawn when one of them changes.
+    BACKGROUND_LAYER = 0
+    HEATMAP_LAYER = 1
+    PEDESTRIAN_LAYER = 2
+    TRAJECTORY_LAYER = 3
+    N_LAYERS = 4
+    # Number of steps for which the spatial index used for hit-testing is kept
+    HIT_INDEX_CACHE_SIZE = 8
+    # Level of detail modes: 'auto' switches between drawing every agent and a density raster
+    LEVELS_OF_DETAIL = ('auto', 'agents', 'density')
+
+    def __init__(self, simulation: Simulation, cell_width: int, cell_height: int,canvas_width: int,canvas_height:int, fps: float = 10,
+                 canvas=None):
         self.simulation = simulation
         self.cell_width = cell_width
         self.cell_height = cell_height
-        self.canvas = Canvas(width = canvas_width,height = canvas_height,sync_image_data=True)
+        # Any object with the MultiCanvas interface can be drawn on, e.g. a recording stand-in for benchmarks
+        if canvas is None:
+            canvas = MultiCanvas(self.N_LAYERS, width = canvas_width,height = canvas_height,sync_image_data=True)
+        self.canvas = canvas
         self.canvas.on_mouse_down(self.handle_mouse_down)
+        self._background_key_drawn = None
+        self._projection = None
+        self._projection_key = None
+        self._trajectory_step_drawn = None
+        self._step_drawn = None
+        # Step, projection, color and highlighted pedestrian the pedestrian layer shows, None if unknown
+        self._pedestrians_drawn = None
+        self._aggregates = None
+        self._kinematics = None
+        self._heatmap_drawn = None
+        # Undisplayed canvas holding the heatmap at one pixel per cell, and the image it holds
+        self._heatmap_raster = None
+        self._heatmap_image = None
+        self._hit_indices = OrderedDict()
         self.show_trajectories = False
+        # The heatmap shows the cell visits of the last heatmap_window steps up to the current one,
+        # or of all steps up to the current one if heatmap_window is None
+        self.show_heatmap = False
+        self.heatmap_window = None
         self.current_step = 0
         self.color_pedestrian = '#ff0006'
         self.color_obstacle = '#000000'
@@ -22,7 +66,34 @@ class Visualizer:
         self.color_target = '#32d12e'
         self.color_grid = '#000000'
         self.color_trajectorie = '#ff0006'
+        self.color_heatmap = '#ff8c00'
         self.highlighted_pedestrian = 1
+        self.step_controls = []
+        self.level_of_detail = 'auto'
+        # Above this many pedestrians, or when a pedestrian is smaller than lod_min_agent_pixels,
+        # 'auto' draws the density raster instead of the individual pedestrians
+        self.lod_max_agents = 20000
+        self.lod_min_agent_pixels = 1
+        # Grid cells smaller than this are not outlined
+        self.lod_min_grid_cell_pixels = 4
+        # Size of a density raster bin in pixels
+        self.density_bin_pixels = 4
+        # The pedestrian layer is updated by repainting only the cells that changed, unless the step moved by more
+        # than diff_max_jump steps or more than diff_max_fraction of the present pedestrians would be repainted
+        self.diff_max_jump = 8
+        self.diff_max_fraction = 0.5
+        # Temporal pyramid for previews while the slider is dragged, see render_preview. The exact step is
+        # rendered once the slider has rested for scrub_refine_delay seconds.
+        self.pyramid = None
+        self.scrub_refine_delay = 0.25
+        self._scrub_token = 0
+        
+        # Set by enable_profiling
+        self.profiler = None
+        self.profiling_info = widgets.HTML()
+        
+        self.playback = PlaybackScheduler(self._render_frame, fps)
+        self.playback_info = widgets.Label()
         
         self.pedestrian_info = widgets.Textarea(
                                     value='tmp',
@@ -32,89 +103,473 @@ class Visualizer:
                                 )
         self.update_pedestrian_info()
 
+    def enable_profiling(self, window: int = 100):
+        '''
+        Starts recording the wall time per drawing phase and the canvas commands and bytes of every frame
+        :param window: Number of frames the statistics are computed over
+        :return: the profiler, see FrameProfiler.stats
+        '''
+        self.profiler = FrameProfiler(window)
+        return self.profiler
+
+    def disable_profiling(self):
+        '''
+        Stops recording frame statistics
+        :return: None
+        '''
+        self.profiler = None
+
+    def profiling_overlay(self):
+        '''
+        Returns a widget that shows the frame statistics while profiling is enabled, it is refreshed during playback
+        :return: HTML widget
+        '''
+        self.update_profiling_info()
+        return self.profiling_info
+
+    def _layer(self, index: int):
+        '''
+        Returns a canvas layer, whose commands are counted while profiling
+        :param index: Layer index
+        :return: canvas layer
+        '''
+        layer = self.canvas[index]
+        return layer if self.profiler is None else self.profiler.wrap(layer)
+
+    def _phase(self, name: str):
+        '''
+        Times a drawing phase while profiling
+        :param name: Name of the phase
+        :return: context manager
+        '''
+        return nullcontext() if self.profiler is None else self.profiler.phase(name)
+
+    def _frame(self, step: int):
+        '''
+        Times a whole frame while profiling
+        :param step: Simulation step of the frame
+        :return: context manager
+        '''
+        return nullcontext() if self.profiler is None else self.profiler.frame(step)
+
+    def _background_key(self):
+        '''
+        Everything the static background layer depends on. The layer is redrawn whenever this changes.
+        :return: tuple identifying the current background
+        '''
+        topography = self.simulation.topography
+        return (self.canvas.width, self.canvas.height, self.cell_width, self.cell_height,
+                id(topography), topography.width, topography.height,
+                topography.sources.version, topography.targets.version, topography.obstacles.version,
+                self.color_grid, self.color_obstacle, self.color_target, self.color_source,
+                self.show_grid())
+
+    def show_grid(self) -> bool:
+        '''
+        The grid is hidden automatically when its cells get too small to be told apart
+        :return: True if the grid is drawn
+        '''
+        return min(self.cell_width, self.cell_height) >= self.lod_min_grid_cell_pixels
+
+    def use_density(self) -> bool:
+        '''
+        Decides whether pedestrians are drawn individually or aggregated into a density raster
+        :return: True if the density raster is drawn
+        '''
+        if self.level_of_detail != 'auto':
+            return self.level_of_detail == 'density'
+        if self.simulation.trajectories.n_pedestrians > self.lod_max_agents:
+            return True
+        radius = np.median([p.radius for p in self.simulation.pedestrians]) if self.simulation.pedestrians else 1
+        geometry = self.geometry()
+        return radius * min(geometry.unit_width, geometry.unit_height) < self.lod_min_agent_pixels
+
+    def geometry(self) -> SceneGeometry:
+        '''
+        Returns the placement of grid, topography and pedestrians for the current canvas and cell size
+        :return: scene geometry
+        '''
+        return SceneGeometry(self.simulation.topography, self.canvas.width, self.canvas.height,
+                             self.cell_width, self.cell_height)
+
+    def invalidate_background(self):
+        '''
+        Forces a redraw of the background layer on the next draw, e.g. after topography objects were edited in place
+        :return: None
+        '''
+        self._background_key_drawn = None
+
+    def draw_background(self):
+        '''
+        Draws the grid and the topography onto the background layer, which is kept between steps
+        :return: None
+        '''
+        layer = self._layer(self.BACKGROUND_LAYER)
+        topography = self.simulation.topography
+        geometry = self.geometry()
+        with hold_canvas():
+            layer.clear()
+            if self.show_grid():
+                with self._phase('grid'):
+                    x, y, width, height = geometry.grid()
+                    layer.stroke_style = self.color_grid
+                    layer.stroke_rects(x=x, y=y, width=width, height=height)
+            # draw obstacles, targets and sources
+            for phase, objects, color in (('obstacles', topography.obstacles, self.color_obstacle),
+                                          ('targets', topography.targets, self.color_target),
+                                          ('sources', topography.sources, self.color_source)):
+                if not objects:
+                    continue
+                with self._phase(phase):
+                    x, y, width, height = geometry.objects(objects)
+                    layer.fill_style = color
+                    layer.fill_rects(x=x, y=y, width=width, height=height)
+        self._background_key_drawn = self._background_key()
+
     def draw(self, step: int):
         '''
 
         :param step: Which simulation step of the simulation should be drawn
         :return: canvas with the drawn image
         '''
-        unit_width = self.canvas.width/self.simulation.topography.width
-        unit_height = self.canvas.height/self.simulation.topography.height
-        self.canvas.clear()
-        with hold_canvas(self.canvas):
-            indices = np.indices((int(self.canvas.width/self.cell_width),int(self.canvas.height/self.cell_height)))
-            row_indices = indices[0].flatten()
-            column_indices = indices[1].flatten()
-            self.canvas.stroke_style = self.color_grid
-            self.canvas.stroke_rects(
-                x=column_indices * self.cell_width,
-                y=row_indices * self.cell_height,
-                width=self.cell_width,
-                height=self.cell_height
-            )
-            
-            #draw pedestrian
-            pedestrians_coordinates = [s for s in self.simulation.simulation_steps[step].values()]
-            pedestrian_radius = [p.radius for p in self.simulation.pedestrians]
-            self.canvas.fill_style = self.color_pedestrian
-            self.canvas.fill_rects(
-                x=[round(p.x*unit_width/self.cell_width)*self.cell_width for p in pedestrians_coordinates],
-                y=[round(p.y*unit_height/self.cell_height)*self.cell_height for p in pedestrians_coordinates],
-                width=[round(radius*unit_width/self.cell_width)*self.cell_width for radius in pedestrian_radius],
-                height=[round(radius*unit_width/self.cell_height)*self.cell_height for radius in pedestrian_radius]
-            )
-            #highlight the highlighted pedestrian
-            self.canvas.fill_style = 'yellow'
-            self.canvas.fill_rect(
-                x=round(pedestrians_coordinates[self.highlighted_pedestrian].x*unit_width/self.cell_width)*self.cell_width,
-                y=round(pedestrians_coordinates[self.highlighted_pedestrian].y*unit_height/self.cell_height)*self.cell_height,
-                width=round(pedestrian_radius[self.highlighted_pedestrian]*unit_width/self.cell_width)*self.cell_width,
-                height=round(pedestrian_radius[self.highlighted_pedestrian]*unit_width/self.cell_height)*self.cell_height
-            )
-            # draw obstacles
-            self.canvas.fill_style = self.color_obstacle
-            self.canvas.fill_rects(
-                x=[round(p.x*unit_width/self.cell_width)*self.cell_width for p in self.simulation.topography.obstacles],
-                y=[round(p.y*unit_height/self.cell_height)*self.cell_height for p in self.simulation.topography.obstacles],
-                width=[round(p.width * unit_width/self.cell_width)*self.cell_width for p in self.simulation.topography.obstacles],
-                height=[round(p.height * unit_height/self.cell_height)*self.cell_height for p in self.simulation.topography.obstacles]
-            )
-            # draw target
-            self.canvas.fill_style = self.color_target
-            self.canvas.fill_rects(
-                x=[round(p.x*unit_width/self.cell_width)*self.cell_width for p in self.simulation.topography.targets],
-                y=[round(p.y*unit_height/self.cell_height)*self.cell_height for p in self.simulation.topography.targets],
-                width=[round(p.width * unit_width/self.cell_width)*self.cell_width for p in self.simulation.topography.targets],
-                height=[round(p.height * unit_height/self.cell_height)*self.cell_height for p in self.simulation.topography.targets]
-            )
-            # draw sources
-            self.canvas.fill_style = self.color_source
-            self.canvas.fill_rects(
-                x=[round(p.x*unit_width/self.cell_width)*self.cell_width for p in self.simulation.topography.sources],
-                y=[round(p.y*unit_height/self.cell_height)*self.cell_height for p in self.simulation.topography.sources],
-                width=[round(p.width* unit_width/self.cell_width)*self.cell_width for p in self.simulation.topography.sources],
-                height=[round(p.height*unit_height/self.cell_height)*self.cell_height for p in self.simulation.topography.sources]
-            )
-            #Draw Trajectories:
-            self.canvas.stroke_style = self.color_trajectorie
-            if self.show_trajectories:
-                keys = [p.id for p in self.simulation.pedestrians]
-                for k in keys:
-                    self.canvas.begin_path()
-                    position = self.simulation.simulation_steps[0][k]
-                    x = round(position.x*unit_width/self.cell_width)*self.cell_width+ self.cell_width*0.5
-                    y = round(position.y*unit_height/self.cell_width)*self.cell_width+ self.cell_height*0.5
-                    self.canvas.move_to(x,y)
-                    for i in range(1,step+1):
-                        position = self.simulation.simulation_steps[i][k]
-                        x = round(position.x*unit_width/self.cell_width)*self.cell_width + self.cell_width*0.5
-                        y = round(position.y*unit_height/self.cell_width)*self.cell_width + self.cell_height*0.5
-                        self.canvas.line_to(x,y)
-                    self.canvas.stroke()
-                
+        self.render(step)
         display(self.canvas)
 
+    def render(self, step: int):
+        '''
+        Draws a simulation step onto the canvas without displaying it again
+        :param step: Which simulation step of the simulation should be drawn
+        :return: None
+        '''
+        with self._frame(step):
+            if self._background_key_drawn != self._background_key():
+                self.draw_background()
+            with hold_canvas():
+                #draw pedestrian
+                with self._phase('pedestrians'):
+                    density = self.use_density()
+                    if density or not self.draw_pedestrian_changes(step):
+                        self.draw_pedestrians(step, density)
+                #highlight the highlighted pedestrian
+                with self._phase('highlight'):
+                    self._fill_pedestrian(step, self.highlighted_pedestrian, 'yellow')
+                self._pedestrians_drawn = None if density else (
+                    step, self.projection(), self.color_pedestrian, self.highlighted_pedestrian)
+                with self._phase('trajectories'):
+                    self.draw_trajectories(step)
+                with self._phase('heatmap'):
+                    self.draw_heatmap(step)
+        self._step_drawn = step
+
+    def render_preview(self, step: int, level: int):
+        '''
+        Draws a coarse version of a step from the temporal pyramid: the pedestrians at the first step of the
+        pyramid block that contains the step, or the mean density of the block at the density level of detail.
+        Only the pedestrian layer is redrawn.
+        :param step: Simulation step
+        :param level: Level of the pyramid, see TemporalPyramid.level_for
+        :return: None
+        '''
+        with self._frame(step):
+            if self._background_key_drawn != self._background_key():
+                self.draw_background()
+            block, _ = self.pyramid.block(level, step)
+            with hold_canvas():
+                layer = self._layer(self.PEDESTRIAN_LAYER)
+                with self._phase('preview'):
+                    layer.clear()
+                    if self.use_density():
+                        image = raster_image(self.pyramid.densities[level][block], self.canvas.width,
+                                             self.canvas.height, parse_color(self.color_pedestrian))
+                        layer.put_image_data(image, 0, 0)
+                    else:
+                        projection = self.projection()
+                        points = projection.geometry.points(self.pyramid.positions[level][block])
+                        sizes = projection.sizes
+                        if self.pyramid.presence is not None:
+                            present = self.pyramid.presence[level][block]
+                            points, sizes = points[present], sizes[present]
+                        layer.fill_style = self.color_pedestrian
+                        layer.fill_rects(x=points[:, 0], y=points[:, 1], width=sizes[:, 0], height=sizes[:, 1])
+        # The exact step has not been drawn
+        self._step_drawn = None
+        self._pedestrians_drawn = None
+
+    def draw_pedestrians(self, step: int, density: bool):
+        '''
+        Redraws the whole pedestrian layer without the highlight
+        :param step: Simulation step
+        :param density: Draw the density raster instead of the individual pedestrians
+        :return: None
+        '''
+        layer = self._layer(self.PEDESTRIAN_LAYER)
+        layer.clear()
+        px, py, pwidth, pheight = self._pedestrian_rects(step)
+        present = self.projection().present(step)
+        if present is not None:
+            # Pedestrians that have not entered yet or already left are not drawn
+            px, py, pwidth, pheight = px[present], py[present], pwidth[present], pheight[present]
+        if density:
+            self.draw_density(px, py)
+        else:
+            layer.fill_style = self.color_pedestrian
+            layer.fill_rects(x=px, y=py, width=pwidth, height=pheight)
+
+    def draw_pedestrian_changes(self, step: int) -> bool:
+        '''
+        Updates the pedestrian layer from the step drawn last: the cells of pedestrians that moved are cleared
+        and only the pedestrians in changed cells are repainted, so the traffic grows with the number of moving
+        pedestrians instead of all of them
+        :param step: Simulation step
+        :return: False if nothing was drawn because the layer has to be redrawn completely
+        '''
+        drawn = self._pedestrians_drawn
+        projection = self.projection()
+        if (drawn is None or drawn[1] is not projection or drawn[2] != self.color_pedestrian
+                or abs(step - drawn[0]) > self.diff_max_jump):
+            return False
+        (x, y, width, height), repaint = projection.changes(drawn[0], step)
+        present = projection.present(step)
+        previous_highlight = drawn[3]
+        if previous_highlight != self.highlighted_pedestrian and (present is None or present[previous_highlight]):
+            # The formerly highlighted pedestrian loses its highlight
+            repaint = np.union1d(repaint, [previous_highlight])
+        n_present = len(projection.sizes) if present is None else int(present.sum())
+        if len(x) + len(repaint) > self.diff_max_fraction * max(n_present, 1):
+            return False
+        layer = self._layer(self.PEDESTRIAN_LAYER)
+        if len(x):
+            # Filling with 'destination-out' erases all rectangles in one command
+            layer.global_composite_operation = 'destination-out'
+            layer.fill_rects(x=x, y=y, width=width, height=height)
+            layer.global_composite_operation = 'source-over'
+        if len(repaint):
+            px, py, pwidth, pheight = self._pedestrian_rects(step, repaint)
+            layer.fill_style = self.color_pedestrian
+            layer.fill_rects(x=px, y=py, width=pwidth, height=pheight)
+        return True
+
+    def draw_density(self, px, py):
+        '''
+        Draws the pedestrians as one density image, whose size only depends on the canvas size
+        :param px: x-coordinates of the pedestrians in pixels
+        :param py: y-coordinates of the pedestrians in pixels
+        :return: None
+        '''
+        bin_size = self.density_bin_pixels
+        counts = density_counts(px, py, self.canvas.width, self.canvas.height, bin_size, bin_size)
+        image = density_image(counts, bin_size, bin_size, self.canvas.width, self.canvas.height,
+                              parse_color(self.color_pedestrian))
+        self._layer(self.PEDESTRIAN_LAYER).put_image_data(image, 0, 0)
+
+    def aggregates(self):
+        '''
+        Returns the cumulative visit and flow tables of the simulation. They are computed once, steps loaded
+        later are added on the next call.
+        :return: aggregates of the simulation, see Simulation.aggregate
+        '''
+        if self._aggregates is None or self._aggregates.trajectories is not self.simulation.trajectories:
+            self._aggregates = self.simulation.aggregate()
+            self._heatmap_drawn = None
+        elif self._aggregates.update():
+            self._heatmap_drawn = None
+        return self._aggregates
+
+    def kinematics(self):
+        '''
+        Returns the speed, heading, path length and time to target of every pedestrian at every step. They are
+        computed once, steps loaded later are added on the next call.
+        :return: kinematics of the simulation, see Simulation.kinematics
+        '''
+        if self._kinematics is None or self._kinematics.trajectories is not self.simulation.trajectories:
+            self._kinematics = self.simulation.kinematics()
+        else:
+            self._kinematics.update()
+        return self._kinematics
+
+    def heatmap_range(self, step: int):
+        '''
+        Returns the steps the heatmap aggregates when the given step is shown
+        :param step: Simulation step
+        :return: first step and the step after the last one
+        '''
+        start = 0 if self.heatmap_window is None else max(step + 1 - self.heatmap_window, 0)
+        return start, step + 1
+
+    def _offscreen_canvas(self, width: int, height: int):
+        '''
+        Returns a canvas that is not displayed, whose content is drawn onto the layers with draw_image
+        :param width: Width in pixels
+        :param height: Height in pixels
+        :return: canvas of the same kind as the layers
+        '''
+        create = getattr(self.canvas, 'offscreen_canvas', None)
+        return create(width, height) if create is not None else Canvas(width=width, height=height)
+
+    def draw_heatmap(self, step: int):
+        '''
+        Draws the cell visits of the heatmap range on the heatmap layer. The image is sent with one pixel per
+        topography cell and scaled to the canvas by draw_image. Nothing is drawn when the range, the canvas and
+        the color are unchanged, and nothing is sent when the image is the same as the one drawn.
+        :param step: Simulation step
+        :return: None
+        '''
+        layer = self._layer(self.HEATMAP_LAYER)
+        if not self.show_heatmap:
+            if self._heatmap_drawn is not None:
+                layer.clear()
+                self._heatmap_drawn = None
+            return
+        aggregates = self.aggregates()
+        key = (self.heatmap_range(step), self.canvas.width, self.canvas.height, self.color_heatmap)
+        if key == self._heatmap_drawn:
+            return
+        image = cell_image(aggregates.visits(*self.heatmap_range(step)), parse_color(self.color_heatmap))
+        if (self._heatmap_drawn is not None and self._heatmap_drawn[1:] == key[1:]
+                and np.array_equal(image, self._heatmap_image)):
+            self._heatmap_drawn = key
+            return
+        if self._heatmap_raster is None or self._heatmap_image.shape != image.shape:
+            self._heatmap_raster = self._offscreen_canvas(image.shape[1], image.shape[0])
+        raster = self._heatmap_raster if self.profiler is None else self.profiler.wrap(self._heatmap_raster)
+        raster.put_image_data(image, 0, 0)
+        layer.clear()
+        # Every cell stays one sharp block of pixels
+        layer.image_smoothing_enabled = False
+        layer.draw_image(self._heatmap_raster, 0, 0, self.canvas.width, self.canvas.height)
+        self._heatmap_image = image
+        self._heatmap_drawn = key
+
+    def toggle_heatmap(self, toggle_info):
+        '''
+        This function activates or deactivates the density heatmap
+        :param toggle_info: Information from the toggle button widget
+        :return: None
+        '''
+        self.show_heatmap = not self.show_heatmap
+        self.render(self.current_step)
+
+    def update_level_of_detail(self,change):
+        '''
+        This function switches the level of detail via the dropdown
+        :param change: The new information coming from the dropdown
+        :return: None
+        '''
+        self.level_of_detail = change['new']
+        self.render(self.current_step)
+
+    def projection(self) -> ScreenProjection:
+        '''
+        Returns the snapped screen coordinates of all pedestrians at all steps. They are computed once per canvas
+        and cell size and shared by drawing, hit-testing and the trajectories.
+        :return: screen projection of the trajectories
+        '''
+        key = (self.canvas.width, self.canvas.height, self.cell_width, self.cell_height,
+               id(self.simulation.topography), id(self.simulation.trajectories))
+        if self._projection is None or self._projection_key != key:
+            radius = np.array([p.radius for p in self.simulation.pedestrians])
+            self._projection = ScreenProjection(self.simulation.trajectories, self.geometry(), radius)
+            self._projection_key = key
+            self._trajectory_step_drawn = None
+            self._hit_indices.clear()
+        return self._projection
+
+    def _pedestrian_rects(self, step: int, pedestrians=slice(None)):
+        '''
+        Returns the canvas rectangles of pedestrians at a simulation step
+        :param step: Simulation step
+        :param pedestrians: Indices of the pedestrians, all by default
+        :return: x, y, width and height arrays, in the order of the pedestrians
+        '''
+        return self.projection().rects(step, pedestrians)
+
+    def _fill_pedestrian(self, step: int, pedestrian: int, color: str):
+        '''
+        Paints a single pedestrian onto the pedestrian layer
+        :param step: Simulation step
+        :param pedestrian: Index of the pedestrian
+        :param color: Fill color
+        :return: None
+        '''
+        present = self.projection().present(step)
+        if present is not None and not present[pedestrian]:
+            return
+        px, py, pwidth, pheight = self._pedestrian_rects(step, [pedestrian])
+        layer = self._layer(self.PEDESTRIAN_LAYER)
+        layer.fill_style = color
+        layer.fill_rect(x=px[0], y=py[0], width=pwidth[0], height=pheight[0])
+
+    def _hit_index(self, step: int) -> RectangleGridIndex:
+        '''
+        Returns the spatial index of the pedestrian rectangles at a step. Indices are built on first use and
+        the most recently used ones are kept.
+        :param step: Simulation step
+        :return: index of the pedestrian rectangles
+        '''
+        key = (step, self.canvas.width, self.canvas.height, self.cell_width, self.cell_height,
+               id(self.simulation.topography), id(self.simulation.trajectories))
+        if key in self._hit_indices:
+            self._hit_indices.move_to_end(key)
+        else:
+            px, py, pwidth, pheight = self._pedestrian_rects(step)
+            present = self.projection().present(step)
+            if present is not None:
+                # Absent pedestrians keep their index but cannot be hit
+                pwidth, pheight = np.where(present, pwidth, 0), np.where(present, pheight, 0)
+            self._hit_indices[key] = RectangleGridIndex(px, py, pwidth, pheight)
+            while len(self._hit_indices) > self.HIT_INDEX_CACHE_SIZE:
+                self._hit_indices.popitem(last=False)
+        return self._hit_indices[key]
+
+    def set_highlighted_pedestrian(self, pedestrian: int):
+        '''
+        Changes the highlighted pedestrian. If the current step is on the canvas, only the previously and the
+        newly highlighted pedestrians are repainted, or the density raster and the newly highlighted one.
+        :param pedestrian: Index of the pedestrian
+        :return: None
+        '''
+        previous = self.highlighted_pedestrian
+        self.highlighted_pedestrian = pedestrian
+        self.update_pedestrian_info()
+        if self._step_drawn != self.current_step:
+            self.render(self.current_step)
+        elif previous != pedestrian:
+            with hold_canvas():
+                if self.use_density():
+                    # The previous pedestrian is only part of the density raster, not a rectangle of its own
+                    self.draw_pedestrians(self.current_step, True)
+                else:
+                    self._fill_pedestrian(self.current_step, previous, self.color_pedestrian)
+                self._fill_pedestrian(self.current_step, pedestrian, 'yellow')
+            if self._pedestrians_drawn is not None:
+                self._pedestrians_drawn = self._pedestrians_drawn[:3] + (pedestrian,)
+
         
+    def draw_trajectories(self, step: int):
+        '''
+        Draws the trajectories up to the given step. When advancing from the step drawn last, only the new
+        segments are added to the trajectory layer, otherwise the layer is redrawn in one batched call.
+        :param step: Last simulation step of the trajectories
+        :return: None
+        '''
+        layer = self._layer(self.TRAJECTORY_LAYER)
+        if not self.show_trajectories:
+            if self._trajectory_step_drawn is not None:
+                layer.clear()
+                self._trajectory_step_drawn = None
+            return
+        projection = self.projection()
+        with hold_canvas():
+            layer.stroke_style = self.color_trajectorie
+            if self._trajectory_step_drawn is None or step < self._trajectory_step_drawn:
+                layer.clear()
+                start = 0
+            else:
+                start = self._trajectory_step_drawn
+            if step > start:
+                layer.stroke_line_segments(projection.segments(start, step))
+        self._trajectory_step_drawn = step
+
     def handle_mouse_down(self,x,y):
         '''
         This function is called when the user clicks on the canvas.
@@ -122,22 +577,9 @@ class Visualizer:
         :param y: y-coordinate of the mouse position
         :return: None
         '''
-        unit_width = self.canvas.width/self.simulation.topography.width
-        unit_height = self.canvas.height/self.simulation.topography.height
-        
-        pedestrians_coordinates = [s for s in self.simulation.simulation_steps[self.current_step].values()]
-        pedestrian_radius = [p.radius for p in self.simulation.pedestrians]
-        
-        px=[round(p.x*unit_width/self.cell_width)*self.cell_width for p in pedestrians_coordinates]
-        py=[round(p.y*unit_height/self.cell_height)*self.cell_height for p in pedestrians_coordinates]
-        pwidth=[round(radius*unit_width/self.cell_width)*self.cell_width for radius in pedestrian_radius]
-        pheight=[round(radius*unit_width/self.cell_height)*self.cell_height for radius in pedestrian_radius]
-        
-        for i in range(len(pedestrians_coordinates)):
-            if x > px[i] and x < px[i]+pwidth[i] and y > py[i] and y < py[i]+pheight[i]:
-                self.highlighted_pedestrian = i
-                self.update_pedestrian_info()
-        self.draw(self.current_step)
+        hits = self._hit_index(self.current_step).query(x, y)
+        if len(hits):
+            self.set_highlighted_pedestrian(int(hits[-1]))
             
     def toggle_trajectories(self,toggle_info):
         '''
@@ -162,34 +604,148 @@ class Visualizer:
         :return: None
         '''
         if(change['name'] == 'value'):
-            self.current_step = change['new']
+            previous, self.current_step = self.current_step, change['new']
+            level = None if self.pyramid is None else self.pyramid.level_for(abs(self.current_step - previous))
+            if level is None:
+                self.playback.request(self.current_step)
+                return
+            # Large jumps come from dragging the slider: preview now, render exactly once it rests
+            self.render_preview(self.current_step, level)
+            self._scrub_token += 1
+            token = self._scrub_token
+            self.playback.call_later(self.scrub_refine_delay, lambda: self._refine(token))
+
+    def _refine(self, token: int):
+        '''
+        Renders the exact current step if the slider has not moved since a preview was drawn
+        :param token: Number of the preview
+        :return: None
+        '''
+        if token == self._scrub_token:
+            self.playback.request(self.current_step)
+
+    def jump_to(self, step: int, pedestrian_id=None):
+        '''
+        Shows a step and optionally highlights a pedestrian, e.g. to inspect a violation found by analysis.find_violations
+        :param step: Simulation step
+        :param pedestrian_id: Id of the pedestrian to highlight
+        :return: None
+        '''
+        if pedestrian_id is not None:
+            self.highlighted_pedestrian = self.simulation.trajectories.column_of(int(pedestrian_id))
+        self.current_step = step
+        if self.step_controls and self.step_controls[-1].value != step:
+            # The slider requests the frame
+            self.step_controls[-1].value = step
+        else:
+            self.render(step)
             self.update_pedestrian_info()
+
+    def violations_browser(self, violations, limit: int = 1000):
+        '''
+        Creates a list of violations that jumps to the step and the pedestrian of the selected one
+        :param violations: Table returned by analysis.find_violations
+        :param limit: Maximum number of listed violations
+        :return: Select widget
+        '''
+        options = []
+        for index, row in enumerate(violations[:limit]):
+            if row['kind'] == PEDESTRIAN_OVERLAP:
+                description = 'pedestrian {} overlaps pedestrian {}'
+            else:
+                description = 'pedestrian {} is inside obstacle {}'
+            label = ('step {}: ' + description + ' by {:.2f}').format(
+                row['step'], row['pedestrian'], row['other'], row['depth'])
+            options.append((label, index))
+        browser = widgets.Select(options=options, value=None, rows=10,
+                                 description='{} violations'.format(len(violations)),
+                                 layout=widgets.Layout(width='500px'))
+
+        def jump(change):
+            if change['new'] is not None:
+                row = violations[change['new']]
+                self.jump_to(int(row['step']), int(row['pedestrian']))
+        browser.observe(jump, names='value')
+        return browser
+
+    def _render_frame(self, step: int):
+        '''
+        Renders a step requested by the playback scheduler and updates the panels that depend on it
+        :param step: Simulation step
+        :return: None
+        '''
+        self.render(step)
+        self.update_pedestrian_info()
+        if self.playback.n_rendered % max(int(self.playback.fps), 1) == 0:
+            self.update_playback_info()
+            self.update_profiling_info()
+
+    def update_playback_info(self):
+        '''
+        This function shows the achieved and the target frame rate
+        :return: None
+        '''
+        stats = self.playback.stats()
+        self.playback_info.value = '{:.1f} / {:g} fps, {} frames dropped'.format(
+            stats['achieved_fps'], stats['target_fps'], stats['n_dropped'])
+
+    def update_profiling_info(self):
+        '''
+        This function shows the frame statistics of the profiler in the overlay widget
+        :return: None
+        '''
+        if self.profiler is None:
+            self.profiling_info.value = ''
+            return
+        stats = self.profiler.stats()
+        if not stats['n_frames']:
+            self.profiling_info.value = 'No frames profiled yet'
+            return
+        phases = ', '.join('{} {:.1f} ms'.format(name, t * 1e3) for name, t in stats['phases'].items())
+        self.profiling_info.value = (
+            'frame p50 {:.1f} ms, p95 {:.1f} ms, {:.0f} commands / {:.1f} kB per frame<br>{}'.format(
+                stats['frame_time_p50'] * 1e3, stats['frame_time_p95'] * 1e3,
+                stats['commands_per_frame'], stats['bytes_per_frame'] / 1e3, phases))
+
+    def update_step_range(self, n_steps: int):
+        '''
+        This function extends the play and slider range, e.g. as progress callback of a SimulationJsonLoader
+        :param n_steps: Number of simulation steps that can be shown
+        :return: None
+        '''
+        for control in self.step_controls:
+            control.max = max(n_steps - 1, 0)
     
     #Color adjusting functions
     #||||||||||||||||||||||||||||||||||||||||||||||||||||||||||||||||||||||||
     def adjust_pedestrian_color(self,change):
         self.color_pedestrian = change['new']
-        self.draw(self.current_step)
+        self.render(self.current_step)
         
     def adjust_obstacle_color(self,change):
         self.color_obstacle = change['new']
-        self.draw(self.current_step)
+        self.render(self.current_step)
         
     def adjust_source_color(self,change):
         self.color_source = change['new']
-        self.draw(self.current_step)
+        self.render(self.current_step)
         
     def adjust_target_color(self,change):
         self.color_target = change['new']
-        self.draw(self.current_step)
+        self.render(self.current_step)
         
     def adjust_grid_color(self,change):
         self.color_grid = change['new']
-        self.draw(self.current_step)
+        self.render(self.current_step)
+        
+    def adjust_heatmap_color(self,change):
+        self.color_heatmap = change['new']
+        self.render(self.current_step)
         
     def adjust_trajectorie_color(self,change):
         self.color_trajectorie = change['new']
-        self.draw(self.current_step)
+        self._trajectory_step_drawn = None
+        self.render(self.current_step)
     #||||||||||||||||||||||||||||||||||||||||||||||||||||||||||||||||||||||||
     
     def update_highlighted_pedestrian(self,change):
@@ -198,20 +754,29 @@ class Visualizer:
         :param change: The new information coming from the dropdown
         :return: None
         '''
-        self.highlighted_pedestrian = change['new']
-        self.update_pedestrian_info()
-        self.draw(self.current_step)
+        self.set_highlighted_pedestrian(change['new'])
         
     def update_pedestrian_info(self):
         '''
         This function updates the pedestrian info shown in the textbox
         :return: None
         '''
-        pedestrians_coordinates = [s for s in self.simulation.simulation_steps[self.current_step].values()]
-        self.pedestrian_info.value = 'id:' + str(self.highlighted_pedestrian) + '\n' 
-        self.pedestrian_info.value = self.pedestrian_info.value + 'X: ' + str(pedestrians_coordinates[self.highlighted_pedestrian].x) + '\n'
-        self.pedestrian_info.value = self.pedestrian_info.value + 'Y: ' + str(pedestrians_coordinates[self.highlighted_pedestrian].y) + '\n'
-        self.pedestrian_info.value = self.pedestrian_info.value + 'Radius: ' + str(self.simulation.pedestrians[self.highlighted_pedestrian].radius) + '\n'
+        present = self.simulation.trajectories.presence(self.current_step, self.current_step + 1)[0]
+        if not present[self.highlighted_pedestrian]:
+            self.pedestrian_info.value = 'id:' + str(self.highlighted_pedestrian) + '\n' + 'Not present at this step\n'
+            return
+        x, y = self.simulation.trajectories.get_step(self.current_step)[self.highlighted_pedestrian].tolist()
+        kinematics = self.kinematics().at(self.current_step, self.highlighted_pedestrian)
+        time_to_target = 'not reached' if kinematics.time_to_target == NOT_REACHED else kinematics.time_to_target
+        self.pedestrian_info.value = (
+            'id:' + str(self.highlighted_pedestrian) + '\n' +
+            'X: ' + str(x) + '\n' +
+            'Y: ' + str(y) + '\n' +
+            'Radius: ' + str(self.simulation.pedestrians[self.highlighted_pedestrian].radius) + '\n' +
+            'Speed: {:.2f}\n'.format(kinematics.speed) +
+            'Heading: {:.0f}°\n'.format(kinematics.heading) +
+            'Path length: {:.2f}\n'.format(kinematics.path_length) +
+            'Time to target: ' + str(time_to_target) + '\n')
     
     def build_gui(self):
         '''
@@ -220,11 +785,13 @@ class Visualizer:
         :return: Final layout with all the widgets
         '''
         #Play and Slider
+        last_step = max(len(self.simulation.simulation_steps) - 1, 0)
         play = widgets.Play(
             value=0,
             min=0,
-            max=2,
+            max=last_step,
             step=1,
+            interval=int(1000 / self.playback.fps),
             description="Press play",
             disabled=False
         )
@@ -232,8 +799,9 @@ class Visualizer:
         slider = widgets.IntSlider(
             value=0,
             min=0,
-            max=2,
+            max=last_step,
             step=1)
+        self.step_controls = [play, slider]
         
         slider.observe(self.update_step)
         widgets.jslink((play, 'value'), (slider, 'value'))
@@ -249,6 +817,17 @@ class Visualizer:
         )
         trajectories.observe(self.toggle_trajectories, names='value')
         
+        #Heatmap
+        heatmap = widgets.ToggleButton(
+            value=self.show_heatmap,
+            description='Show Heatmap',
+            disabled=False,
+            button_style='',
+            tooltip='Toggles the cumulative pedestrian density',
+            icon='check'
+        )
+        heatmap.observe(self.toggle_heatmap, names='value')
+        
         #Print Button
         print_as_png = widgets.Button(
             description='Save as .png',
@@ -302,12 +881,20 @@ class Visualizer:
                                     disabled=False
                                 )
         
+        heatmap_colorpicker = widgets.ColorPicker(
+                                    concise=False,
+                                    description='Heatmap',
+                                    value=self.color_heatmap,
+                                    disabled=False
+                                )
+        
         pedestrian_colorpicker.observe(self.adjust_pedestrian_color,names='value')
         obstacle_colorpicker.observe(self.adjust_obstacle_color,names='value')
         source_colorpicker.observe(self.adjust_source_color,names='value')
         target_colorpicker.observe(self.adjust_target_color,names='value')
         grid_colorpicker.observe(self.adjust_grid_color,names='value')
         trajectorie_colorpicker.observe(self.adjust_trajectorie_color,names='value')
+        heatmap_colorpicker.observe(self.adjust_heatmap_color,names='value')
         
         #Dropdown
         pedestrian_numbers = []
@@ -322,9 +909,351 @@ class Visualizer:
                 )
         pedestrian_picker.observe(self.update_highlighted_pedestrian,names='value')
         
+        level_of_detail_picker = widgets.Dropdown(
+                        options=self.LEVELS_OF_DETAIL,
+                        value=self.level_of_detail,
+                        description='Detail:',
+                        disabled=False,
+                )
+        level_of_detail_picker.observe(self.update_level_of_detail,names='value')
+        
         #Set Layout
-        layout = interactive(self.draw, step=play)
-        horizontal = widgets.HBox([widgets.VBox([trajectories,print_as_png]),
-                                   widgets.VBox([grid_colorpicker,trajectorie_colorpicker,pedestrian_colorpicker,obstacle_colorpicker,source_colorpicker,target_colorpicker]),
-                                   widgets.VBox([pedestrian_picker,self.pedestrian_info])])
-        return widgets.VBox([horizontal,slider, layout])
+        self.render(self.current_step)
+        horizontal = widgets.HBox([widgets.VBox([trajectories,heatmap,print_as_png]),
+                                   widgets.VBox([grid_colorpicker,trajectorie_colorpicker,pedestrian_colorpicker,obstacle_colorpicker,source_colorpicker,target_colorpicker,heatmap_colorpicker]),
+                                   widgets.VBox([pedestrian_picker,self.pedestrian_info,level_of_detail_picker])])
+        return widgets.VBox([horizontal, widgets.HBox([play, slider, self.playback_info]), self.canvas])
+
+
+def _same_topography(first, second) -> bool:
+    '''
+    Compares the size and the objects of two topographies
+    :param first: Topography
+    :param second: Topography
+    :return: True if both look the same
+    '''
+    if first is second:
+        return True
+    if (first.width, first.height) != (second.width, second.height):
+        return False
+    for name in ('sources', 'targets', 'obstacles'):
+        columns, other = getattr(first, name).columns(), getattr(second, name).columns()
+        if any(not np.array_equal(columns[column], other[column]) for column in columns):
+            return False
+    return True
+
+
+class ComparisonVisualizer:
+    # Canvas layers, from bottom to top, shared by all panels
+    BACKGROUND_LAYER = 0
+    PEDESTRIAN_LAYER = 1
+    TRAJECTORY_LAYER = 2
+    N_LAYERS = 3
+
+    def __init__(self, simulations, cell_width: int, cell_height: int, panel_width: int, panel_height: int,
+                 columns=None, labels=None, fps: float = 10, canvas=None):
+        '''
+        Shows several runs over the same topography side by side, e.g. the runs of a parameter sweep. All panels
+        are tiles of one canvas: the grid and the topography are placed once and drawn into every tile in one
+        batched command per object kind, and every step of all panels is sent in a single canvas round-trip.
+        One play button and slider drive all panels.
+        :param simulations: Simulations sharing one topography
+        :param cell_width: Width of a grid cell in pixels
+        :param cell_height: Height of a grid cell in pixels
+        :param panel_width: Width of a panel in pixels
+        :param panel_height: Height of a panel in pixels
+        :param columns: Number of panels per row, defaults to a square layout
+        :param labels: Caption per panel, none by default
+        :param fps: Target frame rate of the playback
+        :param canvas: Object with the MultiCanvas interface to draw on, by default a new MultiCanvas
+        '''
+        self.simulations = list(simulations)
+        if not self.simulations:
+            raise ValueError('At least one simulation is needed')
+        topography = self.simulations[0].topography
+        if not all(_same_topography(simulation.topography, topography) for simulation in self.simulations[1:]):
+            raise ValueError('All compared simulations must share the topography')
+        n_panels = len(self.simulations)
+        self.columns = columns or int(np.ceil(np.sqrt(n_panels)))
+        self.rows = -(-n_panels // self.columns)
+        self.panel_width = panel_width
+        self.panel_height = panel_height
+        self.labels = labels
+        if canvas is None:
+            canvas = MultiCanvas(self.N_LAYERS, width=self.columns * panel_width, height=self.rows * panel_height,
+                                 sync_image_data=True)
+        self.canvas = canvas
+        self.canvas.on_mouse_down(self.handle_mouse_down)
+        # Top left corner of every panel on the canvas
+        panels = np.arange(n_panels)
+        self.offsets = np.stack([panels % self.columns * panel_width,
+                                 panels // self.columns * panel_height], axis=1).astype(np.float32)
+        self.geometry = SceneGeometry(topography, panel_width, panel_height, cell_width, cell_height)
+        # All panels are drawn every frame, so they share the cache limit of a single projection
+        self._projections = [ScreenProjection(simulation.trajectories, self.geometry,
+                                              np.array([p.radius for p in simulation.pedestrians]),
+                                              ScreenProjection.MAX_CACHED_BYTES // n_panels)
+                             for simulation in self.simulations]
+        self._background_drawn = False
+        self._trajectory_step_drawn = None
+        self.show_trajectories = False
+        self.current_step = 0
+        self.color_pedestrian = '#ff0006'
+        self.color_obstacle = '#000000'
+        self.color_source = '#0006ff'
+        self.color_target = '#32d12e'
+        self.color_grid = '#000000'
+        self.color_trajectorie = '#ff0006'
+        self.color_label = '#000000'
+        # Grid cells smaller than this are not outlined
+        self.lod_min_grid_cell_pixels = 4
+        # Highlighted in every panel it is present in, by id since the runs may order their pedestrians differently
+        self.highlighted_pedestrian_id = None
+        self.step_controls = []
+        self.playback = PlaybackScheduler(self._render_frame, fps)
+        self.playback_info = widgets.Label()
+
+    @property
+    def n_steps(self) -> int:
+        '''
+        Number of steps that can be shown, the one of the longest run
+        :return: number of steps
+        '''
+        return max(len(simulation.trajectories) for simulation in self.simulations)
+
+    def _panel_step(self, panel: int, step: int):
+        '''
+        Runs that are shorter than the shown step stay at their last step
+        :param panel: Index of the panel
+        :param step: Shown simulation step
+        :return: step of the run of the panel, None if it has no steps yet
+        '''
+        n_steps = len(self.simulations[panel].trajectories)
+        return min(step, n_steps - 1) if n_steps else None
+
+    def _tile(self, panel_values, axis: int):
+        '''
+        Repeats per-panel coordinates for every panel, shifted by the panel offsets
+        :param panel_values: Coordinates within a panel
+        :param axis: 0 for x-coordinates, 1 for y-coordinates
+        :return: coordinates on the canvas, panel after panel
+        '''
+        return (np.asarray(panel_values, dtype=np.float32)[np.newaxis] +
+                self.offsets[:, axis, np.newaxis]).reshape(-1)
+
+    def invalidate_background(self):
+        '''
+        Forces a redraw of the background layer on the next render, e.g. after a color change
+        :return: None
+        '''
+        self._background_drawn = False
+
+    def draw_background(self):
+        '''
+        Draws the grid, the topography and the labels of all panels onto the background layer
+        :return: None
+        '''
+        layer = self.canvas[self.BACKGROUND_LAYER]
+        topography = self.geometry.topography
+        n_panels = len(self.simulations)
+        with hold_canvas():
+            layer.clear()
+            if min(self.geometry.cell_width, self.geometry.cell_height) >= self.lod_min_grid_cell_pixels:
+                x, y, width, height = self.geometry.grid()
+                layer.stroke_style = self.color_grid
+                layer.stroke_rects(x=self._tile(x, 0), y=self._tile(y, 1), width=width, height=height)
+            for objects, color in ((topography.obstacles, self.color_obstacle),
+                                   (topography.targets, self.color_target),
+                                   (topography.sources, self.color_source)):
+                if not objects:
+                    continue
+                x, y, width, height = self.geometry.objects(objects)
+                layer.fill_style = color
+                layer.fill_rects(x=self._tile(x, 0), y=self._tile(y, 1),
+                                 width=np.tile(width, n_panels), height=np.tile(height, n_panels))
+            # Panel borders
+            layer.stroke_style = self.color_grid
+            layer.stroke_rects(x=self.offsets[:, 0], y=self.offsets[:, 1], width=self.panel_width,
+                               height=self.panel_height)
+            if self.labels is not None:
+                layer.fill_style = self.color_label
+                for (x, y), label in zip(self.offsets.tolist(), self.labels):
+                    layer.fill_text(str(label), x + 4, y + 14)
+        self._background_drawn = True
+
+    def render(self, step: int):
+        '''
+        Draws a simulation step of every panel onto the canvas in a single round-trip
+        :param step: Which simulation step should be drawn
+        :return: None
+        '''
+        if not self._background_drawn:
+            self.draw_background()
+        rects = [[], [], [], []]
+        highlighted = [[], [], [], []]
+        for panel, projection in enumerate(self._projections):
+            panel_step = self._panel_step(panel, step)
+            if panel_step is None:
+                continue
+            x, y, width, height = projection.rects(panel_step)
+            present = projection.present(panel_step)
+            if present is None:
+                present = np.ones(len(x), dtype=bool)
+            ox, oy = self.offsets[panel]
+            for values, panel_values in zip(rects, (x[present] + ox, y[present] + oy, width[present], height[present])):
+                values.append(panel_values)
+            column = self._highlighted_column(panel)
+            if column is not None and present[column]:
+                for values, value in zip(highlighted, (x[column] + ox, y[column] + oy, width[column], height[column])):
+                    values.append([value])
+        with hold_canvas():
+            layer = self.canvas[self.PEDESTRIAN_LAYER]
+            layer.clear()
+            if rects[0]:
+                x, y, width, height = (np.concatenate(values) for values in rects)
+                layer.fill_style = self.color_pedestrian
+                layer.fill_rects(x=x, y=y, width=width, height=height)
+            if highlighted[0]:
+                x, y, width, height = (np.concatenate(values) for values in highlighted)
+                layer.fill_style = 'yellow'
+                layer.fill_rects(x=x, y=y, width=width, height=height)
+            self.draw_trajectories(step)
+
+    def _highlighted_column(self, panel: int):
+        '''
+        Returns the column of the highlighted pedestrian in the run of a panel
+        :param panel: Index of the panel
+        :return: column, None if the run has no such pedestrian
+        '''
+        if self.highlighted_pedestrian_id is None:
+            return None
+        column = self.simulations[panel].trajectories.columns_of(np.array([self.highlighted_pedestrian_id]))[0]
+        return int(column) if column >= 0 else None
+
+    def draw_trajectories(self, step: int):
+        '''
+        Draws the trajectories of all panels up to the given step. When advancing from the step drawn last, only
+        the new segments are added. Segments of the same length are sent in one command for all panels.
+        :param step: Last simulation step of the trajectories
+        :return: None
+        '''
+        layer = self.canvas[self.TRAJECTORY_LAYER]
+        if not self.show_trajectories:
+            if self._trajectory_step_drawn is not None:
+                layer.clear()
+                self._trajectory_step_drawn = None
+            return
+        if self._trajectory_step_drawn is None or step < self._trajectory_step_drawn:
+            layer.clear()
+            start = 0
+        else:
+            start = self._trajectory_step_drawn
+        by_length = {}
+        for panel, projection in enumerate(self._projections):
+            panel_step = self._panel_step(panel, step)
+            if panel_step is None or panel_step <= start:
+                continue
+            segments = projection.segments(start, panel_step) + self.offsets[panel]
+            by_length.setdefault(segments.shape[1], []).append(segments)
+        layer.stroke_style = self.color_trajectorie
+        for segments in by_length.values():
+            layer.stroke_line_segments(np.concatenate(segments))
+        self._trajectory_step_drawn = step
+
+    def panel_at(self, x, y):
+        '''
+        Returns the panel under a canvas position
+        :param x: x-coordinate on the canvas
+        :param y: y-coordinate on the canvas
+        :return: index of the panel, None outside of all panels
+        '''
+        column, row = int(x // self.panel_width), int(y // self.panel_height)
+        panel = row * self.columns + column
+        if not 0 <= column < self.columns or not 0 <= panel < len(self.simulations):
+            return None
+        return panel
+
+    def handle_mouse_down(self, x, y):
+        '''
+        Highlights the clicked pedestrian in all panels
+        :param x: x-coordinate of the mouse position
+        :param y: y-coordinate of the mouse position
+        :return: None
+        '''
+        panel = self.panel_at(x, y)
+        if panel is None:
+            return
+        panel_step = self._panel_step(panel, self.current_step)
+        if panel_step is None:
+            return
+        projection = self._projections[panel]
+        px, py, pwidth, pheight = projection.rects(panel_step)
+        present = projection.present(panel_step)
+        if present is not None:
+            pwidth, pheight = np.where(present, pwidth, 0), np.where(present, pheight, 0)
+        ox, oy = self.offsets[panel]
+        hits = RectangleGridIndex(px, py, pwidth, pheight).query(x - ox, y - oy)
+        if len(hits):
+            self.highlighted_pedestrian_id = int(self.simulations[panel].trajectories.ids[hits[-1]])
+            self.render(self.current_step)
+
+    def toggle_trajectories(self, toggle_info):
+        '''
+        This function activates or deactivates the trajectories of all panels
+        :param toggle_info: Information from the toggle button widget
+        :return: None
+        '''
+        self.show_trajectories = not self.show_trajectories
+        self.render(self.current_step)
+
+    def update_step(self, change):
+        '''
+        This function updates the current step of all panels
+        :param change: The new information coming from the slider
+        :return: None
+        '''
+        if(change['name'] == 'value'):
+            self.current_step = change['new']
+            self.playback.request(self.current_step)
+
+    def _render_frame(self, step: int):
+        '''
+        Renders a step requested by the playback scheduler
+        :param step: Simulation step
+        :return: None
+        '''
+        self.render(step)
+        if self.playback.n_rendered % max(int(self.playback.fps), 1) == 0:
+            stats = self.playback.stats()
+            self.playback_info.value = '{:.1f} / {:g} fps, {} frames dropped'.format(
+                stats['achieved_fps'], stats['target_fps'], stats['n_dropped'])
+
+    def update_step_range(self, n_steps: int):
+        '''
+        This function extends the play and slider range, e.g. while the runs are still loading
+        :param n_steps: Number of simulation steps that can be shown
+        :return: None
+        '''
+        for control in self.step_controls:
+            control.max = max(n_steps - 1, 0)
+
+    def build_gui(self):
+        '''
+        This function creates the layout with one play button and slider for all panels
+        :param: None
+        :return: Final layout with all the widgets
+        '''
+        last_step = max(self.n_steps - 1, 0)
+        play = widgets.Play(value=0, min=0, max=last_step, step=1, interval=int(1000 / self.playback.fps),
+                            description="Press play", disabled=False)
+        slider = widgets.IntSlider(value=0, min=0, max=last_step, step=1)
+        self.step_controls = [play, slider]
+        slider.observe(self.update_step)
+        widgets.jslink((play, 'value'), (slider, 'value'))
+
+        trajectories = widgets.ToggleButton(value=self.show_trajectories, description='Show Trajectories',
+                                            tooltip='Toggles the trajectories of the pedestrians', icon='check')
+        trajectories.observe(self.toggle_trajectories, names='value')
+
+        self.render(self.current_step)
+        return widgets.VBox([widgets.HBox([play, slider, trajectories, self.playback_info]), self.canvas])
@@ -0,0 +1,124 @@
+import unittest
+import numpy as np
+from benchmarks.recording import RecordingCanvas
+from src.cms_visualizer.aggregation import SimulationAggregates
+from src.cms_visualizer.simulation import Simulation, Pedestrian
+from src.cms_visualizer.topography import Topography, RectangularSource, RectangularTarget
+from src.cms_visualizer.visualization import Visualizer
+
+
+class AggregationTest(unittest.TestCase):
+
+    def setUp(self):
+        topography = (
+            Topography(10, 4)
+            .with_sources([RectangularSource(1, 0, 0, 2, 2)])
+            .with_targets([RectangularTarget(2, 7, 0, 2, 2)])
+        )
+        pedestrians = [Pedestrian(1, 1, None), Pedestrian(2, 1, None)]
+        self.sim = Simulation(topography, pedestrians, 6, [])
+        self.sim.add_simulation_steps(np.array([
+            [[0, 0], [1, 1]],
+            [[3, 0], [1, 1]],
+            [[5, 0], [3, 1]],
+            [[7, 0], [5, 1]],
+            [[7, 0], [7, 1]],
+            [[9, 3], [7, 1]],
+        ]))
+
+    def test_visits(self):
+        aggregates = self.sim.aggregate()
+        self.assertEqual(aggregates.visits().shape, (4, 10))
+        self.assertEqual(aggregates.visits().sum(), 12)
+        self.assertEqual(aggregates.visits()[0, 7], 2)
+        self.assertEqual(aggregates.visits(3, 5)[0, 7], 2)
+        self.assertEqual(aggregates.visits(0, 3)[1, 1], 2)
+        self.assertEqual(aggregates.visits(4, 4).sum(), 0)
+        np.testing.assert_allclose(aggregates.density(4, 6)[1, 7], 1)
+
+    def test_visits_beyond_memory_budget(self):
+        # A budget of two table rows keeps one single-row segment in memory and writes the others to files
+        aggregates = SimulationAggregates(self.sim, memory_budget=2 * 40 * 4, block_steps=1)
+        self.assertEqual(aggregates.segment_steps, 1)
+        self.assertTrue(any(isinstance(segment, np.memmap) for segment in aggregates._segments))
+        self.assertLessEqual(aggregates.nbytes - aggregates._inflow.nbytes - aggregates._outflow.nbytes, 2 * 40 * 4)
+        reference = self.sim.aggregate()
+        # Queries only read the tables, not the positions
+        reads = []
+        get_steps = self.sim.trajectories.get_steps
+        self.sim.trajectories.get_steps = lambda start, stop: reads.append((start, stop)) or get_steps(start, stop)
+        for start in range(7):
+            for stop in range(start, 7):
+                np.testing.assert_array_equal(aggregates.visits(start, stop), reference.visits(start, stop))
+        self.assertEqual(reads, [])
+
+    def test_update(self):
+        steps = self.sim.trajectories.get_steps(0, 6)
+        for budget in (None, 3 * 40 * 4):
+            streamed = Simulation(self.sim.topography, self.sim.pedestrians, 6, [])
+            aggregates = (streamed.aggregate() if budget is None else
+                          SimulationAggregates(streamed, memory_budget=budget, block_steps=2))
+            for step in range(6):
+                streamed.add_simulation_steps(steps[step:step + 1])
+                self.assertEqual(aggregates.update(), 1)
+                reference = SimulationAggregates(streamed)
+                for start in range(step + 2):
+                    for stop in range(start, step + 2):
+                        np.testing.assert_array_equal(aggregates.visits(start, stop), reference.visits(start, stop))
+                        np.testing.assert_array_equal(aggregates.inflow(start, stop), reference.inflow(start, stop))
+                        np.testing.assert_array_equal(aggregates.outflow(start, stop), reference.outflow(start, stop))
+            self.assertEqual(aggregates.update(), 0)
+            if budget is not None:
+                # Rows beyond the budget were written to files
+                self.assertTrue(isinstance(aggregates._segments[-1], np.memmap))
+
+    def test_flows(self):
+        aggregates = self.sim.aggregate()
+        self.assertEqual(aggregates.object_ids.tolist(), [1, 2])
+        # Both leave the source, both reach the target and one of them leaves it again
+        self.assertEqual(aggregates.inflow().tolist(), [0, 2])
+        self.assertEqual(aggregates.outflow().tolist(), [2, 1])
+        self.assertEqual(aggregates.inflow(4, 6).tolist(), [0, 1])
+        self.assertEqual(aggregates.outflow(0, 2).tolist(), [1, 0])
+
+    def test_heatmap(self):
+        canvas = RecordingCanvas(Visualizer.N_LAYERS, 100, 40)
+        visualizer = Visualizer(self.sim, 10, 10, 100, 40, canvas=canvas)
+        visualizer.show_heatmap = True
+        visualizer.heatmap_window = 2
+        visualizer.render(4)
+        images = [size for name, size in canvas.commands if name == 'put_image_data']
+        # One pixel per topography cell, scaled to the canvas
+        self.assertEqual(len(images), 1)
+        self.assertLess(images[0], 4 * 10 * 4 + 64)
+        self.assertIn('draw_image', [name for name, _ in canvas.commands])
+        self.assertEqual(visualizer.heatmap_range(4), (3, 5))
+        # Nothing changed, so the heatmap is not sent again
+        canvas.reset()
+        visualizer.render(4)
+        self.assertFalse(any(name in ('put_image_data', 'draw_image') for name, _ in canvas.commands))
+        # The window moves, but a pedestrian standing still leaves the image as it is
+        standing = Simulation(self.sim.topography, self.sim.pedestrians[:1], 3, [])
+        standing.add_simulation_steps(np.full((3, 1, 2), 2))
+        visualizer.simulation = standing
+        visualizer.highlighted_pedestrian = 0
+        visualizer.render(1)
+        canvas.reset()
+        visualizer.render(2)
+        self.assertFalse(any(name == 'put_image_data' for name, _ in canvas.commands))
+
+    def test_visualizer_updates_aggregates(self):
+        steps = self.sim.trajectories.get_steps(0, 6)
+        streamed = Simulation(self.sim.topography, self.sim.pedestrians, 6, [])
+        streamed.add_simulation_steps(steps[:3])
+        visualizer = Visualizer(streamed, 10, 10, 100, 40, canvas=RecordingCanvas(Visualizer.N_LAYERS, 100, 40))
+        aggregates = visualizer.aggregates()
+        streamed.add_simulation_steps(steps[3:])
+        # The tables are extended by the new steps instead of being rebuilt
+        self.assertIs(visualizer.aggregates(), aggregates)
+        self.assertEqual(aggregates.n_steps, 6)
+        self.assertEqual(aggregates.inflow().tolist(), [0, 2])
+
+
+if __name__ == '__main__':
+    unittest.main()
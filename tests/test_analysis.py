@@ -0,0 +1,104 @@
+import unittest
+import numpy as np
+from benchmarks.recording import RecordingCanvas
+from src.cms_visualizer.analysis import (find_violations, pedestrian_overlaps, obstacle_penetrations,
+                                         PEDESTRIAN_OVERLAP, OBSTACLE_PENETRATION)
+from src.cms_visualizer.simulation import Simulation, Pedestrian
+from src.cms_visualizer.topography import Topography, RectangularObstacle
+from src.cms_visualizer.visualization import Visualizer
+
+
+class AnalysisTest(unittest.TestCase):
+
+    def setUp(self):
+        topography = Topography(20, 20).with_obstacles([RectangularObstacle(7, 10, 10, 3, 2)])
+        pedestrians = [Pedestrian(1, 1, None), Pedestrian(2, 1, None), Pedestrian(5, 0.5, None)]
+        self.sim = Simulation(topography, pedestrians, 3, [])
+        self.sim.add_simulation_steps(np.array([
+            # No violations, the obstacle is only touched
+            [[0, 0], [5, 5], [9.5, 10]],
+            # 1 and 2 overlap, 5 is inside the obstacle
+            [[0, 0], [0.5, 0.5], [11, 11]],
+            # 2 reaches into the obstacle from the left
+            [[0, 0], [9.5, 10.5], [19, 19]],
+        ]))
+
+    def test_pedestrian_overlaps(self):
+        steps, first, second, depth = pedestrian_overlaps(
+            self.sim.trajectories.get_steps(0, 3), np.array([1, 1, 0.5]))
+        self.assertEqual(steps.tolist(), [1])
+        self.assertEqual((first.tolist(), second.tolist()), ([0], [1]))
+        self.assertAlmostEqual(depth[0], 0.5)
+
+    def test_pedestrian_overlaps_match_brute_force(self):
+        rng = np.random.default_rng(0)
+        positions = rng.uniform(0, 30, (4, 200, 2))
+        radius = rng.uniform(0.2, 1, 200)
+        steps, first, second, _ = pedestrian_overlaps(positions, radius)
+        expected = set()
+        for step in range(4):
+            low = np.maximum(positions[step, :, None], positions[step, None])
+            high = np.minimum(positions[step, :, None] + radius[:, None, None], positions[step, None] + radius[None, :, None])
+            i, j = np.nonzero((high > low).all(axis=-1))
+            expected |= {(step, a, b) for a, b in zip(i, j) if a < b}
+        self.assertEqual(set(zip(steps.tolist(), first.tolist(), second.tolist())), expected)
+
+    def test_obstacle_penetrations(self):
+        topography = self.sim.topography
+        steps, columns, obstacles, depth = obstacle_penetrations(
+            self.sim.trajectories.get_steps(0, 3), np.array([1, 1, 0.5]),
+            topography.label_raster(), topography.blocked_raster())
+        self.assertEqual(list(zip(steps.tolist(), columns.tolist(), obstacles.tolist())), [(1, 2, 7), (2, 1, 7)])
+        np.testing.assert_allclose(depth, [0.5, 0.5])
+
+    def test_touching_obstacle_is_no_penetration(self):
+        topography = Topography(20, 20).with_obstacles([RectangularObstacle(1, 10, 10, 2, 2)])
+        # Cells to the left, right, below, above and diagonal to the obstacle cells
+        positions = np.array([[[9, 10], [12, 11], [10, 9], [11, 12], [9, 9], [12, 12], [9.5, 12]]])
+        steps, columns, obstacles, depth = obstacle_penetrations(
+            positions, np.ones(7), topography.label_raster(), topography.blocked_raster())
+        self.assertEqual(len(steps), 0)
+
+    def test_adjacent_pedestrians_do_not_overlap(self):
+        # A block of four pedestrians in neighbouring cells and one diagonal to it
+        positions = np.array([[[0, 0], [1, 0], [0, 1], [1, 1], [2, 2]]])
+        steps, first, second, depth = pedestrian_overlaps(positions, np.ones(5))
+        self.assertEqual(len(steps), 0)
+
+    def test_covered_cells_are_violations(self):
+        topography = Topography(20, 20).with_obstacles([RectangularObstacle(1, 10, 10, 2, 2)])
+        # Radius 2 covers the obstacle cell (10, 10) from the cell diagonal to it, radius 1
+        # reaches half a cell into it from the left
+        positions = np.array([[[9, 9], [9.5, 11], [3, 3], [4, 4.75]]])
+        radius = np.array([2, 1, 2, 1])
+        steps, columns, obstacles, depth = obstacle_penetrations(
+            positions, radius, topography.label_raster(), topography.blocked_raster())
+        self.assertEqual(columns.tolist(), [0, 1])
+        self.assertEqual(obstacles.tolist(), [1, 1])
+        np.testing.assert_allclose(depth, [1, 0.5])
+        steps, first, second, depth = pedestrian_overlaps(positions, radius)
+        # 3 reaches a quarter of a cell into the top row of the block covered by 2
+        self.assertEqual(list(zip(first.tolist(), second.tolist())), [(2, 3)])
+        np.testing.assert_allclose(depth, [0.25])
+
+    def test_find_violations(self):
+        violations = find_violations(self.sim, chunk_steps=2)
+        self.assertEqual(violations['step'].tolist(), [1, 1, 2])
+        self.assertEqual(violations['kind'].tolist(), [PEDESTRIAN_OVERLAP, OBSTACLE_PENETRATION, OBSTACLE_PENETRATION])
+        self.assertEqual(violations['pedestrian'].tolist(), [1, 5, 2])
+        self.assertEqual(violations['other'].tolist(), [2, 7, 7])
+        parallel = find_violations(self.sim, jobs=2, chunk_steps=1)
+        np.testing.assert_array_equal(parallel, violations)
+        self.assertEqual(len(find_violations(self.sim, start=2)), 1)
+
+    def test_violations_browser(self):
+        visualizer = Visualizer(self.sim, 4, 4, 80, 80, canvas=RecordingCanvas(Visualizer.N_LAYERS, 80, 80))
+        browser = visualizer.violations_browser(find_violations(self.sim))
+        self.assertEqual(len(browser.options), 3)
+        browser.value = 1
+        self.assertEqual(visualizer.current_step, 1)
+        self.assertEqual(visualizer.highlighted_pedestrian, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
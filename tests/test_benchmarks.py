@@ -0,0 +1,39 @@
+import unittest
+from benchmarks.recording import RecordingCanvas
+from benchmarks.suite import compare
+from benchmarks.synthetic import Scenario, positions, simulation
+from src.cms_visualizer.visualization import Visualizer
+
+
+class BenchmarksTest(unittest.TestCase):
+
+    def test_synthetic_run(self):
+        scenario = Scenario(n_pedestrians=30, n_steps=40, n_obstacles=5, grid_size=20)
+        steps = positions(scenario)
+        self.assertEqual(steps.shape, (40, 30, 2))
+        self.assertTrue(0 <= steps.min() and steps.max() < 20)
+        sim = simulation(scenario)
+        self.assertTrue(sim.is_simulation_complete())
+        self.assertEqual(len(sim.topography.obstacles), 5)
+
+    def test_recording_canvas(self):
+        sim = simulation(Scenario(n_pedestrians=30, n_steps=5, n_obstacles=5, grid_size=20))
+        canvas = RecordingCanvas(Visualizer.N_LAYERS, 80, 80)
+        visualizer = Visualizer(sim, 4, 4, 80, 80, canvas=canvas)
+        visualizer.render(0)
+        names = [name for name, _ in canvas.commands]
+        self.assertIn('fill_rects', names)
+        self.assertIn('stroke_rects', names)
+        self.assertGreater(canvas.n_bytes, 0)
+        canvas.reset()
+        visualizer.render(1)
+        self.assertNotIn('stroke_rects', [name for name, _ in canvas.commands])
+
+    def test_compare(self):
+        baseline = {'a': {'seconds': 1.0}, 'b': {'seconds': 1.0}, 'c': {'seconds': 1.0}}
+        results = {'a': {'seconds': 1.2}, 'b': {'seconds': 1.5}, 'd': {'seconds': 9.0}}
+        self.assertEqual(compare(results, baseline, 0.25), [('b', 1.0, 1.5)])
+
+
+if __name__ == '__main__':
+    unittest.main()
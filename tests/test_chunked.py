@@ -0,0 +1,101 @@
+import os
+import unittest
+from unittest import mock
+import numpy as np
+from benchmarks.recording import RecordingCanvas
+from benchmarks.synthetic import Scenario, simulation
+from src.cms_visualizer.chunked import ChunkedTrajectorySource
+from src.cms_visualizer.geometry import SceneGeometry
+from src.cms_visualizer.projection import ScreenProjection
+from src.cms_visualizer.simulation import Simulation
+from src.cms_visualizer.visualization import Visualizer
+
+
+class ChunkedTrajectorySourceTest(unittest.TestCase):
+
+    def setUp(self):
+        self.positions = np.arange(10 * 3 * 2, dtype=np.int32).reshape(10, 3, 2)
+        self.reads = []
+
+        def read(start, stop):
+            self.reads.append((start, stop))
+            return self.positions[start:stop]
+        self.reads_of = read
+        # Room for two chunks of 4 steps
+        self.source = ChunkedTrajectorySource([1, 2, 3], 10, read, chunk_steps=4,
+                                              memory_budget=2 * 4 * 3 * 2 * 4, prefetch=False)
+
+    def test_get_steps(self):
+        np.testing.assert_array_equal(self.source.get_steps(2, 9), self.positions[2:9])
+        np.testing.assert_array_equal(self.source.get_step(9), self.positions[9])
+        self.assertEqual(self.source.get_steps(10, 12).shape, (0, 3, 2))
+        with self.assertRaises(IndexError):
+            self.source.get_step(10)
+
+    def test_cache(self):
+        self.source.get_step(0)
+        self.source.get_step(1)
+        self.source.get_step(5)
+        self.assertEqual(self.source.n_reads, 2)
+        # Loading the third chunk evicts the least recently used first one
+        self.source.get_step(8)
+        self.assertLessEqual(self.source.n_cached_bytes, self.source.memory_budget)
+        self.source.get_step(5)
+        self.assertEqual(self.source.n_reads, 3)
+        self.source.get_step(0)
+        self.assertEqual(self.source.n_reads, 4)
+
+    def test_prefetch(self):
+        source = ChunkedTrajectorySource([1, 2, 3], 10, self.reads_of, chunk_steps=4)
+        source.get_step(1)
+        source.close()
+        self.assertEqual(sorted(r for r in self.reads if r != (0, 0)), [(0, 4), (4, 8)])
+
+
+class ChunkedSimulationTest(unittest.TestCase):
+
+    def setUp(self):
+        self.path = 'tests/chunked_simulation.bin'
+        self.sim = simulation(Scenario(n_pedestrians=20, n_steps=30, n_obstacles=3, grid_size=20))
+
+    def tearDown(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def test_binary(self):
+        for sim in (self.sim, self.sim.delta_encoded(8)):
+            sim.to_binary(self.path)
+            loaded = Simulation.from_binary(self.path, chunk_steps=7, memory_budget=4096)
+            self.assertIsInstance(loaded.trajectories, ChunkedTrajectorySource)
+            self.assertTrue(loaded.is_simulation_complete())
+            np.testing.assert_array_equal(loaded.trajectories.get_steps(0, 30), sim.trajectories.get_steps(0, 30))
+            self.assertLessEqual(loaded.trajectories.n_cached_bytes, 4096)
+            loaded.trajectories.close()
+
+    def test_visualizer(self):
+        self.sim.to_binary(self.path)
+        loaded = Simulation.from_binary(self.path, chunk_steps=8)
+        canvas = RecordingCanvas(Visualizer.N_LAYERS, 80, 80)
+        visualizer = Visualizer(loaded, 4, 4, 80, 80, canvas=canvas)
+        visualizer.show_trajectories = True
+        with mock.patch.object(ScreenProjection, 'MAX_CACHED_BYTES', 0):
+            for step in range(30):
+                visualizer.render(step)
+            self.assertFalse(visualizer.projection().cached)
+        visualizer.handle_mouse_down(1, 1)
+        loaded.trajectories.close()
+
+    def test_uncached_projection(self):
+        geometry = SceneGeometry(self.sim.topography, 80, 80, 4, 4)
+        radius = np.ones(20)
+        cached = ScreenProjection(self.sim.trajectories, geometry, radius)
+        with mock.patch.object(ScreenProjection, 'MAX_CACHED_BYTES', 0):
+            uncached = ScreenProjection(self.sim.trajectories, geometry, radius)
+        self.assertTrue(cached.cached)
+        self.assertFalse(uncached.cached)
+        np.testing.assert_array_equal(uncached.step(7), cached.step(7))
+        np.testing.assert_array_equal(uncached.segments(3, 9), cached.segments(3, 9))
+
+
+if __name__ == '__main__':
+    unittest.main()
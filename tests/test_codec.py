@@ -0,0 +1,88 @@
+import os
+import unittest
+import numpy as np
+from src.cms_visualizer.codec import DeltaTrajectoryStore
+from src.cms_visualizer.trajectory import TrajectoryStore
+from src.cms_visualizer.simulation import Simulation
+
+
+class DeltaTrajectoryStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        moves = rng.integers(-2, 3, (50, 4, 2))
+        self.positions = (100 + np.cumsum(moves, axis=0)).astype(np.int16)
+        self.store = DeltaTrajectoryStore([1, 2, 3, 4], keyframe_interval=8, dtype=np.int16)
+        for start in range(0, 50, 7):
+            self.store.append(self.positions[start:start + 7])
+
+    def test_random_access(self):
+        self.assertEqual(len(self.store), 50)
+        self.assertEqual(self.store.deltas.dtype, np.int8)
+        for step in (0, 7, 8, 9, 49, 23, 24, 3):
+            np.testing.assert_array_equal(self.store.get_step(step), self.positions[step])
+        np.testing.assert_array_equal(self.store.get_steps(5, 30), self.positions[5:30])
+        np.testing.assert_array_equal(self.store.get_steps(45, 60), self.positions[45:])
+        self.assertEqual(self.store.get_steps(50, 60).shape, (0, 4, 2))
+        self.assertEqual(self.store.get_step(3).dtype, np.int16)
+        with self.assertRaises(IndexError):
+            self.store.get_step(50)
+
+    def test_sequential_access(self):
+        for step in range(50):
+            np.testing.assert_array_equal(self.store.get_step(step), self.positions[step])
+
+    def test_large_moves(self):
+        jump = self.positions[-2:].copy()
+        jump[0, 1, 0] += 1000
+        self.store.append(jump)
+        # Only the coordinate moving out and back is escaped, the deltas stay int8
+        self.assertEqual(self.store.deltas.dtype, np.int8)
+        positions = np.concatenate([self.positions, jump]).astype(int)
+        moves = np.diff(positions[48:, 1, 0]).tolist()
+        self.assertEqual(self.store.escapes.tolist(), [[50, 2, moves[1]], [51, 2, moves[2]]])
+        np.testing.assert_array_equal(self.store.get_steps(0, 52), positions)
+        for step in (51, 50, 49, 48):
+            np.testing.assert_array_equal(self.store.get_step(step), positions[step])
+
+    def test_fractional_positions(self):
+        with self.assertRaises(ValueError):
+            self.store.append(np.full((1, 4, 2), 0.5))
+
+    def test_encode(self):
+        store = DeltaTrajectoryStore.encode(TrajectoryStore.from_array([1, 2, 3, 4], self.positions), 16, 10)
+        np.testing.assert_array_equal(store.get_steps(0, 50), self.positions)
+        self.assertLess(store.nbytes, self.positions.nbytes)
+
+
+class DeltaEncodedSimulationTest(unittest.TestCase):
+
+    def test_json(self):
+        sim = Simulation.from_json('tests/valid_simulation.json', keyframe_interval=2)
+        self.assertIsInstance(sim.trajectories, DeltaTrajectoryStore)
+        plain = Simulation.from_json('tests/valid_simulation.json')
+        self.assertEqual(list(sim.simulation_steps), list(plain.simulation_steps))
+
+    def test_binary(self):
+        path = 'tests/delta_simulation.bin'
+        try:
+            sim = Simulation.from_json('tests/valid_simulation.json').delta_encoded(2)
+            sim.to_binary(path)
+            loaded = Simulation.from_binary(path)
+            self.assertIsInstance(loaded.trajectories, DeltaTrajectoryStore)
+            self.assertIsInstance(loaded.trajectories.deltas, np.memmap)
+            self.assertEqual(list(loaded.simulation_steps), list(sim.simulation_steps))
+            # A pedestrian jumping across the area is kept as escapes
+            store = DeltaTrajectoryStore.encode(TrajectoryStore.from_array([1], np.array([[[0, 0]], [[900, 0]]])), 2)
+            sim = Simulation(sim.topography, sim.pedestrians[:1], 2, [], store)
+            sim.to_binary(path)
+            loaded = Simulation.from_binary(path)
+            self.assertEqual(len(loaded.trajectories.escapes), 1)
+            np.testing.assert_array_equal(loaded.trajectories.get_step(1), [[900, 0]])
+        finally:
+            if os.path.exists(path):
+                os.remove(path)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import unittest
+from unittest import mock
+import numpy as np
+from benchmarks.recording import RecordingCanvas
+from src.cms_visualizer.simulation import Simulation, Pedestrian
+from src.cms_visualizer.topography import Topography, RectangularObstacle
+from src.cms_visualizer.projection import ScreenProjection
+from src.cms_visualizer.visualization import ComparisonVisualizer
+
+
+def run(topography, n_steps, shift):
+    pedestrians = [Pedestrian(1, 1, None), Pedestrian(2, 1, None)]
+    sim = Simulation(topography, pedestrians, n_steps, [])
+    sim.add_simulation_steps(np.array([[[step, shift], [step, 5 + shift]] for step in range(n_steps)]))
+    return sim
+
+
+class ComparisonVisualizerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.topography = Topography(10, 10).with_obstacles([RectangularObstacle(3, 8, 8, 1, 1)])
+        self.sims = [run(self.topography, 5, shift) for shift in range(3)] + [run(self.topography, 3, 3)]
+        self.canvas = RecordingCanvas(ComparisonVisualizer.N_LAYERS, 80, 80)
+        self.visualizer = ComparisonVisualizer(self.sims, 4, 4, 40, 40, canvas=self.canvas)
+
+    def test_layout(self):
+        self.assertEqual((self.visualizer.columns, self.visualizer.rows), (2, 2))
+        self.assertEqual(self.visualizer.n_steps, 5)
+        self.assertEqual(self.visualizer.panel_at(45, 41), 3)
+        self.assertIsNone(self.visualizer.panel_at(85, 1))
+
+    def test_topography_must_match(self):
+        other = Topography(10, 10).with_obstacles([RectangularObstacle(3, 7, 8, 1, 1)])
+        with self.assertRaises(ValueError):
+            ComparisonVisualizer(self.sims + [run(other, 5, 0)], 4, 4, 40, 40, canvas=self.canvas)
+        # An equal topography loaded separately is fine
+        same = Topography(10, 10).with_obstacles([RectangularObstacle(3, 8, 8, 1, 1)])
+        ComparisonVisualizer(self.sims + [run(same, 5, 0)], 4, 4, 40, 40, canvas=self.canvas)
+
+    def test_panels_share_the_projection_cache(self):
+        # Room for two whole runs of 5 steps, 2 pedestrians and 2 float32 coordinates
+        limit = 2 * 5 * 2 * 2 * 4
+        with mock.patch.object(ScreenProjection, 'MAX_CACHED_BYTES', limit):
+            visualizer = ComparisonVisualizer(self.sims, 4, 4, 40, 40, canvas=self.canvas)
+            for step in range(5):
+                visualizer.render(step)
+        projections = visualizer._projections
+        self.assertEqual([projection.max_cached_bytes for projection in projections], [limit // 4] * 4)
+        self.assertLessEqual(sum(projection._points.nbytes for projection in projections if projection.cached),
+                             limit)
+        self.assertFalse(projections[0].cached)
+
+    def test_commands_do_not_grow_with_panels(self):
+        self.visualizer.show_trajectories = True
+        self.visualizer.render(0)
+        background = [name for name, _ in self.canvas.commands].count('fill_rects')
+        self.canvas.reset()
+        self.visualizer.render(4)
+        commands = [name for name, _ in self.canvas.commands]
+        # The background is drawn once, every later step sends one pedestrian and one trajectory batch
+        self.assertGreater(background, 0)
+        self.assertEqual(commands.count('fill_rects'), 1)
+        self.assertEqual(commands.count('stroke_line_segments'), 2)
+
+    def test_click_highlights_in_all_panels(self):
+        self.visualizer.render(0)
+        # Pedestrian 2 of the third panel is at (0, 7), two cells of 4 pixels per unit
+        self.visualizer.handle_mouse_down(1, 40 + 7 * 4 + 1)
+        self.assertEqual(self.visualizer.highlighted_pedestrian_id, 2)
+        self.canvas.reset()
+        self.visualizer.render(0)
+        self.assertEqual([name for name, _ in self.canvas.commands].count('fill_rects'), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,36 @@
+import subprocess
+import sys
+import unittest
+
+# Modules a headless job may use, none of which may load the widget stack
+CORE_MODULES = ['simulation', 'topography', 'trajectory', 'sparse', 'codec', 'binary', 'chunked', 'streaming',
+                'analysis', 'aggregation', 'kinematics', 'rendering', 'geometry', 'projection', 'spatial', 'lod',
+                'playback', 'instrumentation', 'pyramid', 'cli']
+WIDGET_PACKAGES = ('ipycanvas', 'ipywidgets', 'IPython')
+
+
+def imported_packages(code: str):
+    """Top-level packages loaded by running ``code`` in a fresh interpreter"""
+    output = subprocess.run([sys.executable, '-c', code + '\nimport sys\nprint(" ".join(sys.modules))'],
+                            check=True, capture_output=True, text=True).stdout
+    return {name.split('.')[0] for name in output.split()}
+
+
+class ImportTest(unittest.TestCase):
+
+    def test_core_is_headless(self):
+        packages = imported_packages('\n'.join('import src.cms_visualizer.' + name for name in CORE_MODULES))
+        self.assertFalse(packages & set(WIDGET_PACKAGES))
+
+    def test_visualizer_is_loaded_lazily(self):
+        packages = imported_packages('import src.cms_visualizer as package\npackage.Visualizer')
+        self.assertIn('ipycanvas', packages)
+        import src.cms_visualizer as package
+        from src.cms_visualizer.visualization import Visualizer
+        self.assertIs(package.Visualizer, Visualizer)
+        with self.assertRaises(AttributeError):
+            package.Missing
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+import unittest
+import numpy as np
+from benchmarks.recording import RecordingCanvas
+from benchmarks.synthetic import Scenario, simulation
+from src.cms_visualizer.instrumentation import FrameProfiler, payload_size
+from src.cms_visualizer.visualization import Visualizer
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        self.now += 1.0
+        return self.now
+
+
+class FrameProfilerTest(unittest.TestCase):
+
+    def test_payload_size(self):
+        self.assertEqual(payload_size((np.zeros(10, dtype=np.float32), 'red', 3)), 40 + 3 + 8)
+
+    def test_frames(self):
+        profiler = FrameProfiler(window=2, clock=FakeClock())
+        canvas = RecordingCanvas(1, 10, 10)
+        layer = profiler.wrap(canvas[0])
+        layer.fill_rect(0, 0, 1, 1)
+        for step in range(3):
+            with profiler.frame(step):
+                with profiler.phase('pedestrians'):
+                    layer.fill_style = 'red'
+                    layer.fill_rects(np.zeros(4), np.zeros(4), 1, 1)
+                with profiler.frame(step):
+                    with profiler.phase('pedestrians'):
+                        pass
+        self.assertEqual(len(canvas.commands), 7)
+        self.assertEqual([f.step for f in profiler.frames], [1, 2])
+        stats = profiler.stats()
+        self.assertEqual(stats['n_frames'], 2)
+        self.assertEqual(stats['commands_per_frame'], 2)
+        self.assertEqual(stats['bytes_per_frame'], 3 + 32 + 32 + 16)
+        self.assertEqual(stats['frame_time_p50'], 5)
+        self.assertEqual(stats['phases'], {'pedestrians': 2})
+
+    def test_visualizer(self):
+        sim = simulation(Scenario(n_pedestrians=20, n_steps=5, n_obstacles=3, grid_size=20))
+        visualizer = Visualizer(sim, 4, 4, 80, 80, canvas=RecordingCanvas(Visualizer.N_LAYERS, 80, 80))
+        profiler = visualizer.enable_profiling()
+        visualizer.render(0)
+        visualizer.render(1)
+        first, second = profiler.frames
+        self.assertTrue({'grid', 'obstacles', 'pedestrians', 'highlight', 'trajectories'} <= first.phases.keys())
+        self.assertNotIn('grid', second.phases)
+        self.assertLess(second.commands, first.commands)
+        self.assertIn('commands', visualizer.profiling_overlay().value)
+        visualizer.disable_profiling()
+        visualizer.render(2)
+        self.assertEqual(len(profiler.frames), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
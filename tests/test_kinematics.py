@@ -0,0 +1,109 @@
+import os
+import unittest
+import numpy as np
+from benchmarks.recording import RecordingCanvas
+from src.cms_visualizer.kinematics import NOT_REACHED, PedestrianTrack
+from src.cms_visualizer.simulation import Simulation, Pedestrian
+from src.cms_visualizer.topography import Topography, RectangularTarget
+from src.cms_visualizer.visualization import Visualizer
+
+
+class KinematicsTest(unittest.TestCase):
+
+    def setUp(self):
+        topography = Topography(10, 10).with_targets([RectangularTarget(2, 6, 0, 2, 2)])
+        pedestrians = [Pedestrian(1, 1, None), Pedestrian(2, 1, None)]
+        self.sim = Simulation(topography, pedestrians, 5, [])
+        self.positions = np.array([
+            [[0, 0], [0, 9]],
+            [[3, 4], [0, 9]],
+            [[6, 4], [1, 9]],
+            [[6, 1], [1, 8]],
+            [[9, 1], [1, 7]],
+        ])
+
+    def test_kinematics(self):
+        self.sim.add_simulation_steps(self.positions)
+        kinematics = self.sim.kinematics()
+        self.assertEqual(len(kinematics), 5)
+        np.testing.assert_allclose(kinematics.speed[:, 0], [0, 5, 3, 3, 3])
+        np.testing.assert_allclose(kinematics.path_length[:, 0], [0, 5, 8, 11, 14])
+        np.testing.assert_allclose(kinematics.heading[1:, 1], [0, 0, -90, -90])
+        self.assertEqual(kinematics.time_to_target[:, 0].tolist(), [3, 2, 1, 0, NOT_REACHED])
+        self.assertEqual(kinematics.time_to_target[:, 1].tolist(), [NOT_REACHED] * 5)
+        at = kinematics.at(1, 0)
+        self.assertEqual((at.velocity_x, at.velocity_y, at.speed, at.time_to_target), (3, 4, 5, 2))
+        with self.assertRaises(IndexError):
+            kinematics.at(5, 0)
+
+    def test_update(self):
+        self.sim.add_simulation_steps(self.positions[:2])
+        kinematics = self.sim.kinematics()
+        self.assertEqual(kinematics.time_to_target[:, 0].tolist(), [NOT_REACHED] * 2)
+        self.sim.add_simulation_steps(self.positions[2:])
+        self.assertEqual(kinematics.update(), 3)
+        self.assertEqual(kinematics.time_to_target[:, 0].tolist(), [3, 2, 1, 0, NOT_REACHED])
+        np.testing.assert_allclose(kinematics.path_length[:, 0], [0, 5, 8, 11, 14])
+
+    def test_pedestrian_track(self):
+        self.sim.add_simulation_steps(self.positions[:2])
+        track = PedestrianTrack(self.sim, 0, window=2)
+        self.assertEqual(track.at(1).time_to_target, NOT_REACHED)
+        self.sim.add_simulation_steps(self.positions[2:])
+        at = track.at(1)
+        # The arrival at step 3 is beyond the window of steps 1 and 2
+        self.assertEqual((at.velocity_x, at.velocity_y, at.speed, at.path_length, at.time_to_target), (3, 4, 5, 5, None))
+        self.assertEqual(track.at(2).time_to_target, 1)
+        # Step 4 is too far from the known path lengths of a new track
+        self.assertIsNone(PedestrianTrack(self.sim, 0, window=2).at(4).path_length)
+        kinematics = self.sim.kinematics()
+        for column in range(2):
+            track = PedestrianTrack(self.sim, column)
+            for step in (4, 0, 2):
+                self.assertEqual(track.at(step), kinematics.at(step, column))
+        with self.assertRaises(IndexError):
+            track.at(5)
+
+    def test_pedestrian_track_reads_a_window(self):
+        path = 'tests/kinematics_simulation.bin'
+        positions = np.zeros((5000, 2, 2), dtype=int)
+        positions[:, 1, 1] = 9
+        simulation = Simulation(self.sim.topography, self.sim.pedestrians, 5000, [])
+        simulation.add_simulation_steps(positions)
+        simulation.to_binary(path)
+        chunked = Simulation.from_binary(path, chunk_steps=100)
+        try:
+            trajectories = chunked.trajectories
+            trajectories.prefetch = False
+            at = PedestrianTrack(chunked, 0).at(3000)
+            # Pedestrian 0 never reaches the target, but only the chunks around steps 0 and 3000 of 50 are read
+            self.assertLessEqual(trajectories.n_reads, 8)
+            self.assertIsNone(at.time_to_target)
+            self.assertIsNone(at.path_length)
+        finally:
+            chunked.trajectories.close()
+            os.remove(path)
+
+    def test_pedestrian_info(self):
+        self.sim.add_simulation_steps(self.positions[:4])
+        visualizer = Visualizer(self.sim, 1, 1, 10, 10, canvas=RecordingCanvas(Visualizer.N_LAYERS, 10, 10))
+        visualizer.highlighted_pedestrian = 0
+        visualizer.current_step = 1
+        visualizer.update_pedestrian_info()
+        self.assertIn('Speed: 5.00', visualizer.pedestrian_info.value)
+        self.assertIn('Time to target: 2', visualizer.pedestrian_info.value)
+        # Far from the first step, and for a pedestrian that never arrives
+        visualizer.current_step = 3
+        visualizer.highlighted_pedestrian = 1
+        visualizer.update_pedestrian_info()
+        self.assertIn('Path length: 2.00', visualizer.pedestrian_info.value)
+        self.assertIn('Time to target: not reached', visualizer.pedestrian_info.value)
+        # Steps loaded later are added to the same tables
+        kinematics = visualizer.kinematics()
+        self.sim.add_simulation_steps(self.positions[4:])
+        self.assertIs(visualizer.kinematics(), kinematics)
+        self.assertEqual(len(kinematics), 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,44 @@
+import unittest
+import numpy as np
+from src.cms_visualizer.lod import density_counts, density_image, raster_image, cell_image
+
+
+class DensityTest(unittest.TestCase):
+
+    def test_density_counts(self):
+        x = np.array([0, 3, 4, 9, 10, -1])
+        y = np.array([0, 3, 0, 5, 0, 0])
+        counts = density_counts(x, y, 10, 6, 4, 4)
+        self.assertEqual(counts.tolist(), [[2, 1, 0], [0, 0, 1]])
+
+    def test_density_image(self):
+        counts = np.array([[0, 1], [3, 0]])
+        image = density_image(counts, 2, 2, 3, 4, (255, 0, 0))
+        self.assertEqual(image.shape, (4, 3, 4))
+        self.assertEqual(image.dtype, np.uint8)
+        self.assertEqual(image[:, :, 0].min(), 255)
+        self.assertEqual(image[0, 0, 3], 0)
+        self.assertEqual(image[3, 1, 3], 255)
+        self.assertTrue(0 < image[0, 2, 3] < 255)
+
+    def test_density_image_empty(self):
+        image = density_image(np.zeros((2, 2), dtype=np.int64), 1, 1, 2, 2, (0, 0, 255))
+        self.assertEqual(image[:, :, 3].max(), 0)
+
+    def test_raster_image(self):
+        # Cells of 2.5 x 2 pixels
+        image = raster_image(np.array([[0, 4], [1, 0]]), 5, 4, (0, 255, 0))
+        self.assertEqual(image.shape, (4, 5, 4))
+        self.assertEqual(image[:2, :2, 3].max(), 0)
+        self.assertEqual(image[:2, 3:, 3].min(), 255)
+        self.assertTrue(0 < image[3, 0, 3] < 255)
+
+    def test_cell_image(self):
+        values = np.array([[0, 4], [1, 0]])
+        image = cell_image(values, (0, 255, 0))
+        self.assertEqual(image.shape, (2, 2, 4))
+        np.testing.assert_array_equal(image, raster_image(values, 2, 2, (0, 255, 0)))
+
+
+if __name__ == '__main__':
+    unittest.main()
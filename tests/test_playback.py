@@ -0,0 +1,63 @@
+import unittest
+from src.cms_visualizer.playback import PlaybackScheduler
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.callbacks = []
+
+    def __call__(self):
+        return self.now
+
+    def call_later(self, delay, callback):
+        self.callbacks.append((self.now + delay, callback))
+
+    def advance(self, seconds):
+        self.now += seconds
+        due = [callback for time, callback in self.callbacks if time <= self.now]
+        self.callbacks = [(time, callback) for time, callback in self.callbacks if time > self.now]
+        for callback in due:
+            callback()
+
+
+class PlaybackSchedulerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.rendered = []
+        self.render_time = 0.0
+
+        def render(step):
+            self.rendered.append(step)
+            self.clock.now += self.render_time
+
+        self.scheduler = PlaybackScheduler(render, fps=10, clock=self.clock, call_later=self.clock.call_later)
+
+    def test_renders_at_target_rate(self):
+        for step in range(10):
+            self.scheduler.request(step)
+            self.clock.advance(0.1)
+        self.assertEqual(self.rendered, list(range(10)))
+        self.assertEqual(self.scheduler.n_dropped, 0)
+        self.assertAlmostEqual(self.scheduler.achieved_fps, 10)
+
+    def test_coalesces_to_latest_step(self):
+        self.scheduler.request(0)
+        for step in range(1, 5):
+            self.scheduler.request(step)
+        self.assertEqual(self.rendered, [0])
+        self.clock.advance(0.1)
+        self.assertEqual(self.rendered, [0, 4])
+        self.assertEqual(self.scheduler.n_dropped, 3)
+
+    def test_drops_frames_when_behind(self):
+        self.render_time = 0.3
+        for step in range(9):
+            self.scheduler.request(step)
+            self.clock.advance(0.01)
+        self.clock.advance(1)
+        self.assertEqual(self.rendered[0], 0)
+        self.assertEqual(self.rendered[-1], 8)
+        self.assertLess(len(self.rendered), 9)
+        self.assertEqual(self.scheduler.stats()['n_rendered'], len(self.rendered))
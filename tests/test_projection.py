@@ -0,0 +1,174 @@
+import unittest
+import numpy as np
+from benchmarks.recording import RecordingCanvas
+from src.cms_visualizer.trajectory import TrajectoryStore
+from src.cms_visualizer.topography import Topography
+from src.cms_visualizer.geometry import SceneGeometry
+from src.cms_visualizer.projection import ScreenProjection
+from src.cms_visualizer.simulation import Simulation, Pedestrian
+from src.cms_visualizer.visualization import Visualizer
+
+
+class ScreenProjectionTest(unittest.TestCase):
+
+    def setUp(self):
+        self.store = TrajectoryStore([1, 2], capacity=4)
+        self.store.append(np.array([
+            [[0, 0], [4, 2]],
+            [[1, 0], [4, 3]]
+        ]))
+        # 2 pixels per unit along x, 3 along y, one cell per unit
+        geometry = SceneGeometry(Topography(10, 10), 20, 30, 2, 3)
+        self.projection = ScreenProjection(self.store, geometry, np.array([1, 2]))
+
+    def test_points(self):
+        self.assertEqual(self.projection.points.shape, (2, 2, 2))
+        np.testing.assert_array_equal(self.projection.points[1, 1], [8, 9])
+
+    def test_rects(self):
+        x, y, width, height = self.projection.rects(1)
+        np.testing.assert_array_equal(x, [2, 8])
+        np.testing.assert_array_equal(y, [0, 9])
+        # Heights are scaled by the pixels per unit along y, not along x
+        np.testing.assert_array_equal(width, [2, 4])
+        np.testing.assert_array_equal(height, [3, 6])
+        x, y, width, height = self.projection.rects(0, [1])
+        np.testing.assert_array_equal(np.concatenate([x, y, width, height]), [8, 6, 4, 6])
+        with self.assertRaises(IndexError):
+            self.projection.rects(2)
+
+    def test_changes(self):
+        (x, y, width, height), repaint = self.projection.changes(0, 1)
+        # Pedestrian 1 moved away from (0, 0), pedestrian 2 moved down
+        np.testing.assert_array_equal(x, [0, 8])
+        np.testing.assert_array_equal(y, [0, 6])
+        np.testing.assert_array_equal(repaint, [0, 1])
+        (x, _, _, _), repaint = self.projection.changes(1, 1)
+        self.assertEqual((len(x), len(repaint)), (0, 0))
+
+    def test_segments(self):
+        segments = self.projection.segments(0, 1)
+        self.assertEqual(segments.shape, (2, 2, 2))
+        np.testing.assert_array_equal(segments[0], [[1, 1.5], [3, 1.5]])
+
+    def test_segments_of_new_steps(self):
+        self.store.append(np.array([[[2, 0], [4, 4]]]))
+        segments = self.projection.segments(1, 2)
+        np.testing.assert_array_equal(segments[1], [[9, 10.5], [9, 13.5]])
+
+
+class PixelLayer:
+    def __init__(self, width, height):
+        """Canvas layer that rasterizes rectangles into an array of fill styles"""
+        self.image = np.full((height, width), '', dtype=object)
+        self.fill_style = ''
+        self.global_composite_operation = 'source-over'
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return lambda *args, **kwargs: None
+
+    def clear(self):
+        self.image[:] = ''
+
+    def fill_rects(self, x, y, width, height):
+        style = '' if self.global_composite_operation == 'destination-out' else self.fill_style
+        for rect in zip(*np.broadcast_arrays(x, y, width, height)):
+            left, top, w, h = (int(v) for v in rect)
+            self.image[max(top, 0):max(top + h, 0), max(left, 0):max(left + w, 0)] = style
+
+    def fill_rect(self, x, y, width, height):
+        self.fill_rects([x], [y], [width], [height])
+
+
+class PixelCanvas:
+    def __init__(self, n_layers, width, height):
+        self.width = width
+        self.height = height
+        self.layers = [PixelLayer(width, height) for _ in range(n_layers)]
+
+    def __getitem__(self, key):
+        return self.layers[key]
+
+    def on_mouse_down(self, callback):
+        pass
+
+
+class PedestrianChangesTest(unittest.TestCase):
+
+    def test_matches_full_redraw(self):
+        rng = np.random.default_rng(1)
+        n_steps, n_pedestrians = 40, 60
+        pedestrians = [Pedestrian(i, 1 + i % 2, None) for i in range(n_pedestrians)]
+        positions = np.empty((n_steps, n_pedestrians, 2), dtype=np.int64)
+        positions[0] = rng.integers(0, 20, (n_pedestrians, 2))
+        for step in range(1, n_steps):
+            # A few pedestrians move per step, the others queue
+            moving = rng.random(n_pedestrians) < 0.1
+            positions[step] = np.clip(positions[step - 1] + moving[:, None] * rng.integers(-1, 2, (n_pedestrians, 2)), 0, 19)
+        sim = Simulation(Topography(20, 20), pedestrians, n_steps, [])
+        sim.add_simulation_steps(positions)
+        visualizer = Visualizer(sim, 4, 4, 80, 80, canvas=PixelCanvas(Visualizer.N_LAYERS, 80, 80))
+        diffs = []
+        draw_changes = visualizer.draw_pedestrian_changes
+        visualizer.draw_pedestrian_changes = lambda step: diffs.append(draw_changes(step)) or diffs[-1]
+        for step in list(range(n_steps)) + [3, 5, 30, 29]:
+            if step == 20:
+                visualizer.jump_to(19, 7)
+            visualizer.render(step)
+            full = Visualizer(sim, 4, 4, 80, 80, canvas=PixelCanvas(Visualizer.N_LAYERS, 80, 80))
+            full.highlighted_pedestrian = visualizer.highlighted_pedestrian
+            full.render(step)
+            np.testing.assert_array_equal(visualizer.canvas[Visualizer.PEDESTRIAN_LAYER].image,
+                                          full.canvas[Visualizer.PEDESTRIAN_LAYER].image)
+        self.assertGreater(sum(diffs), n_steps - 5)
+
+    def test_unhighlight_in_density_mode(self):
+        sim = Simulation(Topography(20, 20), [Pedestrian(i, 1, None) for i in range(3)], 1, [])
+        sim.add_simulation_steps(np.array([[[1, 1], [5, 5], [9, 9]]]))
+        visualizer = Visualizer(sim, 4, 4, 80, 80, canvas=PixelCanvas(Visualizer.N_LAYERS, 80, 80))
+        visualizer.level_of_detail = 'density'
+        visualizer.render(0)
+        visualizer.set_highlighted_pedestrian(2)
+        # The formerly highlighted pedestrian is not painted as a rectangle over the density raster
+        image = visualizer.canvas[Visualizer.PEDESTRIAN_LAYER].image
+        self.assertEqual(set(image.reshape(-1)), {'', 'yellow'})
+        self.assertEqual(image[36, 36], 'yellow')
+
+    def test_click_after_replacing_the_run(self):
+        sim = Simulation(Topography(20, 20), [Pedestrian(i, 1, None) for i in range(2)], 1, [])
+        sim.add_simulation_steps(np.array([[[1, 1], [9, 9]]]))
+        visualizer = Visualizer(sim, 4, 4, 80, 80, canvas=PixelCanvas(Visualizer.N_LAYERS, 80, 80))
+        visualizer.render(0)
+        visualizer.handle_mouse_down(37, 37)
+        self.assertEqual(visualizer.highlighted_pedestrian, 1)
+        # The pedestrians of another run are hit, not the ones of the run shown before
+        other = Simulation(Topography(20, 20), [Pedestrian(i, 1, None) for i in range(2)], 1, [])
+        other.add_simulation_steps(np.array([[[9, 9], [1, 1]]]))
+        visualizer.simulation = other
+        visualizer.handle_mouse_down(37, 37)
+        self.assertEqual(visualizer.highlighted_pedestrian, 0)
+
+    def test_traffic_grows_with_moving_pedestrians(self):
+        n_pedestrians = 2000
+        positions = np.stack(np.unravel_index(np.arange(n_pedestrians), (50, 40)), axis=1)[:, ::-1]
+        moved = positions.copy()
+        moved[:10, 1] += 1
+        sim = Simulation(Topography(40, 50), [Pedestrian(i, 0.5, None) for i in range(n_pedestrians)], 3, [])
+        sim.add_simulation_steps(np.array([positions, moved, positions]))
+        canvas = RecordingCanvas(Visualizer.N_LAYERS, 160, 200)
+        visualizer = Visualizer(sim, 4, 4, 160, 200, canvas=canvas)
+        visualizer.render(0)
+        full = canvas.n_bytes
+        canvas.reset()
+        visualizer.render(1)
+        self.assertLess(canvas.n_bytes, full / 20)
+        visualizer.diff_max_jump = 0
+        canvas.reset()
+        visualizer.render(2)
+        self.assertGreater(canvas.n_bytes, n_pedestrians * 16)
+
+
+if __name__ == '__main__':
+    unittest.main()
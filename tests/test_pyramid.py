@@ -0,0 +1,114 @@
+import contextlib
+import io
+import os
+import tracemalloc
+import unittest
+import numpy as np
+from benchmarks.recording import RecordingCanvas
+from benchmarks.synthetic import Scenario, simulation
+from src.cms_visualizer.cli import main
+from src.cms_visualizer.playback import PlaybackScheduler
+from src.cms_visualizer.pyramid import TemporalPyramid
+from src.cms_visualizer.simulation import Simulation, Pedestrian
+from src.cms_visualizer.topography import Topography
+from src.cms_visualizer.visualization import Visualizer
+from tests.test_playback import FakeClock
+
+
+class TemporalPyramidTest(unittest.TestCase):
+
+    def setUp(self):
+        self.path = 'tests/pyramid_simulation.bin'
+        self.sim = simulation(Scenario(n_pedestrians=20, n_steps=37, n_obstacles=3, grid_size=20))
+        self.steps = self.sim.trajectories.get_steps(0, 37)
+
+    def tearDown(self):
+        for path in (self.path, TemporalPyramid.path_for(self.path)):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def test_build_matches_brute_force(self):
+        pyramid = TemporalPyramid.build(self.sim, base=3, block_steps=5)
+        self.assertEqual(pyramid.strides, [3, 9, 27])
+        height, width = pyramid.densities[0].shape[1:]
+        for level, stride in enumerate(pyramid.strides):
+            np.testing.assert_array_equal(pyramid.positions[level], self.steps[::stride])
+            for block in range(-(-37 // stride)):
+                positions = self.steps[block * stride:(block + 1) * stride].reshape(-1, 2)
+                expected = np.zeros((height, width))
+                np.add.at(expected, (positions[:, 1].astype(int), positions[:, 0].astype(int)), 1)
+                np.testing.assert_allclose(pyramid.densities[level][block], expected / len(positions) * 20,
+                                           rtol=1e-6)
+
+    def test_memory_budget_drops_finest_levels(self):
+        full = TemporalPyramid.build(self.sim, base=2)
+        budget = full.nbytes
+        tracemalloc.start()
+        try:
+            coarse = TemporalPyramid.build(self.sim, base=2, memory_budget=budget)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        self.assertEqual(coarse.strides, full.strides[-len(coarse.strides):])
+        self.assertLess(len(coarse.strides), len(full.strides))
+        # The budget covers the temporaries of the build, not only the levels
+        self.assertLessEqual(peak, budget)
+
+    def test_level_for(self):
+        pyramid = TemporalPyramid.build(self.sim, base=3)
+        self.assertIsNone(pyramid.level_for(2))
+        self.assertEqual(pyramid.level_for(3), 0)
+        self.assertEqual(pyramid.level_for(10), 1)
+        self.assertEqual(pyramid.level_for(1000), 2)
+        self.assertEqual(pyramid.block(1, 20), (2, 18))
+
+    def test_save_and_load(self):
+        pyramid = self.sim.temporal_pyramid()
+        path = TemporalPyramid.path_for(self.path)
+        pyramid.save(path)
+        loaded = TemporalPyramid.load(path, self.sim)
+        self.assertEqual(loaded.strides, pyramid.strides)
+        for level in range(len(pyramid.strides)):
+            np.testing.assert_array_equal(loaded.positions[level], pyramid.positions[level])
+            np.testing.assert_array_equal(loaded.densities[level], pyramid.densities[level])
+        other = simulation(Scenario(n_pedestrians=20, n_steps=30, n_obstacles=3, grid_size=20))
+        with self.assertRaises(ValueError):
+            TemporalPyramid.load(path, other)
+
+    def test_cli(self):
+        self.sim.to_binary(self.path)
+        with contextlib.redirect_stdout(io.StringIO()):
+            main(['pyramid', self.path])
+        TemporalPyramid.load(TemporalPyramid.path_for(self.path), Simulation.from_binary(self.path))
+
+    def test_sparse(self):
+        sim = Simulation(Topography(10, 10), [Pedestrian(1, 1, None), Pedestrian(2, 1, None)], 8, [], sparse=True)
+        present = np.ones((8, 2), dtype=bool)
+        present[4:, 1] = False
+        sim.add_simulation_steps(np.ones((8, 2, 2)), present=present)
+        pyramid = sim.temporal_pyramid(base=4)
+        self.assertEqual(pyramid.presence[0].tolist(), [[True, True], [True, False]])
+        self.assertEqual(pyramid.densities[0][:, 1, 1].tolist(), [2, 1])
+
+    def test_scrubbing(self):
+        clock = FakeClock()
+        canvas = RecordingCanvas(Visualizer.N_LAYERS, 80, 80)
+        visualizer = Visualizer(self.sim, 4, 4, 80, 80, canvas=canvas)
+        visualizer.playback = PlaybackScheduler(visualizer._render_frame, 10, clock=clock,
+                                                call_later=clock.call_later)
+        visualizer.pyramid = self.sim.temporal_pyramid(base=3)
+        visualizer.update_step({'name': 'value', 'new': 1})
+        self.assertEqual(visualizer._step_drawn, 1)
+        # A large jump is previewed from the pyramid and refined once the slider rests
+        visualizer.update_step({'name': 'value', 'new': 30})
+        visualizer.update_step({'name': 'value', 'new': 12})
+        self.assertIsNone(visualizer._step_drawn)
+        clock.advance(0.1)
+        self.assertIsNone(visualizer._step_drawn)
+        clock.advance(1)
+        self.assertEqual(visualizer._step_drawn, 12)
+        self.assertEqual(visualizer.playback.n_rendered, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
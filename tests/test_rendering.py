@@ -0,0 +1,101 @@
+import unittest
+import contextlib
+import io
+import os
+import struct
+import tempfile
+import zlib
+import numpy as np
+from src.cms_visualizer.simulation import Simulation
+from src.cms_visualizer.rendering import (RenderOptions, FrameRenderer, parse_color, write_png,
+                                          render_frames, draw_segments, read_topography)
+from src.cms_visualizer.cli import main
+
+
+class FrameRendererTest(unittest.TestCase):
+
+    def setUp(self):
+        self.simulation = Simulation.from_json('tests/valid_simulation.json')
+        self.options = RenderOptions(cell_width=2, cell_height=2, canvas_width=400, canvas_height=200,
+                                     show_grid=False, highlighted_pedestrian=1)
+
+    def test_parse_color(self):
+        self.assertEqual(parse_color('#ff0006'), (255, 0, 6))
+        self.assertEqual(parse_color('#fff'), (255, 255, 255))
+        self.assertEqual(parse_color('yellow'), (255, 255, 0))
+        with self.assertRaises(ValueError):
+            parse_color('ff0006')
+
+    def test_render(self):
+        image = FrameRenderer(self.simulation, self.options).render(0)
+        self.assertEqual(image.shape, (200, 400, 3))
+        # pedestrian 1 at (0, 20), highlighted pedestrian 2 at (20, 0), two pixels per unit
+        self.assertEqual(tuple(image[40, 0]), (255, 0, 6))
+        self.assertEqual(tuple(image[0, 40]), (255, 255, 0))
+        # obstacle at (20, 20)
+        self.assertEqual(tuple(image[41, 41]), (0, 0, 0))
+        self.assertEqual(tuple(image[199, 399]), (255, 255, 255))
+
+    def test_render_trajectories(self):
+        self.options.show_trajectories = True
+        renderer = FrameRenderer(self.simulation, self.options)
+        incremental = [renderer.render(step) for step in range(3)]
+        np.testing.assert_array_equal(incremental[2], FrameRenderer(self.simulation, self.options).render(2))
+        np.testing.assert_array_equal(renderer.render(0), incremental[0])
+
+    def test_draw_segments(self):
+        mask = np.zeros((5, 5), dtype=bool)
+        draw_segments(mask, np.array([[0.5, 0.5]]), np.array([[4.5, 0.5]]), True)
+        self.assertEqual(mask[0].tolist(), [True] * 5)
+        self.assertFalse(mask[1:].any())
+
+
+class RenderFramesTest(unittest.TestCase):
+
+    def test_write_png(self):
+        image = np.arange(24, dtype=np.uint8).reshape(2, 4, 3)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'image.png')
+            write_png(path, image)
+            with open(path, 'rb') as f:
+                data = f.read()
+        self.assertEqual(data[:8], b'\x89PNG\r\n\x1a\n')
+        width, height = struct.unpack('>II', data[16:24])
+        self.assertEqual((width, height), (4, 2))
+        idat = data.index(b'IDAT')
+        length = struct.unpack('>I', data[idat - 4:idat])[0]
+        scanlines = np.frombuffer(zlib.decompress(data[idat + 4:idat + 4 + length]), dtype=np.uint8)
+        np.testing.assert_array_equal(scanlines.reshape(2, 13)[:, 1:].reshape(2, 4, 3), image)
+
+    def test_render_frames_in_parallel(self):
+        options = RenderOptions(cell_width=2, cell_height=2, canvas_width=400, canvas_height=200,
+                                show_trajectories=True)
+        with tempfile.TemporaryDirectory() as directory:
+            paths = render_frames('tests/valid_simulation.json', directory, options, jobs=2, chunk_steps=2)
+            self.assertEqual([os.path.basename(path) for path in paths], ['000000.png', '000001.png', '000002.png'])
+            self.assertTrue(all(os.path.exists(path) for path in paths))
+
+    def test_render_binary_frames_in_parallel(self):
+        options = RenderOptions(cell_width=2, cell_height=2, canvas_width=400, canvas_height=200)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'simulation.bin')
+            Simulation.from_json('tests/valid_simulation.json').to_binary(path)
+            paths = render_frames(path, os.path.join(directory, 'frames'), options, jobs=2, chunk_steps=2)
+            self.assertEqual(len(paths), 3)
+            with open(paths[2], 'rb') as f, open(render_frames('tests/valid_simulation.json', directory, options,
+                                                               start=2)[0], 'rb') as expected:
+                self.assertEqual(f.read(), expected.read())
+
+    def test_read_topography(self):
+        expected = Simulation.from_json('tests/valid_simulation.json').topography.to_dict()
+        self.assertEqual(read_topography('tests/valid_simulation.json').to_dict(), expected)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'simulation.bin')
+            Simulation.from_json('tests/valid_simulation.json').to_binary(path)
+            self.assertEqual(read_topography(path).to_dict(), expected)
+
+    def test_cli(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with contextlib.redirect_stdout(io.StringIO()):
+                main(['render', 'tests/valid_simulation.json', '--out', directory, '--jobs', '1', '--start', '1'])
+            self.assertEqual(sorted(os.listdir(directory)), ['000001.png', '000002.png'])
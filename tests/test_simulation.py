@@ -1,5 +1,6 @@
 import unittest
 import os
+import numpy as np
 from src.cms_visualizer.topography import (
     Topography, RectangularSource, RectangularTarget, RectangularObstacle)
 from src.cms_visualizer.simulation import (Simulation, Pedestrian, Position, InvalidSimulationStepException,
@@ -34,6 +35,20 @@ class SimulationTest(unittest.TestCase):
         self.assertEqual(len(self.simulation.simulation_steps), 1)
         self.assertFalse(self.simulation.is_simulation_complete())
 
+    def test_simulation_step_view(self):
+        self.simulation.add_simulation_step(
+            {12: Position(5, 5), 11: Position(3, 3)}
+        )
+        step = self.simulation.simulation_steps[0]
+        self.assertEqual(step[11], Position(3, 3))
+        self.assertEqual(step[12], Position(5, 5))
+        self.assertEqual(list(step.values()), [Position(3, 3), Position(5, 5)])
+        self.assertEqual(step, {11: Position(3, 3), 12: Position(5, 5)})
+        self.assertNotIn(13, step)
+        with self.assertRaises(TypeError):
+            step[11] = Position(0, 0)
+        self.assertEqual(self.simulation.trajectories.positions.shape, (3, 2, 2))
+
     def test_invalid_simulation_step(self):
         with self.assertRaises(InvalidSimulationStepException):
             self.simulation.add_simulation_step(
@@ -45,6 +60,57 @@ class SimulationTest(unittest.TestCase):
                 {12: Position(0, 81)}
             )
 
+    def test_adding_simulation_steps(self):
+        self.simulation.add_simulation_steps(np.array([
+            [[5, 5], [3, 3]],
+            [[6, 6], [4, 4]]
+        ]), ids=[12, 11])
+        self.assertEqual(len(self.simulation.simulation_steps), 2)
+        self.assertEqual(self.simulation.simulation_steps[1][11], Position(4, 4))
+
+        with self.assertRaises(CannotAddSimulationStepException):
+            self.simulation.add_simulation_steps(np.zeros((2, 2, 2)))
+
+    def test_invalid_simulation_steps(self):
+        with self.assertRaises(InvalidSimulationStepException) as context:
+            self.simulation.add_simulation_steps(np.array([
+                [[-1, 0], [3, 3]],
+                [[5, 5], [0, 100]],
+                [[1, 1], [2, 2]]
+            ]))
+        self.assertEqual(context.exception.violations.tolist(), [[0, 11], [1, 12]])
+        self.assertEqual(len(self.simulation.simulation_steps), 0)
+
+        with self.assertRaises(InvalidSimulationStepException) as context:
+            self.simulation.add_simulation_steps(np.array([[[5, 5]], [[6, 6]]]), ids=[12])
+        self.assertEqual(context.exception.violations.tolist(), [[0, 11], [1, 11]])
+
+    def test_nan_simulation_step(self):
+        with self.assertRaises(InvalidSimulationStepException) as context:
+            self.simulation.add_simulation_step({11: Position(float('nan'), 3), 12: Position(5, 5)})
+        self.assertEqual(context.exception.violations.tolist(), [[0, 11]])
+        with self.assertRaises(InvalidSimulationStepException):
+            self.simulation.add_simulation_steps(np.array([[[5, 5], [3, np.nan]]]))
+        self.assertEqual(len(self.simulation.simulation_steps), 0)
+
+    def test_unknown_pedestrian_ids(self):
+        # Positions of ids that are not pedestrians of the simulation are ignored
+        self.simulation.add_simulation_step({11: Position(3, 3), 12: Position(5, 5), 99: Position(500, 500)})
+        self.assertEqual(self.simulation.simulation_steps[0], {11: Position(3, 3), 12: Position(5, 5)})
+        self.assertFalse(self.simulation._is_valid_simulation_step({11: Position(3, 3), 99: Position(5, 5)}))
+        with self.assertRaises(InvalidSimulationStepException) as context:
+            self.simulation.add_simulation_steps(np.array([[[5, 5], [3, 3]]]), ids=[11, 99])
+        self.assertEqual(context.exception.violations.tolist(), [[1, 12]])
+        self.assertEqual(len(self.simulation.simulation_steps), 1)
+
+    def test_duplicate_pedestrian_ids(self):
+        with self.assertRaises(InvalidSimulationStepException) as context:
+            self.simulation.add_simulation_steps(np.array([[[5, 5], [3, 3], [4, 4]], [[5, 5], [300, 3], [4, 4]]]),
+                                                 ids=[11, 12, 11])
+        # The duplicated pedestrian at every step, together with all other offending pairs
+        self.assertEqual(context.exception.violations.tolist(), [[0, 11], [1, 11], [1, 12]])
+        self.assertEqual(len(self.simulation.simulation_steps), 0)
+
     def test_complete_simulation(self):
         self.simulation.add_simulation_step(
             {11: Position(4, 3), 12: Position(6, 5)}
@@ -82,7 +148,30 @@ class SimulationJsonTest(unittest.TestCase):
         r_simulation = Simulation.from_json('tests/simulation.json')
 
         self.assertEqual(simulation.pedestrians, r_simulation.pedestrians)
+        self.assertEqual(list(simulation.simulation_steps), list(r_simulation.simulation_steps))
 
     @classmethod
     def tearDownClass(cls) -> None:
         os.remove("tests/simulation.json")
+
+
+class SimulationBinaryTest(unittest.TestCase):
+    def test_write_and_read_binary(self):
+        simulation = Simulation.from_json('tests/valid_simulation.json')
+        simulation.to_binary('tests/simulation.bin')
+
+        r_simulation = Simulation.from_binary('tests/simulation.bin')
+
+        self.assertEqual(simulation.pedestrians, r_simulation.pedestrians)
+        self.assertEqual(r_simulation.topography.to_dict(), simulation.topography.to_dict())
+        self.assertEqual(list(simulation.simulation_steps), list(r_simulation.simulation_steps))
+        self.assertTrue(r_simulation.is_simulation_complete())
+        self.assertIsInstance(r_simulation.trajectories.positions, np.memmap)
+
+    def test_read_invalid_binary(self):
+        with self.assertRaises(SimulationReconstructionException):
+            Simulation.from_binary('tests/valid_simulation.json')
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        os.remove("tests/simulation.bin")
@@ -0,0 +1,148 @@
+import os
+import unittest
+import numpy as np
+from src.cms_visualizer.analysis import find_violations
+from src.cms_visualizer.chunked import ChunkedTrajectorySource
+from src.cms_visualizer.rendering import FrameRenderer, RenderOptions
+from src.cms_visualizer.simulation import Simulation, Pedestrian, InvalidSimulationStepException
+from src.cms_visualizer.geometry import SceneGeometry
+from src.cms_visualizer.projection import ScreenProjection
+from src.cms_visualizer.sparse import SparseTrajectoryStore
+from src.cms_visualizer.topography import Topography, RectangularTarget
+from src.cms_visualizer.trajectory import TrajectoryStore
+
+
+class SparseTrajectoryStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.positions = np.arange(4 * 10 * 2, dtype=np.int32).reshape(4, 10, 2)
+        self.present = np.zeros((4, 10), dtype=bool)
+        self.present[1:3, 2] = True
+        self.present[:, 9] = True
+        self.present[3, 0] = True
+
+    def test_append(self):
+        store = SparseTrajectoryStore(range(10))
+        store.append(self.positions[:2], self.present[:2])
+        store.append(self.positions[2:], self.present[2:])
+        self.assertEqual(len(store), 4)
+        self.assertEqual(store.n_entries, int(self.present.sum()))
+        np.testing.assert_array_equal(store.presence(0, 4), self.present)
+        np.testing.assert_array_equal(store.get_steps(1, 4), np.where(self.present[1:, :, None], self.positions[1:], 0))
+        self.assertEqual(store.lifetimes[[0, 1, 2, 9]].tolist(), [[3, 4], [-1, -1], [1, 3], [0, 4]])
+
+    def test_from_arrays(self):
+        store = SparseTrajectoryStore(range(10))
+        store.append(self.positions, self.present)
+        copy = SparseTrajectoryStore.from_arrays(range(10), store.mask[:4], store.offsets[:5],
+                                                 store.positions[:store.n_entries])
+        np.testing.assert_array_equal(copy.get_steps(0, 4), store.get_steps(0, 4))
+        np.testing.assert_array_equal(copy.lifetimes, store.lifetimes)
+        with self.assertRaises(ValueError):
+            SparseTrajectoryStore.from_arrays(range(10), store.mask[:4], store.offsets[:4], store.positions)
+
+    def test_nbytes(self):
+        dense = TrajectoryStore(range(1000), 100)
+        sparse = SparseTrajectoryStore(range(1000), 100)
+        positions = np.zeros((100, 1000, 2), dtype=np.int32)
+        present = np.zeros((100, 1000), dtype=bool)
+        present[:, :50] = True
+        dense.append(positions)
+        sparse.append(positions, present)
+        self.assertLess(sparse.nbytes, dense.positions[:100].nbytes / 5)
+
+    def test_segments_break_at_absent_steps(self):
+        store = SparseTrajectoryStore([1, 2])
+        store.append(np.array([[[0, 0], [1, 1]], [[0, 0], [2, 2]], [[9, 9], [3, 3]]]),
+                     np.array([[True, True], [False, True], [True, True]]))
+        projection = ScreenProjection(store, SceneGeometry(Topography(10, 10), 10, 10, 1, 1), np.ones(2))
+        segments = projection.segments(0, 2)
+        # Pedestrian 1 leaves and comes back far away, which must not be connected
+        self.assertEqual(segments.shape, (2, 2, 2))
+        np.testing.assert_array_equal(segments[:, :, 0], [[1.5, 2.5], [2.5, 3.5]])
+
+
+class SparseSimulationTest(unittest.TestCase):
+
+    def setUp(self):
+        self.path = 'tests/sparse_simulation'
+        topography = Topography(10, 10).with_targets([RectangularTarget(3, 7, 0, 2, 2)])
+        pedestrians = [Pedestrian(1, 1, None), Pedestrian(2, 1, None), Pedestrian(4, 1, None)]
+        self.sim = Simulation(topography, pedestrians, 3, [], sparse=True)
+        self.positions = np.array([
+            [[0, 0], [0, 0], [5, 5]],
+            [[1, 0], [5, 5], [2, 5]],
+            [[2, 0], [8, 1], [0, 0]],
+        ])
+        self.present = np.array([[True, False, True], [True, True, True], [True, True, False]])
+        self.sim.add_simulation_steps(self.positions, present=self.present)
+
+    def tearDown(self):
+        for extension in ('.json', '.bin'):
+            if os.path.exists(self.path + extension):
+                os.remove(self.path + extension)
+
+    def test_steps(self):
+        step = self.sim.simulation_steps[0]
+        self.assertEqual(len(step), 2)
+        self.assertEqual(sorted(step), [1, 4])
+        self.assertNotIn(2, step)
+        with self.assertRaises(KeyError):
+            step[2]
+        position = self.sim.simulation_steps[2][2]
+        self.assertEqual((position.x, position.y), (8, 1))
+
+    def test_dense_rejects_absent(self):
+        dense = Simulation(self.sim.topography, self.sim.pedestrians, 3, [])
+        with self.assertRaises(InvalidSimulationStepException):
+            dense.add_simulation_steps(self.positions, present=self.present)
+        # Positions of absent pedestrians are not validated
+        sparse = Simulation(self.sim.topography, self.sim.pedestrians, 3, [], sparse=True)
+        positions = self.positions.copy()
+        positions[0, 1] = -100
+        sparse.add_simulation_steps(positions, present=self.present)
+        self.assertTrue(sparse.is_simulation_complete())
+
+    def test_json(self):
+        self.sim.to_json(self.path + '.json')
+        loaded = Simulation.from_json(self.path + '.json')
+        self.assertTrue(loaded.trajectories.sparse)
+        np.testing.assert_array_equal(loaded.trajectories.presence(0, 3), self.present)
+        np.testing.assert_array_equal(loaded.trajectories.get_steps(0, 3), self.sim.trajectories.get_steps(0, 3))
+
+    def test_binary(self):
+        self.sim.to_binary(self.path + '.bin')
+        for chunk_steps in (None, 2):
+            loaded = Simulation.from_binary(self.path + '.bin', chunk_steps=chunk_steps)
+            self.assertTrue(loaded.trajectories.sparse)
+            np.testing.assert_array_equal(loaded.trajectories.presence(0, 3), self.present)
+            np.testing.assert_array_equal(loaded.trajectories.get_steps(0, 3), self.sim.trajectories.get_steps(0, 3))
+            if isinstance(loaded.trajectories, ChunkedTrajectorySource):
+                loaded.trajectories.close()
+        with self.assertRaises(ValueError):
+            self.sim.delta_encoded(2)
+
+    def test_consumers_skip_absent(self):
+        # Pedestrians 1 and 2 would overlap at (0, 0) in the first step
+        self.assertEqual(len(find_violations(self.sim)), 0)
+        kinematics = self.sim.kinematics()
+        np.testing.assert_allclose(kinematics.speed[:, 1], [0, 0, np.hypot(3, 4)])
+        self.assertEqual(kinematics.time_to_target[:, 1].tolist(), [2, 1, 0])
+        aggregates = self.sim.aggregate()
+        self.assertEqual(aggregates.visits(0, 3)[0, 0], 1)
+
+    def test_render(self):
+        options = RenderOptions(cell_width=2, cell_height=2, canvas_width=20, canvas_height=20,
+                                show_grid=False, highlighted_pedestrian=1)
+        image = FrameRenderer(self.sim, options).render(0)
+        # Pedestrian 1 is drawn at (0, 0), the absent highlighted pedestrian 2 is not
+        self.assertEqual(tuple(image[0, 0]), (255, 0, 6))
+        # Pedestrian 4 leaves at step 2, so its trajectory ends at step 1
+        options.show_trajectories = True
+        image = FrameRenderer(self.sim, options).render(2)
+        self.assertEqual(tuple(image[11, 7]), (255, 0, 6))
+        self.assertEqual(tuple(image[5, 3]), (255, 255, 255))
+
+
+if __name__ == '__main__':
+    unittest.main()
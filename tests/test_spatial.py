@@ -0,0 +1,29 @@
+import unittest
+import numpy as np
+from src.cms_visualizer.spatial import RectangleGridIndex
+
+
+class RectangleGridIndexTest(unittest.TestCase):
+
+    def test_query(self):
+        x = np.array([0, 10, 10, 95])
+        y = np.array([0, 10, 12, 40])
+        index = RectangleGridIndex(x, y, 5, np.array([5, 5, 5, 10]))
+        self.assertEqual(index.query(2, 2).tolist(), [0])
+        self.assertEqual(index.query(12, 14).tolist(), [1, 2])
+        self.assertEqual(index.query(99, 49).tolist(), [3])
+        self.assertEqual(index.query(5, 2).tolist(), [])
+        self.assertEqual(index.query(-50, 500).tolist(), [])
+
+    def test_matches_linear_scan(self):
+        rng = np.random.default_rng(0)
+        x, y = rng.integers(0, 200, (2, 500)) * 2
+        width = rng.integers(1, 4, 500) * 2
+        index = RectangleGridIndex(x, y, width, width)
+        for qx, qy in rng.uniform(0, 400, (200, 2)):
+            expected = np.nonzero((x < qx) & (qx < x + width) & (y < qy) & (qy < y + width))[0]
+            self.assertEqual(index.query(qx, qy).tolist(), expected.tolist())
+
+    def test_empty(self):
+        index = RectangleGridIndex(np.empty(0), np.empty(0), np.empty(0), np.empty(0))
+        self.assertEqual(len(index.query(1, 1)), 0)
@@ -0,0 +1,101 @@
+import unittest
+import io
+import json
+import os
+from src.cms_visualizer.simulation import Simulation, SimulationReconstructionException
+from src.cms_visualizer.streaming import JsonObjectStream, SimulationJsonLoader
+
+
+class JsonObjectStreamTest(unittest.TestCase):
+
+    def test_members(self):
+        text = '{"a": 12345, "b": {"c": [1, 2]}, "steps": [{"x": 1}, {"x": 2}, {"x": 3}], "d": "e"}'
+        for chunk_size in (1, 3, 7, 1024):
+            stream = JsonObjectStream(io.StringIO(text), ('steps',), chunk_size)
+            members = []
+            for key, value in stream.members():
+                members.append((key, list(value) if key == 'steps' else value))
+            self.assertEqual(dict(members), json.loads(text))
+
+    def test_skip_unconsumed_array(self):
+        stream = JsonObjectStream(io.StringIO('{"steps": [1, 2, 3], "a": 1}'), ('steps',), 2)
+        self.assertEqual([key for key, _ in stream.members()], ['steps', 'a'])
+
+    def test_invalid_json(self):
+        with self.assertRaises(json.JSONDecodeError):
+            list(JsonObjectStream(io.StringIO('{"a": [1, 2'), (), 4).members())
+
+
+class SimulationJsonLoaderTest(unittest.TestCase):
+
+    def test_load(self):
+        simulation = SimulationJsonLoader('tests/valid_simulation.json', chunk_size=16).load()
+        self.assertEqual(len(simulation.simulation_steps), 3)
+        self.assertEqual(simulation.simulation_steps[2][2].x, 22)
+        self.assertTrue(simulation.is_simulation_complete())
+
+    def test_steps_before_header(self):
+        with open('tests/valid_simulation.json') as f:
+            data = json.load(f)
+        with open('tests/reordered_simulation.json', 'w') as f:
+            json.dump({key: data[key] for key in reversed(list(data))}, f)
+        simulation = Simulation.from_json('tests/reordered_simulation.json')
+        self.assertEqual(len(simulation.simulation_steps), 3)
+
+    def test_read_header(self):
+        with open('tests/valid_simulation.json') as f:
+            data = json.load(f)
+        header = {key: value for key, value in data.items() if key != 'simulation_steps'}
+        # The steps are not parsed, so a truncated file still has a readable header
+        with open('tests/reordered_simulation.json', 'w') as f:
+            f.write(json.dumps(header)[:-1] + ', "simulation_steps": [{"pedestrian_positions": [')
+        self.assertEqual(SimulationJsonLoader('tests/reordered_simulation.json').read_header(), header)
+        with open('tests/reordered_simulation.json', 'w') as f:
+            json.dump({key: data[key] for key in reversed(list(data))}, f)
+        self.assertEqual(SimulationJsonLoader('tests/reordered_simulation.json').read_header(), header)
+
+    def test_missing_n_steps(self):
+        with self.assertRaises(SimulationReconstructionException):
+            SimulationJsonLoader('tests/invalid_simulation.json').load()
+
+    def test_malformed_position(self):
+        with open('tests/valid_simulation.json') as f:
+            data = json.load(f)
+        for position in ([1], [1, 2, 3], [[1, 2]]):
+            data['simulation_steps'][1]['pedestrian_positions'][0]['position'] = position
+            with open('tests/reordered_simulation.json', 'w') as f:
+                json.dump(data, f)
+            with self.assertRaises(SimulationReconstructionException):
+                Simulation.from_json('tests/reordered_simulation.json')
+
+    def test_sparse_after_steps(self):
+        with open('tests/valid_simulation.json') as f:
+            data = json.load(f)
+        steps = data.pop('simulation_steps')
+        # The flag comes too late for the steps already streamed into a dense simulation
+        with open('tests/reordered_simulation.json', 'w') as f:
+            json.dump(dict(data, simulation_steps=steps, sparse=True), f)
+        with self.assertRaises(SimulationReconstructionException):
+            Simulation.from_json('tests/reordered_simulation.json')
+        with open('tests/reordered_simulation.json', 'w') as f:
+            json.dump(dict(data, simulation_steps=steps, sparse=False), f)
+        self.assertFalse(Simulation.from_json('tests/reordered_simulation.json').trajectories.sparse)
+        # With the whole header after the steps, the steps are buffered until the flag is known
+        with open('tests/reordered_simulation.json', 'w') as f:
+            json.dump(dict({'simulation_steps': steps}, sparse=True, **data), f)
+        self.assertTrue(Simulation.from_json('tests/reordered_simulation.json').trajectories.sparse)
+
+    def test_background_load(self):
+        loader = SimulationJsonLoader('tests/valid_simulation.json', chunk_size=16, progress_interval=1)
+        progress = []
+        loader.add_progress_callback(progress.append)
+        simulation = loader.start(preview_steps=1)
+        self.assertGreaterEqual(len(simulation.simulation_steps), 1)
+        self.assertIs(loader.join(), simulation)
+        self.assertTrue(loader.done)
+        self.assertEqual(progress[-1], 3)
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        if os.path.exists('tests/reordered_simulation.json'):
+            os.remove('tests/reordered_simulation.json')
@@ -1,5 +1,7 @@
 import unittest
+import copy
 import json
+import numpy as np
 from src.cms_visualizer.topography import (Topography, RectangularSource, RectangularTarget, RectangularObstacle,
                                            InvalidTopographyObjectException, DuplicateTopographyObjectIdException, TopographyReconstructionException,
                                            UndefinedTopographyObjectType)
@@ -117,3 +119,127 @@ class TopographyTest(unittest.TestCase):
         topography_dict = topography.to_dict()
         self.assertEqual(topography_dict['width'], 200)
         self.assertEqual(topography_dict['sources'][0]['type'], 'RECTANGULAR')
+
+    def test_label_raster(self):
+        topography = (
+            Topography(width=10, height=8)
+            .with_sources([RectangularSource(1, 0, 0, 3, 2)])
+            .with_targets([RectangularTarget(2, 7, 5, 2, 2)])
+            .with_obstacles([RectangularObstacle(3, 2, 1, 2, 3)])
+        )
+        labels = topography.label_raster()
+        self.assertEqual(labels.shape, (8, 10))
+        self.assertEqual(labels[0, 0], 1)
+        # The obstacle wins where it overlaps the source
+        self.assertEqual(labels[1, 2], 3)
+        self.assertEqual(labels[6, 8], 2)
+        self.assertEqual(labels[7, 9], -1)
+        self.assertIs(topography.label_raster(), labels)
+
+    def test_label_raster_overlapping(self):
+        rng = np.random.default_rng(0)
+        columns = {}
+        for name, n, first_id in (('sources', 5, 100), ('targets', 5, 200), ('obstacles', 40, 300)):
+            columns[name] = {'id': np.arange(first_id, first_id + n), 'x': rng.uniform(0, 24, n).round(1),
+                             'y': rng.uniform(0, 14, n).round(1), 'width': rng.integers(1, 6, n),
+                             'height': rng.integers(1, 6, n)}
+        topography = Topography.from_arrays(width=30, height=20, **columns)
+        # Objects painted one after the other, later ones winning
+        expected = np.full((20, 30), -1)
+        for name in ('sources', 'targets', 'obstacles'):
+            for obj in getattr(topography, name):
+                expected[int(np.floor(obj.y)):int(np.ceil(obj.y + obj.height)),
+                         int(np.floor(obj.x)):int(np.ceil(obj.x + obj.width))] = obj.id
+        np.testing.assert_array_equal(topography.label_raster(), expected)
+        np.testing.assert_array_equal(topography.blocked_raster(), expected >= 300)
+
+    def test_lookup(self):
+        topography = (
+            Topography(width=10, height=8)
+            .with_targets([RectangularTarget(2, 7, 5, 2, 2)])
+            .with_obstacles([RectangularObstacle(3, 2, 1, 2, 3)])
+        )
+        xs = [0, 2.5, 3.99, 4, 8, -1, 10]
+        ys = [0, 1, 3.5, 3, 6, 0, 0]
+        self.assertEqual(topography.lookup(xs, ys).tolist(), [-1, 3, 3, -1, 2, -1, -1])
+        self.assertEqual(topography.is_blocked(xs, ys).tolist(), [False, True, True, False, False, False, False])
+        topography.with_obstacles([RectangularObstacle(4, 0, 0, 1, 1)])
+        self.assertEqual(topography.lookup([0], [0]).tolist(), [4])
+        self.assertTrue(topography.is_blocked(0, 0))
+
+    def test_topography_creation_from_arrays(self):
+        topography = Topography.from_arrays(
+            width=100, height=100,
+            sources={'id': [1], 'x': [5], 'y': [5], 'width': [1], 'height': [1]},
+            obstacles={'id': np.arange(10, 20), 'x': np.arange(10), 'y': np.arange(10),
+                       'width': np.ones(10), 'height': np.full(10, 2)})
+        self.assertEqual(len(topography.sources), 1)
+        self.assertEqual(len(topography.targets), 0)
+        self.assertEqual(len(topography.obstacles), 10)
+        self.assertEqual(topography.object_ids, {1} | set(range(10, 20)))
+        obstacle = topography.obstacles[-1]
+        self.assertIsInstance(obstacle, RectangularObstacle)
+        self.assertEqual((obstacle.id, obstacle.x, obstacle.y, obstacle.height), (19, 9, 9, 2))
+        self.assertIs(topography.obstacles[-1], obstacle)
+        self.assertEqual(Topography.from_dict(topography.to_dict()).to_dict(), topography.to_dict())
+
+    def test_topography_creation_from_arrays_invalid(self):
+        columns = {'id': [1, 2, 1], 'x': [5, 6, 7], 'y': [5, 5, 5], 'width': [1, 1, 1], 'height': [1, 1, 1]}
+        with self.assertRaises(DuplicateTopographyObjectIdException):
+            Topography.from_arrays(100, 100, obstacles=columns)
+        with self.assertRaises(DuplicateTopographyObjectIdException):
+            Topography.from_arrays(100, 100, sources={**columns, 'id': [1, 2, 3]},
+                                   targets={**columns, 'id': [4, 5, 3]})
+        with self.assertRaises(InvalidTopographyObjectException):
+            Topography.from_arrays(100, 100, obstacles={**columns, 'id': [1, 2, 3], 'x': [5, 99, 7]})
+        topography = Topography(width=100, height=100).with_sources([RectangularSource(1, 5, 5, 1, 1)])
+        with self.assertRaises(InvalidTopographyObjectException):
+            topography.with_targets([RectangularTarget(2, 5, 5, 1, 1), RectangularTarget(3, 5, 5, 0, 1)])
+        # Nothing of a rejected batch is added
+        self.assertEqual(len(topography.targets), 0)
+
+    def test_topography_objects_added_one_at_a_time(self):
+        topography = Topography.from_arrays(100, 100, obstacles={'id': [1, 2], 'x': [1, 2], 'y': [1, 1],
+                                                                  'width': [1, 1], 'height': [1, 1]})
+        for i in range(3, 40):
+            topography.with_obstacles([RectangularObstacle(i, i, 1, 1, 1)])
+        self.assertEqual(len(topography.obstacles), 39)
+        self.assertEqual(topography.obstacles.columns()['x'].tolist(), list(range(1, 40)))
+        self.assertEqual(topography.obstacles[-1].x, 39)
+        with self.assertRaises(DuplicateTopographyObjectIdException):
+            topography.with_sources([RectangularSource(17, 5, 5, 1, 1)])
+        # Ids of a rejected batch stay free
+        with self.assertRaises(InvalidTopographyObjectException):
+            topography.with_targets([RectangularTarget(40, 5, 5, 1, 1), RectangularTarget(41, 5, 5, 0, 1)])
+        topography.with_targets([RectangularTarget(40, 5, 5, 1, 1)])
+        self.assertEqual(topography.object_ids, set(range(1, 41)))
+
+    def test_topography_objects_edited_in_place(self):
+        source = RectangularSource(1, 5, 5, 1, 1)
+        topography = Topography(width=100, height=100).with_sources([source])
+        self.assertIs(topography.sources[0], source)
+        source.x = 7
+        self.assertEqual(topography.to_dict()['sources'][0]['x'], 7)
+
+    def test_topography_rasters_follow_edited_objects(self):
+        topography = Topography.from_arrays(20, 10, obstacles={'id': [1, 2], 'x': [1, 5], 'y': [1, 1],
+                                                                'width': [1, 1], 'height': [1, 1]})
+        obstacles = list(topography.obstacles)
+        self.assertTrue(topography.is_blocked(5, 1))
+        # Only the edited object is copied into the columns
+        obstacles[1].x = 9
+        self.assertEqual(topography.obstacles._dirty, {1})
+        self.assertFalse(topography.is_blocked(5, 1))
+        self.assertTrue(topography.is_blocked(9, 1))
+        self.assertEqual(topography.lookup(9, 1), 2)
+        self.assertEqual(topography.obstacles._dirty, set())
+        # Rasters are kept while nothing changes
+        labels = topography.label_raster()
+        self.assertIs(topography.label_raster(), labels)
+        # Copies do not belong to the topography
+        copy.copy(obstacles[0]).x = 15
+        self.assertIs(topography.label_raster(), labels)
+        copied = copy.deepcopy(topography)
+        copied.obstacles[0].x = 15
+        self.assertTrue(copied.is_blocked(15, 1))
+        self.assertFalse(topography.is_blocked(15, 1))
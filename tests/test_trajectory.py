@@ -0,0 +1,46 @@
+import unittest
+import numpy as np
+from src.cms_visualizer.trajectory import TrajectoryStore
+
+
+class TrajectoryStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.store = TrajectoryStore([11, 12, 13], capacity=2, dtype=np.int16)
+
+    def test_store_creation(self):
+        self.assertEqual(len(self.store), 0)
+        self.assertEqual(self.store.n_pedestrians, 3)
+        self.assertEqual(self.store.positions.dtype, np.int16)
+
+    def test_append_and_grow(self):
+        block = np.arange(18).reshape(3, 3, 2)
+        self.store.append(block)
+        self.assertEqual(len(self.store), 3)
+        np.testing.assert_array_equal(self.store.get_steps(0, 3), block)
+        np.testing.assert_array_equal(self.store.get_step(2), block[2])
+        with self.assertRaises(IndexError):
+            self.store.get_step(3)
+
+    def test_fractional_positions(self):
+        self.store.append(np.array([[[1, 2], [3, 4], [5, 6]]]))
+        self.store.append(np.array([[[1.5, 2], [3, 4], [5, 6]]]))
+        self.assertEqual(self.store.positions.dtype, np.float64)
+        self.assertEqual(self.store.get_step(0).tolist(), [[1, 2], [3, 4], [5, 6]])
+        self.assertEqual(self.store.get_step(1)[0, 0], 1.5)
+
+    def test_columns(self):
+        self.assertEqual(self.store.column_of(12), 1)
+        np.testing.assert_array_equal(self.store.columns_of([13, 99, 11]), [2, -1, 0])
+
+    def test_duplicate_ids(self):
+        with self.assertRaises(ValueError):
+            TrajectoryStore([1, 1])
+
+    def test_from_array(self):
+        positions = np.zeros((4, 2, 2), dtype=np.int32)
+        store = TrajectoryStore.from_array([1, 2], positions)
+        self.assertEqual(len(store), 4)
+        self.assertIs(store.positions, positions)
+        with self.assertRaises(ValueError):
+            TrajectoryStore.from_array([1, 2, 3], positions)